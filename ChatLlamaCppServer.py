@@ -1,18 +1,41 @@
+import json
+import asyncio
+import threading
+import weakref
+from operator import itemgetter
 from typing import (
+    AsyncIterator,
+    Dict,
+    Iterator,
     List,
     Optional,
     Any,
+    Tuple,
+    Type,
+    Union,
 )
-import requests
-from pydantic import Field
-from langchain_core.outputs import ChatGeneration, ChatResult
-from langchain_core.callbacks import CallbackManagerForLLMRun
+import httpx
+from pydantic import BaseModel, Field
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.callbacks import CallbackManagerForLLMRun, AsyncCallbackManagerForLLMRun
 from langchain_core.messages import (
     AIMessage,
+    AIMessageChunk,
     BaseMessage,
     convert_to_openai_messages
 )
+from langchain_core.language_models import LanguageModelInput
 from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.output_parsers import JsonOutputParser, PydanticOutputParser
+from langchain_core.runnables import Runnable, RunnableMap, RunnablePassthrough
+from langchain_core.utils.function_calling import convert_to_json_schema
+from llm_telemetry import count_attempts, acount_attempts
+
+# Connection pools shared by every instance (and copy) of the model with the same settings.
+# Async clients are bound to the event loop they were created in.
+_clients: Dict[Tuple, httpx.Client] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
 
 class ChatLlamaCppServer(BaseChatModel):
     """
@@ -29,19 +52,60 @@ class ChatLlamaCppServer(BaseChatModel):
     """The number of characters from the last message of the prompt to be echoed."""
     temperature: Optional[float] = None
     max_tokens: Optional[int] = None
-    timeout: Optional[int] = None
+    timeout: Optional[float] = None
+    """Timeout of a request in seconds, None to wait indefinitely"""
+    connect_timeout: Optional[float] = 10.0
+    """Timeout to connect to the server in seconds"""
+    max_connections: int = 16
+    """Maximum number of connections to the server, i.e., of requests in flight"""
+    max_keepalive_connections: int = 16
+    """Maximum number of idle connections kept open between requests"""
     stop: Optional[List[str]] = None
     max_retries: int = 2
     logprobs: Optional[bool] = False
     top_logprobs: Optional[int] = None
+    cache_prompt: Optional[bool] = None
+    """Whether the server reuses the KV cache of the longest common prompt prefix"""
+    id_slot: Optional[int] = None
+    """Slot of the server that processes the requests (see llama-server -np), any free slot if None"""
     
-    def _generate(
-        self,
-        messages: List[BaseMessage],
-        stop: Optional[List[str]] = None,
-        run_manager: Optional[CallbackManagerForLLMRun] = None,
-        **kwargs: Any,
-    ) -> ChatResult:
+    def _client_options(self) -> Tuple:
+        return (self.timeout, self.connect_timeout, self.max_connections, self.max_keepalive_connections, self.max_retries)
+    
+    def _transport_kwargs(self) -> Dict[str, Any]:
+        # Connection errors are retried by the transport (counted by the request hooks of the
+        # clients in the telemetry records); HTTP errors are raised
+        return {
+            "retries": self.max_retries,
+            "limits": httpx.Limits(max_connections=self.max_connections,
+                                   max_keepalive_connections=self.max_keepalive_connections),
+        }
+    
+    @property
+    def client(self) -> httpx.Client:
+        """Pooled keep-alive client of the server"""
+        key = self._client_options()
+        with _clients_lock:
+            if key not in _clients:
+                _clients[key] = httpx.Client(transport=httpx.HTTPTransport(**self._transport_kwargs()),
+                                             timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                                             event_hooks={"request": [count_attempts]})
+            return _clients[key]
+    
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """Pooled keep-alive client of the server for the running event loop"""
+        key = self._client_options()
+        loop = asyncio.get_running_loop()
+        with _clients_lock:
+            clients = _async_clients.setdefault(loop, {})
+            if key not in clients:
+                clients[key] = httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(**self._transport_kwargs()),
+                                                 timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                                                 event_hooks={"request": [acount_attempts]})
+            return clients[key]
+    
+    def _payload(self, messages: List[BaseMessage], **kwargs: Any) -> Dict[str, Any]:
         payload = {
             "model":      self.model_name,
             "messages":   convert_to_openai_messages(messages),
@@ -50,22 +114,173 @@ class ChatLlamaCppServer(BaseChatModel):
             "logprobs":  kwargs.get('logprobs', self.logprobs),
             "top_logprobs": kwargs.get("top_logprobs", self.top_logprobs)
         }
-        resp = requests.post(self.server_url, json=payload, timeout=self.timeout)
-        resp.raise_for_status()
-        data = resp.json()
-        
-        data["usage"]["input_tokens"] = data["usage"]["prompt_tokens"]
-        data["usage"]["output_tokens"] = data["usage"]["completion_tokens"]
+        if self.cache_prompt is not None:
+            payload["cache_prompt"] = self.cache_prompt
+        # Requests pinned to a slot reuse the prompt prefix cached in that slot
+        id_slot = kwargs.get("id_slot", self.id_slot)
+        if id_slot is not None:
+            payload["id_slot"] = id_slot
+        if kwargs.get("response_format") is not None:
+            payload["response_format"] = kwargs["response_format"]
+        return payload
+    
+    @staticmethod
+    def _usage(data: Dict[str, Any]) -> Dict[str, Any]:
+        usage = data["usage"]
+        usage["input_tokens"] = usage["prompt_tokens"]
+        usage["output_tokens"] = usage["completion_tokens"]
+        # Prompt tokens reused from the KV cache
+        if "timings" in data and "cache_n" in data["timings"]:
+            usage["input_token_details"] = {"cache_read": data["timings"]["cache_n"]}
+        return usage
+    
+    def _result(self, data: Dict[str, Any]) -> ChatResult:
         message = AIMessage(
             content=data["choices"][0]["message"]["content"],
             additional_kwargs={},  # Used to add additional payload to the message
             response_metadata=data["choices"][0],
-            usage_metadata=data["usage"],
+            usage_metadata=self._usage(data),
         )
         generation = ChatGeneration(message=message)
-        print(generation)
         return ChatResult(generations=[generation])
     
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        resp = self.client.post(self.server_url, json=self._payload(messages, **kwargs))
+        resp.raise_for_status()
+        return self._result(resp.json())
+    
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        resp = await self.async_client.post(self.server_url, json=self._payload(messages, **kwargs))
+        resp.raise_for_status()
+        return self._result(resp.json())
+    
+    def _stream_payload(self, messages: List[BaseMessage], **kwargs: Any) -> Dict[str, Any]:
+        payload = self._payload(messages, **kwargs)
+        payload["stream"] = True
+        # The server sends the token usage and timings with the last event
+        payload["stream_options"] = {"include_usage": True}
+        return payload
+    
+    def _chunk(self, line: str) -> Optional[ChatGenerationChunk]:
+        """
+        Parses a server-sent event of the stream into a chunk, None for other lines.
+        """
+        if not line.startswith("data:"):
+            return None
+        event = line[len("data:"):].strip()
+        if event == "[DONE]":
+            return None
+        data = json.loads(event)
+        content, response_metadata = "", {}
+        if data.get("choices"):
+            choice = data["choices"][0]
+            content = (choice.get("delta") or {}).get("content") or ""
+            response_metadata = {key: value for key, value in choice.items()
+                                 if key not in ("delta", "index") and value is not None}
+        message = AIMessageChunk(
+            content=content,
+            response_metadata=response_metadata,
+            usage_metadata=self._usage(data) if data.get("usage") else None,
+        )
+        return ChatGenerationChunk(message=message)
+    
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        with self.client.stream("POST", self.server_url, json=self._stream_payload(messages, **kwargs)) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                chunk = self._chunk(line)
+                if chunk is None:
+                    continue
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+    
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async with self.async_client.stream("POST", self.server_url, json=self._stream_payload(messages, **kwargs)) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                chunk = self._chunk(line)
+                if chunk is None:
+                    continue
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+    
+    def with_structured_output(
+        self,
+        schema: Union[Dict, Type[BaseModel]],
+        *,
+        include_raw: bool = False,
+        **kwargs: Any,
+    ) -> Runnable[LanguageModelInput, Union[Dict, BaseModel]]:
+        """
+        Constrains the generation to the JSON schema of the output, which the server compiles
+        into a grammar, so the model can only emit a valid object and no text around it.
+        Args:
+            schema: Pydantic model or JSON schema of the output
+            include_raw: Whether to return a dict with the raw message ("raw"), the parsed
+                output ("parsed") and the parsing error ("parsing_error")
+        Returns:
+            Runnable that returns the parsed output, an instance of the Pydantic model or a dict
+        """
+        is_pydantic = isinstance(schema, type) and issubclass(schema, BaseModel)
+        json_schema = convert_to_json_schema(schema)
+        llm = self.bind(
+            response_format={"type": "json_schema",
+                             "json_schema": {"name": json_schema.get("title", "output"), "schema": json_schema}},
+            ls_structured_output_format={"kwargs": {"method": "json_schema"}, "schema": json_schema},
+        )
+        output_parser = PydanticOutputParser(pydantic_object=schema) if is_pydantic else JsonOutputParser()
+        if not include_raw:
+            return llm | output_parser
+        parser_assign = RunnablePassthrough.assign(
+            parsed=itemgetter("raw") | output_parser, parsing_error=lambda _: None)
+        parser_none = RunnablePassthrough.assign(parsed=lambda _: None)
+        parser_with_fallback = parser_assign.with_fallbacks([parser_none], exception_key="parsing_error")
+        return RunnableMap(raw=llm) | parser_with_fallback
+    
+    def _get_llm_string(self, stop: Optional[List[str]] = None, **kwargs: Any) -> str:
+        # The slot only changes where a request runs, not its response, so it is not part of the cache key
+        kwargs.pop("id_slot", None)
+        return super()._get_llm_string(stop=stop, **kwargs)
+    
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        """Parameters that change the output, part of the key of the response cache"""
+        return {
+            "model_name": self.model_name,
+            "server_url": self.server_url,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "logprobs": self.logprobs,
+            "top_logprobs": self.top_logprobs,
+            "cache_prompt": self.cache_prompt,
+        }
+    
     @property
     def _llm_type(self) -> str:
         """Get the type of language model used by this chat model."""
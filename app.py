@@ -67,6 +67,10 @@ def write_results(results):
         st.header("Grading Results")
         st.write(f"Final Grade: {results['final_grade']*100:.1f}%")
         st.write(f"Total Points Earned: {results['total_points_earned']:.1f}/{results['total_points_possible']:.1f}")
+        if 'usage' in results:
+            usage = results['usage']
+            st.caption(f"{usage['calls']} LLM call(s), {usage['input_tokens']} input tokens "
+                       f"({usage['cached_tokens']} cached), {usage['latency']:.1f}s")
         
         # Display detailed criteria breakdown
         st.subheader("Criteria Breakdown:")
@@ -91,11 +95,37 @@ def write_results(results):
                         if 'suggestion' in error:
                             st.write(f"  Suggestion: {error['suggestion']}")
 
+def write_progress(events):
+    # Show each criterion as soon as it is graded, until the final results are ready
+    placeholder = st.empty()
+    results = None
+    with placeholder.container(height=300):
+        st.header("Grading Results")
+        for event in events:
+            if event['type'] == 'final':
+                results = event['results']
+            elif event['sub_criterion'] is None:
+                write_scores(event['criterion'], event['result'])
+            else:
+                write_scores(event['sub_criterion'], event['result'], "    ")
+    placeholder.empty()
+    return results
+
+def _spin_until_first_chunk(chunks):
+    # The spinner covers the wait (and the hidden reasoning) until the reply starts, not the reply itself
+    chunks = iter(chunks)
+    with st.spinner("Your AI tutor is typing..."):
+        first = next(chunks, None)
+    if first is not None:
+        yield first
+        yield from chunks
+
 def _add_messages(c, user_prompt: dict):
     st.session_state.messages.append(user_prompt)
+    # Render the reply token by token as the model generates it
     with c:
-        with st.spinner("Your AI tutor is typing..."):
-            response = response_generator(st.session_state.model, st.session_state.messages)
+        response = c.chat_message("assistant").write_stream(
+            _spin_until_first_chunk(response_generator(st.session_state.model, st.session_state.messages)))
     st.session_state.messages.append({"role": "assistant", "content": response})
 
 def chatbox(method: str, submitted: bool):
@@ -107,29 +137,29 @@ def chatbox(method: str, submitted: bool):
         st.session_state.messages = [get_system_prompt()]
     # Initialize the model for the chat
     if "model" not in st.session_state:
-        if "test-chat" in method or method == "similarity":
+        if "test-chat" in method or method.startswith("similarity"):
             method = "deepseek-r1"  # Use a default model for these methods
-        st.session_state.model = get_model(method)
+        st.session_state.model = get_model(method, warm_up=True)
     
     # Create a container for the chatbox
     height = 500
     with st.container(height=height):
         c = st.container(height=height-90, border=False)
-        if submitted:
-            # Add the submission prompt to the chat history
-            _add_messages(c, get_submission_prompt(st.session_state.results[-1]))
 
         # Display chat messages from history on app rerun
         for message in st.session_state.messages:
             if message["role"] != "system" and not (message["role"] == "user" and message["content"].startswith("Plan:")):
                 c.chat_message(message["role"]).markdown(message["content"])
         
+        if submitted:
+            # Add the submission prompt to the chat history, streaming the reply after the history
+            _add_messages(c, get_submission_prompt(st.session_state.results[-1]))
+        
         # Accept user input
         #messages = st.container(height=100)
         if prompt := st.chat_input("Say something"):
             c.chat_message("user").markdown(prompt)
             _add_messages(c, {"role": "user", "content": prompt})
-            c.chat_message("assistant").markdown(st.session_state.messages[-1]["content"])
         
 def main():
     """
@@ -207,7 +237,7 @@ def main():
 
     method = st.selectbox(
         "Select Grading Method",
-        ("test-chat-low", "test-chat-mid", "test-chat-high", "similarity", "deepseek-chat", "deepseek-r1", "gpt-4.1-nano", "o4-mini"))
+        ("test-chat-low", "test-chat-mid", "test-chat-high", "similarity", "similarity-chunked", "similarity-onnx", "deepseek-chat", "deepseek-r1", "gpt-4.1-nano", "o4-mini"))
     
     # Grade for the first time or re-grade
     submitted = False
@@ -248,7 +278,8 @@ def main():
                         st.session_state.grading_system.coefficient = 0.7
                     elif "high" in method:
                         st.session_state.grading_system.coefficient = 0.95
-                results = st.session_state.grading_system.grade_assignment(final_assignment_path, rubric_path, problem_name)
+                results = write_progress(st.session_state.grading_system.grade_assignment_stream(
+                    final_assignment_path, rubric_path, problem_name))
                 
                 # Cleanup temporary files
                 if final_assignment_path:
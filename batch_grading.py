@@ -0,0 +1,230 @@
+"""
+Offline batch grading with the LLM grading methods, in the OpenAI Batch API format.
+
+1. export: writes one request per assignment and rubric criterion to <dir>/requests.jsonl
+2. Upload requests.jsonl to the OpenAI Batch API and save its output file in <dir>
+   as results*.jsonl, or run it locally against any get_model backend with run
+3. ingest: rebuilds the usual grading results from the results files into <dir>/graded.json
+
+Every step resumes from partial results: export only writes the requests without a
+successful result, and run skips them. To test offline, point OPENAI_BASE_URL to a stub
+OpenAI-compatible server.
+
+Usage:
+    python batch_grading.py export --model gpt-4.1-nano --rubric rubric.docx --assignments "../samples/*sample_*.docx" --dir batches/run1
+    python batch_grading.py run --dir batches/run1 [--concurrency 8]
+    python batch_grading.py ingest --dir batches/run1
+"""
+import os
+import json
+import glob
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+import jsonlines
+from langchain_core.messages import convert_to_openai_messages
+from pydantic import ValidationError
+from grading_system.grading_utils import get_grading_system
+# Imported by module name like grading_utils does, so this is the Grade the graders validate against
+from GradingSystemLLM import Grade
+from llm_utils import get_model
+from llm_calls import get_caller
+from llm_telemetry import call_site
+
+def _job_path(batch_dir: str) -> str:
+    return os.path.join(batch_dir, "job.json")
+
+def load_job(batch_dir: str) -> Dict:
+    with open(_job_path(batch_dir), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def load_results(batch_dir: str) -> Dict[str, Grade]:
+    """
+    Reads the grades of the successful requests from every results*.jsonl file of a batch.
+    Args:
+        batch_dir: Directory of the batch
+    Returns:
+        Dictionary mapping the custom_id of each request to its grade
+    """
+    grades = {}
+    for path in sorted(glob.glob(os.path.join(batch_dir, "results*.jsonl"))):
+        with jsonlines.open(path, "r") as reader:
+            for line in reader:
+                response = line.get("response") or {}
+                if response.get("status_code") != 200:
+                    continue
+                try:
+                    content = response["body"]["choices"][0]["message"]["content"]
+                    grades[line["custom_id"]] = Grade.model_validate_json(content)
+                except (KeyError, IndexError, TypeError, ValidationError):
+                    continue
+    return grades
+
+def _grading_system(job: Dict):
+    grading_system = get_grading_system(job["model"], prompt_layout=job["prompt_layout"])
+    grading_system.prepare_rubric(job["rubric_items"])
+    return grading_system
+
+def export_batch(model_name: str, rubric_path: str, assignment_paths: List[str], batch_dir: str,
+                 prompt_layout: str = 'criterion') -> int:
+    """
+    Writes the requests of the criteria that have no successful result yet.
+    Args:
+        model_name: Name of the model the requests are for
+        rubric_path: Path to the rubric file
+        assignment_paths: Paths to the assignment files
+        batch_dir: Directory of the batch; the job is reused if it already exists
+        prompt_layout: Prompt layout of GradingSystemLLM
+    Returns:
+        Number of requests written
+    """
+    if os.path.exists(_job_path(batch_dir)):
+        job = load_job(batch_dir)
+        grading_system = _grading_system(job)
+    else:
+        grading_system = get_grading_system(model_name, prompt_layout=prompt_layout)
+        rubric_items = grading_system.rubric_processor.extract_rubric(rubric_path)
+        job = {
+            "model": model_name,
+            "prompt_layout": prompt_layout,
+            "rubric_items": rubric_items,
+            "assignments": [{"name": os.path.basename(path), "text": grading_system.doc_processor.process_document(path)}
+                            for path in assignment_paths],
+        }
+        os.makedirs(batch_dir, exist_ok=True)
+        with open(_job_path(batch_dir), "w", encoding="utf-8") as f:
+            json.dump(job, f, indent=1)
+        grading_system.prepare_rubric(job["rubric_items"])
+
+    done = load_results(batch_dir)
+    schema = Grade.model_json_schema()
+    schema["additionalProperties"] = False
+    model = grading_system.model
+    jobs = grading_system.rubric_jobs(job["rubric_items"])
+    assignments = grading_system.parse_assignments([assignment["text"] for assignment in job["assignments"]])
+    count = 0
+    with jsonlines.open(os.path.join(batch_dir, "requests.jsonl"), "w") as writer:
+        for i, assignment in enumerate(assignments):
+            for j, item in enumerate(jobs):
+                custom_id = f"{i}-{j}"
+                if custom_id in done:
+                    continue
+                body = {
+                    "model": model_name,
+                    "messages": convert_to_openai_messages(grading_system.score_messages(item, assignment)),
+                    "response_format": {"type": "json_schema",
+                                        "json_schema": {"name": "Grade", "schema": schema, "strict": True}},
+                }
+                if getattr(model, "temperature", None) is not None:
+                    body["temperature"] = model.temperature
+                if getattr(model, "max_tokens", None) is not None:
+                    body["max_completion_tokens"] = model.max_tokens
+                writer.write({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body})
+                count += 1
+    return count
+
+def run_batch(batch_dir: str, concurrency: int = 8, server_url: Optional[str] = None) -> int:
+    """
+    Runs the pending requests of a batch with the model of the job through get_model,
+    appending OpenAI Batch output lines to results.jsonl as they complete.
+    Args:
+        batch_dir: Directory of the batch
+        concurrency: Maximum number of requests in flight
+        server_url: URL of the llama.cpp server for local models
+    Returns:
+        Number of requests that failed
+    """
+    job = load_job(batch_dir)
+    kwargs = {"server_url": server_url} if server_url else {}
+    llm = get_model(job["model"], **kwargs).with_structured_output(Grade, include_raw=True)
+    caller = get_caller(job["model"])
+    done = load_results(batch_dir)
+    with jsonlines.open(os.path.join(batch_dir, "requests.jsonl"), "r") as reader:
+        requests = [request for request in reader if request["custom_id"] not in done]
+
+    def run(request: Dict) -> Dict:
+        try:
+            with call_site("batch", custom_id=request["custom_id"]):
+                output = caller.invoke(llm, request["body"]["messages"])
+            if output["parsed"] is None:
+                raise output["parsing_error"] or ValueError("No grade in the model output")
+            usage = getattr(output["raw"], "usage_metadata", None) or {}
+            body = {
+                "object": "chat.completion",
+                "model": job["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": output["parsed"].model_dump_json()}}],
+                "usage": {"prompt_tokens": usage.get("input_tokens", 0),
+                          "completion_tokens": usage.get("output_tokens", 0),
+                          "total_tokens": usage.get("total_tokens", 0)},
+            }
+            return {"id": f"local-{request['custom_id']}", "custom_id": request["custom_id"],
+                    "response": {"status_code": 200, "body": body}, "error": None}
+        except Exception as e:
+            return {"id": f"local-{request['custom_id']}", "custom_id": request["custom_id"],
+                    "response": None, "error": {"code": type(e).__name__, "message": str(e)}}
+
+    failed = 0
+    with jsonlines.open(os.path.join(batch_dir, "results.jsonl"), "a", flush=True) as writer, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for future in as_completed([executor.submit(run, request) for request in requests]):
+            line = future.result()
+            writer.write(line)
+            failed += line["error"] is not None
+    return failed
+
+def ingest_batch(batch_dir: str) -> Dict[str, Dict]:
+    """
+    Rebuilds the grading results of the assignments whose criteria all have a grade,
+    and writes them to graded.json.
+    Args:
+        batch_dir: Directory of the batch
+    Returns:
+        Dictionary mapping each complete assignment name to its grading results
+    """
+    job = load_job(batch_dir)
+    grading_system = _grading_system(job)
+    grades = load_results(batch_dir)
+    jobs = grading_system.rubric_jobs(job["rubric_items"])
+    assignments = grading_system.parse_assignments([assignment["text"] for assignment in job["assignments"]])
+    graded = {}
+    for i, (info, assignment) in enumerate(zip(job["assignments"], assignments)):
+        item_grades = [grades.get(f"{i}-{j}") for j in range(len(jobs))]
+        if any(grade is None for grade in item_grades):
+            continue
+        job_scores = [grading_system.results_from_grade(item, assignment, grade)
+                      for item, grade in zip(jobs, item_grades)]
+        graded[info["name"]] = grading_system._grade_rubric(assignment, job["rubric_items"], job_scores)
+    with open(os.path.join(batch_dir, "graded.json"), "w", encoding="utf-8") as f:
+        json.dump(graded, f, indent=1)
+    return graded
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export")
+    export_parser.add_argument("--model", required=True)
+    export_parser.add_argument("--rubric", required=True)
+    export_parser.add_argument("--assignments", required=True, help="glob pattern of the assignment files")
+    export_parser.add_argument("--prompt-layout", default="criterion")
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--server-url", default=None)
+    subparsers.add_parser("ingest")
+    for subparser in subparsers.choices.values():
+        subparser.add_argument("--dir", required=True, help="directory of the batch")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        count = export_batch(args.model, args.rubric, sorted(glob.glob(args.assignments)), args.dir, args.prompt_layout)
+        print(f"{count} pending requests written to {os.path.join(args.dir, 'requests.jsonl')}")
+    elif args.command == "run":
+        failed = run_batch(args.dir, args.concurrency, args.server_url)
+        print(f"Done, {failed} failed requests (export again to retry them)")
+    else:
+        job = load_job(args.dir)
+        graded = ingest_batch(args.dir)
+        print(f"{len(graded)}/{len(job['assignments'])} assignments graded in {os.path.join(args.dir, 'graded.json')}")
+
+if __name__ == "__main__":
+    main()
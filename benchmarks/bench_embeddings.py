@@ -0,0 +1,123 @@
+"""
+Benchmarks the embedding backends of GradingSystemSimilarity: the PyTorch model
+("torch") against its int8-quantized ONNX export run with onnxruntime ("onnx").
+
+Each backend runs in its own process so that its resident memory is measured alone.
+It reports the single-text latency, the batch throughput and the RSS of each backend,
+the cosine agreement of their embeddings, and the drift of the similarity grades
+of sample assignments against a rubric.
+
+Usage: python benchmarks/bench_embeddings.py [--threads 4] [--batch-size 32] [--texts 256]
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+import tempfile
+import time
+from bench_utils import SAMPLE_SENTENCES, sample_text, print_table, rss_mib
+import numpy as np
+
+MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+RUBRIC_TEXTS = [
+    "Identifies the support reactions of the hinge and roller",
+    "Applies the equilibrium equations to the free body diagram",
+    "Explains why the two-force member carries only axial load",
+    "Describes a concrete plan to review the material before the quiz",
+]
+
+def texts_for(n_texts: int):
+    """
+    Sentences, words and whole assignments, as embedded by the similarity grader.
+    """
+    words = sorted({word.strip(".,").lower() for sentence in SAMPLE_SENTENCES for word in sentence.split()})
+    assignments = [sample_text(200, seed=seed) for seed in range(8)]
+    texts = (SAMPLE_SENTENCES + words + assignments) * (n_texts // 10 + 1)
+    return texts[:n_texts], assignments
+
+def run_backend(args):
+    """
+    Child process: loads one backend, times it and saves its embeddings.
+    """
+    from embedding_utils import get_embeddings
+    texts, assignments = texts_for(args.texts)
+    before = rss_mib()
+    start = time.perf_counter()
+    # Bypass the embedding cache to time the model itself
+    embeddings = get_embeddings(MODEL_NAME, backend=args.backend, batch_size=args.batch_size,
+                                intra_op_threads=args.threads, cache_path=None).embeddings
+    load_time = time.perf_counter() - start
+
+    embeddings.embed_documents(texts[:args.batch_size])  # warm-up
+    latencies = []
+    for text in SAMPLE_SENTENCES * 4:
+        start = time.perf_counter()
+        embeddings.embed_query(text)
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    throughput = len(texts) / (time.perf_counter() - start)
+
+    np.savez(args.output,
+             vectors=vectors,
+             assignments=np.asarray(embeddings.embed_documents(assignments), dtype=np.float32),
+             rubric=np.asarray(embeddings.embed_documents(RUBRIC_TEXTS), dtype=np.float32))
+    with open(args.output + ".json", "w") as f:
+        json.dump({
+            "load_s": load_time,
+            "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+            "p95_ms": float(np.percentile(latencies, 95)) * 1000,
+            "texts_per_s": throughput,
+            "rss_mib": rss_mib() - before,
+        }, f)
+
+def normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+def grades(assignments: np.ndarray, rubric: np.ndarray) -> np.ndarray:
+    """
+    Full-text similarity of each assignment to each rubric text, rounded to
+    0.1 as GradingSystemSimilarity rounds its combined similarities.
+    """
+    return np.round(normalize(assignments) @ normalize(rubric).T * 10) / 10
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=None, help="intra-op threads of the onnx backend")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--texts", type=int, default=256)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.backend:
+        run_backend(args)
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in ("torch", "onnx"):
+            output = os.path.join(tmp, f"{backend}.npz")
+            command = [sys.executable, os.path.abspath(__file__), "--backend", backend, "--output", output,
+                       "--batch-size", str(args.batch_size), "--texts", str(args.texts)]
+            if args.threads is not None:
+                command += ["--threads", str(args.threads)]
+            subprocess.run(command, check=True)
+            with open(output + ".json") as f:
+                results[backend] = (json.load(f), dict(np.load(output)))
+
+    print_table(
+        ["backend", "load (s)", "p50 (ms)", "p95 (ms)", "texts/s", "RSS (MiB)"],
+        [(backend, f"{m['load_s']:.1f}", f"{m['p50_ms']:.1f}", f"{m['p95_ms']:.1f}",
+          f"{m['texts_per_s']:.0f}", f"{m['rss_mib']:.0f}") for backend, (m, _) in results.items()])
+
+    torch_vectors, onnx_vectors = results["torch"][1], results["onnx"][1]
+    cosines = np.sum(normalize(torch_vectors["vectors"]) * normalize(onnx_vectors["vectors"]), axis=1)
+    drift = np.abs(grades(torch_vectors["assignments"], torch_vectors["rubric"]) -
+                   grades(onnx_vectors["assignments"], onnx_vectors["rubric"]))
+    print()
+    print(f"cosine agreement: mean {cosines.mean():.4f}, min {cosines.min():.4f}")
+    print(f"grade drift: {np.count_nonzero(drift)}/{drift.size} rounded similarities changed, max {drift.max():.1f}")
+
+if __name__ == "__main__":
+    main()
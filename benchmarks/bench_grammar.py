@@ -0,0 +1,50 @@
+"""
+Benchmarks GradingSystem.check_grammar before and after the single-parse GrammarChecker.
+
+Usage: python benchmarks/bench_grammar.py [--sizes 1000 2000 5000 10000], after python build_spelling.py
+"""
+import argparse
+from bench_utils import sample_text, timeit, print_table
+import spacy
+from spellchecker import SpellChecker
+from GrammarChecker import GrammarChecker
+from GradingSystem import DOMAIN_VOCABULARY_PATH
+from SpellingSuggester import SpellingSuggester, domain_spell_checker, load_domain_vocabulary
+
+def legacy_check_grammar(nlp, spell: SpellChecker, text: str):
+    """
+    The parse pattern of the previous check_grammar: one parse of the whole text
+    plus one more parse of every sentence.
+    """
+    doc = nlp(text)
+    words = [token.text.lower() for token in doc if not token.is_punct and not token.is_space]
+    misspelled = list(spell.unknown(words))
+    for sent in doc.sents:
+        sent_text = str(sent).strip()
+        sent_doc = nlp(sent_text)
+        has_subject = any(token.dep_ in ['nsubj', 'nsubjpass'] for token in sent_doc)
+        has_verb = any(token.pos_ == 'VERB' for token in sent_doc)
+    return [spell.candidates(word) for word in misspelled]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 5000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    nlp = spacy.load('en_core_web_sm', disable=['ner'])
+    # The spell checker of the grading systems
+    spell = domain_spell_checker(load_domain_vocabulary(DOMAIN_VOCABULARY_PATH))
+    checker = GrammarChecker(spell, SpellingSuggester(spell))
+
+    rows = []
+    for size in args.sizes:
+        text = sample_text(size)
+        n_words = len(text.split())
+        before = timeit(lambda: legacy_check_grammar(nlp, spell, text), args.repeat)
+        after = timeit(lambda: checker.check(nlp(text)), args.repeat)
+        rows.append((n_words, f"{n_words / before:,.0f}", f"{n_words / after:,.0f}", f"{before / after:.2f}x"))
+    print_table(["words", "before (words/s)", "after (words/s)", "speedup"], rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmarks the image presets of image_encoding.py: payload size, estimated vision tokens
+(Qwen2.5-VL patches and OpenAI high-detail tiles) and encoding time of each preset, the
+first time and from the cache of encoded images.
+
+With --model, it also asks a vision model every problem of domain_information with each
+preset and reports the latency and the probability of the correct choice, to measure the
+accuracy impact of fewer vision tokens.
+
+Usage: python benchmarks/bench_images.py [--images "pages/*.png"] [--model qwen2.5-vl]
+"""
+import os
+import glob
+import math
+import time
+import tempfile
+import argparse
+from statistics import mean
+from bench_utils import SAMPLE_SENTENCES, print_table
+from PIL import Image, ImageDraw
+import image_encoding
+from image_encoding import IMAGE_PRESETS, MODEL_IMAGE_PRESETS, encode_image
+
+def synthetic_page(path: str):
+    """
+    Letter page rendered at 300 DPI like the textbook pages, with lines of text and a diagram.
+    """
+    image = Image.new("RGB", (2550, 3300), "white")
+    draw = ImageDraw.Draw(image)
+    for i in range(60):
+        draw.text((200, 200 + i * 45), SAMPLE_SENTENCES[i % len(SAMPLE_SENTENCES)], fill="black")
+    draw.rectangle((600, 3000 - 600, 1900, 3000), outline="black", width=6)
+    draw.line((600, 2400, 1900, 3000), fill="black", width=6)
+    image.save(path)
+
+def qwen_tokens(width: int, height: int) -> int:
+    # One token per 28x28 patch
+    return math.ceil(width / 28) * math.ceil(height / 28)
+
+def openai_tokens(width: int, height: int) -> int:
+    # High detail: fit in 2048x2048, scale the shortest side to 768, then 170 tokens per 512px tile plus 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 170 * math.ceil(width / 512) * math.ceil(height / 512) + 85
+
+def decoded_size(url: str):
+    import io, base64
+    with Image.open(io.BytesIO(base64.b64decode(url.split(",", 1)[1]))) as image:
+        return image.size
+
+def bench_encoding(paths):
+    rows = []
+    for preset in IMAGE_PRESETS:
+        image_encoding._cache = image_encoding._PayloadCache()
+        start = time.perf_counter()
+        urls = [encode_image(path, preset) for path in paths]
+        first = (time.perf_counter() - start) / len(paths)
+        start = time.perf_counter()
+        for path in paths:
+            encode_image(path, preset)
+        cached = (time.perf_counter() - start) / len(paths)
+        sizes = [decoded_size(url) for url in urls]
+        rows.append((
+            preset,
+            f"{mean(len(url) for url in urls) / 1024:.0f}",
+            f"{mean(qwen_tokens(*size) for size in sizes):.0f}",
+            f"{mean(openai_tokens(*size) for size in sizes):.0f}",
+            f"{first * 1000:.1f}",
+            f"{cached * 1000:.3f}",
+        ))
+    print_table(["preset", "payload (KiB)", "qwen2.5-vl tokens", "openai tokens", "encode (ms)", "cached (ms)"], rows)
+
+def bench_model(model_name: str):
+    from domain_information import PROBLEMS
+    from llm_cache import bypass_llm_cache
+    from TextRetriever import TextRetriever
+
+    class ProblemOnly(TextRetriever):
+        def get_user_content(self, problem: dict, document):
+            return [self.image_content(path) for path in problem["images"]] + \
+                [{"type": "text", "text": problem["problem"] + "\nOutput only the letter (a-e) of the correct answer."}]
+
+    retriever = ProblemOnly(model_name, None)
+    rows = []
+    for preset in IMAGE_PRESETS:
+        MODEL_IMAGE_PRESETS[model_name] = preset
+        latencies, probs, correct = [], [], []
+        for problem in PROBLEMS.values():
+            start = time.perf_counter()
+            with bypass_llm_cache():
+                result = retriever.get_choice_logprob(problem, None)
+            latencies.append(time.perf_counter() - start)
+            prob = retriever.get_prob(result, problem["choices"])
+            answer = problem["choices"].index(problem["answer"])
+            probs.append(prob[answer])
+            correct.append(prob.argmax() == answer)
+        rows.append((preset, f"{mean(latencies):.2f}", f"{mean(probs):.3f}", f"{mean(correct):.0%}"))
+    print_table(["preset", "latency (s)", "p(correct)", "accuracy"], rows)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", default=None, help="glob pattern of images, a synthetic 300 DPI page if not set")
+    parser.add_argument("--model", default=None, help="vision model to measure the accuracy impact with")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = sorted(glob.glob(args.images)) if args.images else []
+        if not paths:
+            paths = [os.path.join(tmp, "page.png")]
+            synthetic_page(paths[0])
+        bench_encoding(paths)
+    if args.model:
+        print()
+        bench_model(args.model)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmarks the modes of GradingSystemLLM on the same assignments and rubric:
+one call per criterion and sub-criterion or a single call for the whole rubric,
+with each prompt layout. It reports the calls, input tokens (and how many of them
+were read from the provider's prompt cache) and latency per assignment from results['usage'].
+The grading calls skip the response cache (see llm_cache.py), so every mode pays for its calls;
+the LLM cache hits column stays at 0 unless a response was still served from it.
+
+Usage: python benchmarks/bench_llm_modes.py --model gpt-4.1-nano --rubric rubric.docx [--assignments 5]
+"""
+import argparse
+from statistics import mean
+from bench_utils import sample_text, print_table
+from llm_cache import bypass_llm_cache
+from grading_utils import get_grading_system
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="gpt-4.1-nano")
+    parser.add_argument("--rubric", required=True, help="rubric file read by the rubric processor")
+    parser.add_argument("--assignments", type=int, default=5)
+    parser.add_argument("--words", type=int, default=400)
+    args = parser.parse_args()
+
+    texts = [sample_text(args.words, seed=seed) for seed in range(args.assignments)]
+    rows = []
+    rubric_items = None
+    for single_call, prompt_layout in ((False, 'criterion'), (False, 'prefix'), (True, 'criterion'), (True, 'prefix')):
+        grading_system = get_grading_system(args.model, single_call=single_call, prompt_layout=prompt_layout)
+        if rubric_items is None:
+            rubric_items = grading_system.rubric_processor.extract_rubric(args.rubric)
+        # Responses cached by the previous modes would hide the calls of this one
+        with bypass_llm_cache():
+            results = grading_system.grade_batch(texts, rubric_items)
+        usages = [result['usage'] for result in results]
+        rows.append((
+            usages[0]['mode'],
+            prompt_layout,
+            f"{mean(usage['calls'] for usage in usages):.1f}",
+            f"{mean(usage['input_tokens'] for usage in usages):.0f}",
+            f"{mean(usage['cached_tokens'] for usage in usages):.0f}",
+            f"{mean(usage['output_tokens'] for usage in usages):.0f}",
+            f"{mean(usage['latency'] for usage in usages):.2f}",
+            f"{sum(usage['llm_cache_hits'] for usage in usages)}",
+            f"{mean(result['final_grade'] for result in results) * 100:.1f}",
+        ))
+    print_table(["mode", "layout", "calls", "input tokens", "cached tokens", "output tokens", "latency (s)",
+                 "LLM cache hits", "mean grade (%)"], rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmarks the page retrieval of TextRetrieverMultimodal on a llama-server launched with
+parallel slots (llama-server -np N): candidate pages sent to any free slot against pages
+pinned to the slots (n_slots=N), where each slot keeps the prompt prefix of the problem
+in its KV cache and the page comes last in the prompt.
+
+It reports the pages scored per second, the input tokens per page and the part of them
+read from the slot caches (from the telemetry log, see llm_telemetry.py), and how much
+the top-k pages of the pinned mode agree with the unpinned ranking, which also uses the
+original page-before-problem prompt order.
+
+Usage: python benchmarks/bench_slots.py [--model qwen2.5-vl] [--slots 4] [--pages 16] [--problems 3]
+"""
+import os
+import glob
+import time
+import tempfile
+import argparse
+from statistics import mean
+from bench_utils import print_table
+from domain_information import PROBLEMS, TEXT_PATH
+from llm_cache import bypass_llm_cache
+from llm_telemetry import load_records, TELEMETRY_PATH
+from TextRetrieverMultimodal import TextRetrieverMultimodal, base_messages
+
+def page_images(path: str, n_pages: int, pattern: str = None):
+    if pattern:
+        return sorted(glob.glob(pattern))[:n_pages]
+    from pdf2image import convert_from_path
+    return convert_from_path(TEXT_PATH, output_folder=path, dpi=300, fmt="png", first_page=1,
+                             last_page=n_pages, paths_only=True)
+
+def run_mode(model_name: str, n_slots, problems, pages, k: int):
+    retriever = TextRetrieverMultimodal(model_name, TEXT_PATH, base_messages, n_slots=n_slots)
+    start_time = time.time()
+    start = time.perf_counter()
+    rankings = []
+    # Responses from the cache would hide the work of the server
+    with bypass_llm_cache():
+        for problem in problems:
+            rankings.append(list(retriever.retrieve_loop(problem, pages)[:k]))
+    elapsed = time.perf_counter() - start
+    records = [r for r in load_records(TELEMETRY_PATH, start_time) if r["stage"] == "retrieval" and r["error"] is None]
+    return {
+        "pages_per_s": len(problems) * len(pages) / elapsed,
+        "input": mean(r["input_tokens"] for r in records) if records else 0.0,
+        "cached": mean(r["cached_tokens"] for r in records) if records else 0.0,
+        "rankings": rankings,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="qwen2.5-vl", help="model served by llama-server")
+    parser.add_argument("--slots", type=int, default=4, help="parallel slots of the server (-np)")
+    parser.add_argument("--pages", type=int, default=16, help="candidate pages per problem")
+    parser.add_argument("--images", default=None, help="glob pattern of page images, the first pages of the textbook if not set")
+    parser.add_argument("--problems", type=int, default=3)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    problems = list(PROBLEMS.values())[:args.problems]
+    with tempfile.TemporaryDirectory() as tmp:
+        pages = page_images(tmp, args.pages, args.images)
+        results = {mode: run_mode(args.model, n_slots, problems, pages, args.k)
+                   for mode, n_slots in (("any slot", None), (f"pinned ({args.slots})", args.slots))}
+
+    baseline = results["any slot"]["rankings"]
+    rows = []
+    for mode, result in results.items():
+        overlap = mean(len(set(a) & set(b)) / args.k for a, b in zip(result["rankings"], baseline))
+        rows.append((mode, f"{result['pages_per_s']:.2f}", f"{result['input']:.0f}", f"{result['cached']:.0f}",
+                     f"{overlap:.0%}"))
+    print_table(["mode", "pages/s", "input tokens/page", "cached tokens/page", f"top-{args.k} overlap"], rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmarks the cold start of each grading method, as app.py and batch_grading.py start it:
+the time to import the grading stack, the time to create the grading system of the method,
+the time of the first parse (which loads spaCy) and the RSS after each step.
+
+Each method runs in its own process, so nothing is imported or loaded beforehand.
+The heavy dependencies each method loaded are listed, to check that they are only
+loaded by the methods that need them.
+
+Usage: python benchmarks/bench_startup.py [--methods test-chat-mid similarity gpt-4.1-nano]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from bench_utils import ROOT, sample_text, print_table, rss_mib
+
+METHODS = ["test-chat-mid", "similarity", "similarity-chunked", "similarity-onnx", "deepseek-chat", "deepseek-r1",
+           "gpt-4.1-nano", "qwen2.5-vl"]
+HEAVY_MODULES = ["spacy", "torch", "sentence_transformers", "onnxruntime", "byaldi", "pdf2image",
+                 "langchain_openai", "langchain_deepseek", "langchain_ollama", "openai"]
+
+def run_method(method: str):
+    """
+    Child process: starts one grading method and prints its timings as JSON.
+    """
+    result = {"baseline_mib": rss_mib()}
+    start = time.perf_counter()
+    from grading_utils import get_grading_system
+    import llm_utils, chatbot  # noqa: F401, the rest of the stack imported by app.py
+    result["import_s"] = time.perf_counter() - start
+    result["import_mib"] = rss_mib()
+
+    try:
+        start = time.perf_counter()
+        grading_system = get_grading_system(method)
+        result["init_s"] = time.perf_counter() - start
+        result["init_mib"] = rss_mib()
+
+        start = time.perf_counter()
+        grading_system.parse_assignment(sample_text(200))
+        result["parse_s"] = time.perf_counter() - start
+        result["parse_mib"] = rss_mib()
+    except Exception as e:
+        # e.g., a missing API key or model: the steps before are still reported
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["modules"] = [name for name in HEAVY_MODULES if name in sys.modules]
+    print(json.dumps(result))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--methods", nargs="+", default=METHODS)
+    parser.add_argument("--method", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.method:
+        run_method(args.method)
+        return
+
+    rows = []
+    for method in args.methods:
+        # Run from the repository root, where the grading systems find their indexes and caches
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), "--method", method],
+                                 cwd=ROOT, capture_output=True, text=True)
+        if process.returncode != 0:
+            print(process.stderr, file=sys.stderr)
+            rows.append((method, "-", "-", "-", "-", "-", "-", "failed"))
+            continue
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        if "error" in result:
+            print(f"{method}: {result['error']}", file=sys.stderr)
+        rows.append((
+            method,
+            f"{result['import_s']:.2f}",
+            f"{result['init_s']:.2f}" if "init_s" in result else "-",
+            f"{result['parse_s']:.2f}" if "parse_s" in result else "-",
+            f"{result['import_mib'] - result['baseline_mib']:.0f}",
+            f"{result['init_mib'] - result['baseline_mib']:.0f}" if "init_mib" in result else "-",
+            f"{result['parse_mib'] - result['baseline_mib']:.0f}" if "parse_mib" in result else "-",
+            ",".join(result["modules"]) or "-",
+        ))
+    print_table(["method", "import (s)", "init (s)", "first parse (s)", "import (MiB)", "init (MiB)",
+                 "first parse (MiB)", "heavy modules"], rows)
+
+if __name__ == "__main__":
+    main()
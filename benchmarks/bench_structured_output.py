@@ -0,0 +1,92 @@
+"""
+Benchmarks structured output of a local model served by llama-server (ChatLlamaCppServer):
+free-form generation with format instructions parsed afterwards ("prompted"), retried
+when the JSON is malformed, against generation constrained by the JSON schema of the
+output ("constrained", with_structured_output). It reports the rate of calls that had
+to be retried, the output tokens per call and the latency per object, for the Grade
+schema of GradingSystemLLM.
+
+Usage: python benchmarks/bench_structured_output.py --model qwen2.5-vl [--server-url URL] [--calls 20]
+"""
+import time
+import argparse
+from statistics import mean
+from bench_utils import sample_text, print_table
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import PydanticOutputParser
+from GradingSystemLLM import Grade
+from llm_utils import get_model
+
+CRITERIA = [
+    "Identifies the support reactions of the hinge and roller",
+    "Applies the equilibrium equations to the free body diagram",
+    "Describes a concrete plan to review the material before the quiz",
+]
+
+def messages_for(i: int, words: int):
+    criterion = CRITERIA[i % len(CRITERIA)]
+    return [
+        ("system", f"You are a grading assistant. Your task is to evaluate the student's assignment based on the following criteria on a scale of 0-2:\n{criterion}"),
+        ("human", sample_text(words, seed=i)),
+    ]
+
+def run_prompted(model, n_calls: int, words: int, max_retries: int):
+    parser = PydanticOutputParser(pydantic_object=Grade)
+    stats = {"requests": 0, "retried": 0, "failed": 0, "output_tokens": [], "latency": []}
+    for i in range(n_calls):
+        system, human = messages_for(i, words)
+        messages = [("system", system[1] + "\n\n" + parser.get_format_instructions()), human]
+        start = time.perf_counter()
+        for attempt in range(max_retries + 1):
+            response = model.invoke(messages)
+            stats["requests"] += 1
+            stats["output_tokens"].append((response.usage_metadata or {}).get("output_tokens", 0))
+            try:
+                parser.parse(response.content)
+                break
+            except OutputParserException:
+                if attempt == 0:
+                    stats["retried"] += 1
+        else:
+            stats["failed"] += 1
+        stats["latency"].append(time.perf_counter() - start)
+    return stats
+
+def run_constrained(model, n_calls: int, words: int):
+    llm = model.with_structured_output(Grade, include_raw=True)
+    stats = {"requests": 0, "retried": 0, "failed": 0, "output_tokens": [], "latency": []}
+    for i in range(n_calls):
+        start = time.perf_counter()
+        output = llm.invoke(messages_for(i, words))
+        stats["requests"] += 1
+        stats["output_tokens"].append((output["raw"].usage_metadata or {}).get("output_tokens", 0))
+        stats["failed"] += output["parsed"] is None
+        stats["latency"].append(time.perf_counter() - start)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="qwen2.5-vl", help="model served by llama-server")
+    parser.add_argument("--server-url", default="http://127.0.0.1:8080/v1/chat/completions")
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--words", type=int, default=200)
+    parser.add_argument("--max-retries", type=int, default=2)
+    args = parser.parse_args()
+
+    # The response cache would hide the generation being measured
+    model = get_model(args.model, max_tokens=512, server_url=args.server_url, cache=False)
+    rows = []
+    for name, stats in (("prompted", run_prompted(model, args.calls, args.words, args.max_retries)),
+                        ("constrained", run_constrained(model, args.calls, args.words))):
+        rows.append((
+            name,
+            str(stats["requests"]),
+            f"{stats['retried'] / args.calls:.0%}",
+            f"{stats['failed'] / args.calls:.0%}",
+            f"{mean(stats['output_tokens']):.0f}",
+            f"{mean(stats['latency']):.2f}",
+        ))
+    print_table(["method", "requests", "retried", "failed", "output tokens/request", "latency/object (s)"], rows)
+
+if __name__ == "__main__":
+    main()
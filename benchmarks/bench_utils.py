@@ -0,0 +1,72 @@
+import os
+import sys
+import random
+import time
+from typing import Callable, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The grading systems and retrievers import each other by module name
+for path in (ROOT, os.path.join(ROOT, "grading_system"), os.path.join(ROOT, "retriever")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+SAMPLE_SENTENCES = [
+    "The truss is supported by a hinge at A and a roller at D.",
+    "A hinge support provides two reaction force components but no moment.",
+    "Since the roller at D can only push perpendicular to the surface, it gives one vertical reaction.",
+    "I summed the moments about point A to find the reaction at D first.",
+    "the free body diagram shows every external force acting on the frame",
+    "Then the horizontal reaction at A must balance the applied load",
+    "According to hibbeler, a fixed support resists both forces and a moment.",
+    "My plan is to review the equilibrium equations every week before the quiz.",
+    "I will practise drawing free body diagrams and check my answers with classmates.",
+    "This choice is correct because the member BC is a two-force member.",
+    "we cant neglect the weight of the beam becuase it is not small",
+    "The sum of the forces in the x direction must equal zero for equilibrium.",
+]
+
+def sample_text(n_words: int, seed: int = 0) -> str:
+    """
+    Builds a student-like text of roughly n_words words from SAMPLE_SENTENCES.
+    """
+    rng = random.Random(seed)
+    sentences = []
+    count = 0
+    while count < n_words:
+        sentence = rng.choice(SAMPLE_SENTENCES)
+        sentences.append(sentence)
+        count += len(sentence.split())
+    return " ".join(sentences)
+
+def timeit(fn: Callable, repeat: int = 3) -> float:
+    """
+    Returns the best wall-clock time in seconds of calling fn repeat times.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def rss_mib() -> float:
+    """
+    Current resident set size of this process in MiB.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    # Peak RSS where /proc is not available (KiB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+def print_table(header: List[str], rows: List[Tuple]):
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(header)]
+    print("  ".join(str(h).rjust(w) for h, w in zip(header, widths)))
+    for row in rows:
+        print("  ".join(str(c).rjust(w) for c, w in zip(row, widths)))
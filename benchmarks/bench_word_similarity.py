@@ -0,0 +1,60 @@
+"""
+Benchmarks the word-level similarity of GradingSystemSimilarity before and after
+the batched WordMatrix, at 50, 500 and 5000 assignment words.
+
+The previous pairwise loop needs two embed_query calls per word pair, so it is
+timed on a sample of pairs and extrapolated to the full document.
+
+Usage: python benchmarks/bench_word_similarity.py [--sizes 50 500 5000] [--legacy-pairs 200]
+"""
+import argparse
+import time
+from bench_utils import sample_text, timeit, print_table
+import numpy as np
+import spacy
+from langchain_huggingface import HuggingFaceEmbeddings
+from ParsedAssignment import ParsedAssignment
+from WordMatrix import WordMatrix
+
+RUBRIC_TEXT = "Identifies the support reactions of the hinge and roller and applies the equilibrium equations to the free body diagram"
+
+def legacy_pair_time(embeddings, words1, words2, max_pairs: int) -> float:
+    """
+    Average time of one non-matching word pair in the previous pairwise loop.
+    """
+    pairs = [(w1, w2) for w1 in words1 for w2 in words2 if w1[0] != w2[0] and w1[1] != w2[1]][:max_pairs]
+    start = time.perf_counter()
+    for (text1, _), (text2, _) in pairs:
+        emb1 = embeddings.embed_query(text1)
+        emb2 = embeddings.embed_query(text2)
+        np.dot(emb1, emb2) / (np.linalg.norm(emb1) * np.linalg.norm(emb2))
+    return (time.perf_counter() - start) / max(len(pairs), 1)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 5000])
+    parser.add_argument("--legacy-pairs", type=int, default=200, help="word pairs timed for the previous loop")
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    nlp = spacy.load('en_core_web_sm', disable=['ner'])
+    embeddings = HuggingFaceEmbeddings(
+        model_name="sentence-transformers/all-mpnet-base-v2",
+        model_kwargs={'device': args.device}
+    )
+    rubric = ParsedAssignment.from_doc(RUBRIC_TEXT, nlp(RUBRIC_TEXT.lower()))
+
+    rows = []
+    for size in args.sizes:
+        text = sample_text(size)
+        assignment = ParsedAssignment.from_doc(text, nlp(text), nlp(text.lower()))
+        words1, words2 = assignment.content_words, rubric.content_words
+        n_pairs = sum(1 for w1 in words1 for w2 in words2 if w1[0] != w2[0] and w1[1] != w2[1])
+        before = legacy_pair_time(embeddings, words1, words2, args.legacy_pairs) * n_pairs
+        after = timeit(lambda: WordMatrix.from_words(words1, embeddings.embed_documents).similarity(
+            WordMatrix.from_words(words2, embeddings.embed_documents)), repeat=1)
+        rows.append((len(text.split()), len(words1), n_pairs, f"{before:.2f}", f"{after:.3f}", f"{before / after:,.0f}x"))
+    print_table(["words", "content words", "embedded pairs", "before (s, est.)", "after (s)", "speedup"], rows)
+
+if __name__ == "__main__":
+    main()
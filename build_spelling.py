@@ -0,0 +1,20 @@
+import argparse
+from domain_information import TEXT_PATH
+from document_processor import AssignmentProcessor
+from grading_system.GradingSystem import DOMAIN_VOCABULARY_PATH
+from grading_system.SpellingSuggester import (SPELLING_INDEX_PATH, SpellingSuggester, build_domain_vocabulary,
+                                              domain_spell_checker, save_domain_vocabulary)
+
+if __name__ == "__main__":
+    # Build the spelling data of the grading systems offline, so no grading request reads the textbook
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--min-count", type=int, default=2,
+                        help="minimum number of occurrences of a textbook word in the vocabulary")
+    args = parser.parse_args()
+
+    words = build_domain_vocabulary(AssignmentProcessor().process_document(TEXT_PATH), args.min_count)
+    save_domain_vocabulary(DOMAIN_VOCABULARY_PATH, words)
+    print(f"Textbook: {len(words)} words in {DOMAIN_VOCABULARY_PATH}")
+
+    speller = SpellingSuggester(domain_spell_checker(words), SPELLING_INDEX_PATH, build=True)
+    print(f"{len(speller.words)} dictionary words indexed in {SPELLING_INDEX_PATH}")
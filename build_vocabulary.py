@@ -0,0 +1,38 @@
+import os
+import argparse
+from domain_information import PROBLEMS
+from utils import read_rubrics
+from grading_system.grading_utils import get_grading_system
+from grading_system.GradingSystem import DOMAIN_VOCABULARY_PATH
+from grading_system.RubricArtifact import RubricArtifact
+from grading_system.SpellingSuggester import load_domain_vocabulary
+from grading_system.VocabularyTable import VocabularyTable
+
+if __name__ == "__main__":
+    # Precompute the word embeddings of the "similarity" grading methods
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--method", default="similarity", choices=["similarity", "similarity-onnx"])
+    parser.add_argument("--english-words", type=int, default=30000,
+                        help="most frequent words of the spellchecker's English dictionary to include")
+    args = parser.parse_args()
+
+    grading_system = get_grading_system(args.method)
+    # Write with the model itself, so the words do not fill the embedding cache
+    table = VocabularyTable(grading_system.vocabulary.path, grading_system.embeddings.embeddings, write_back=True)
+
+    # Built by build_spelling.py
+    words = load_domain_vocabulary(DOMAIN_VOCABULARY_PATH)
+    print(f"Textbook: {len(words)} words")
+    rubric_texts = []
+    for problem_name in PROBLEMS:
+        rubric_path = os.path.join("./problems", problem_name, "rubrics.jsonl")
+        if os.path.exists(rubric_path):
+            rubric_texts.extend(RubricArtifact._texts(read_rubrics(rubric_path)))
+    rubric_words = [token.lower_ for doc in grading_system.nlp.pipe(text.lower() for text in rubric_texts)
+                    for token in doc if not token.is_stop and not token.is_punct and not token.is_space]
+    print(f"Rubrics: {len(set(rubric_words))} words")
+    english_words = [word for word, _ in grading_system.spell.word_frequency.most_common(args.english_words)]
+    print(f"English: {len(english_words)} words")
+
+    table.add(words + rubric_words + english_words)
+    print(f"{len(table)} words in {table.path}")
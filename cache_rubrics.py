@@ -20,7 +20,7 @@ class Rubric(BaseModel):
 class Rubrics(BaseModel):
     rubrics: List[Rubric] = Field(description="List of rubrics for grading student rationales.")
 
-def get_user_content(problem: dict, page_images: list) -> List[dict]:
+def get_user_content(problem: dict, page_images: list, model_name: str = None) -> List[dict]:
     user_content = [{
         "type": "text",
         "text": f"""Please tailor the rubrics to evaluate student written rationales for their choice to the multiple-choice problem by incorporating knowledge needed for the problem. 
@@ -28,9 +28,9 @@ I will give you the problem, rubrics, and seven images. The first image is the s
 
 Problem: {problem["problem"]}"""}]
     for img in problem["images"]:
-        user_content.append(image_content(img))
+        user_content.append(image_content(img, model_name))
     for img in page_images:
-        user_content.append(image_content(img))
+        user_content.append(image_content(img, model_name))
     return user_content
 
 def generate_rubrics(problem: dict,
@@ -58,7 +58,7 @@ def generate_rubrics(problem: dict,
                 last_page=page,
                 paths_only=True
             ))
-        user_content = get_user_content(problem, page_images)
+        user_content = get_user_content(problem, page_images, model_name)
      
         user_content[0]["text"] += f"\n\nRubrics:\n{formatted_rubrics}"
         messages = [{
@@ -1,11 +1,69 @@
+from typing import Iterable, Iterator, Optional
 from langchain_core.language_models.chat_models import BaseChatModel
+from llm_telemetry import call_site
 
-def response_generator(model: BaseChatModel, messages: list) -> str:
+THINK_START, THINK_END = "<think>", "</think>"
+# Models whose replies may start inside a reasoning block opened by their chat template
+REASONING_MODELS = ("deepseek-r1",)
+THINK_HOLD_CHARS = 200
+
+def _partial_tag(text: str, tag: str) -> int:
+    """
+    Returns the length of the longest end of text that starts tag.
+    """
+    for n in range(min(len(text), len(tag) - 1), 0, -1):
+        if text.endswith(tag[:n]):
+            return n
+    return 0
+
+def strip_think(chunks: Iterable[str], max_hold: Optional[int] = None) -> Iterator[str]:
+    """
+    Removes the <think>...</think> blocks of reasoning models from streamed text as it arrives.
+    The chat template of a model may open the block itself, so a reply can start inside it
+    and only close it: until a tag is seen, the text is held back, and everything before a
+    </think> with no <think> before it is reasoning. Text without any tag is released at the
+    end of the stream, or once more than max_hold characters arrived (None: at the end only).
+    Text that may be the start of a tag is held back until the next chunk.
+    """
+    buffer, thinking, started, decided = "", False, False, False
+    for chunk in chunks:
+        buffer += chunk
+        if not decided:
+            start, end = buffer.find(THINK_START), buffer.find(THINK_END)
+            if end >= 0 and (start < 0 or end < start):
+                # The reply started inside the reasoning block
+                buffer = buffer[end + len(THINK_END):]
+            elif start < 0 and (max_hold is None or len(buffer) <= max_hold):
+                continue
+            decided = True
+        while True:
+            tag = THINK_END if thinking else THINK_START
+            index = buffer.find(tag)
+            end = index if index >= 0 else len(buffer) - _partial_tag(buffer, tag)
+            if not thinking:
+                text = buffer[:end] if started else buffer[:end].lstrip()
+                if text:
+                    started = True
+                    yield text
+            if index < 0:
+                buffer = buffer[end:]
+                break
+            buffer = buffer[index + len(tag):]
+            thinking = not thinking
+    if not thinking and buffer.strip():
+        yield buffer if started else buffer.lstrip()
+
+def response_generator(model: BaseChatModel, messages: list) -> Iterator[str]:
     """
-    Streamed response emulator
+    Streams the visible text of the model's reply, without its reasoning.
     """
-    response = model.invoke(messages)
-    return response.content.split("</think>")[-1]
+    model_name = getattr(model, "model_name", None) or getattr(model, "model", "")
+    # The reply of a reasoning model is held back until its reasoning is closed;
+    # other models only get a few tokens to open a block
+    max_hold = None if model_name in REASONING_MODELS else THINK_HOLD_CHARS
+    with call_site("chat"):
+        for chunk in strip_think((chunk.content for chunk in model.stream(messages)), max_hold):
+            yield chunk
 
 def _write_scores(criterion, details, prefix="") -> str:
     scores = f"\n{prefix}**Criterion:** {criterion}"
@@ -0,0 +1,15 @@
+import os
+from domain_information import PROBLEMS
+from utils import read_rubrics
+from grading_system.grading_utils import get_grading_system
+
+if __name__ == "__main__":
+    # Precompile the rubric of every problem for the "similarity" grading method
+    grading_system = get_grading_system("similarity")
+    for problem_name in PROBLEMS:
+        rubric_path = os.path.join("./problems", problem_name, "rubrics.jsonl")
+        if not os.path.exists(rubric_path):
+            print(f"Skipping {problem_name}: run cache_rubrics.py first")
+            continue
+        print(f"Compiling rubrics for {problem_name}...")
+        grading_system.prepare_rubric(read_rubrics(rubric_path), problem_name)
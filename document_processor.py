@@ -2,14 +2,15 @@ from typing import Dict, List
 import os
 import re
 import tempfile
+import threading
 import jsonlines
 from pypdf import PdfReader
 from docx import Document
-from pdf2image import convert_from_path
 from pydantic import BaseModel, Field
 from llm_utils import get_model, image_content
+from llm_calls import get_caller
+from llm_telemetry import call_site
 from domain_information import PROBLEMS, TEXT_PATH, INDEX_NAME
-from retriever.TextRetrieverConcepts import TextRetrieverConcepts
 
 class Label(BaseModel):
     desctiption: str = Field(description="The characterisics of student rationales that are considered as this label (high, medium, low, or very low). This new description must contain domain knowledge identifed in previous steps.")
@@ -89,8 +90,11 @@ class RubricProcessor(DocumentProcessor):
 
     def __init__(self):
         super().__init__()
-        llm = get_model("qwen2.5vl")
-        self.llm = llm.with_structured_output(Rubrics)
+        self.model_name = "qwen2.5vl"
+        # The model is only created when a rubric is modified
+        self._llm = None
+        self._llm_lock = threading.Lock()
+        self.caller = get_caller(self.model_name)
         
         # Define patterns for identifying rubric sections
         self.section_patterns = [
@@ -102,7 +106,17 @@ class RubricProcessor(DocumentProcessor):
         ]
         self.retriever = None
     
+    @property
+    def llm(self):
+        """Structured-output model of the rubrics, created on first use"""
+        with self._llm_lock:
+            if self._llm is None:
+                self._llm = get_model(self.model_name).with_structured_output(Rubrics)
+            return self._llm
+    
     def set_retriever(self, model_name, text_path, index_root, index_name):
+        # Imports torch and byaldi, which only the modified rubrics need
+        from retriever.TextRetrieverConcepts import TextRetrieverConcepts
         self.retriever = TextRetrieverConcepts(model_name, text_path, index_root, index_name)
         
     def _extract_points(self, section: str):
@@ -247,12 +261,13 @@ class RubricProcessor(DocumentProcessor):
 I will give you the problem, rubrics, and seven images. The first image is the system diagram of the problem, the second image contains the choices, and the remaining images are textbook pages that may contain knowledge helpful to solve the problem.
 Problem: {problem["problem"]}"""}]
         for img in problem["images"]:
-            user_content.append(image_content(img))
+            user_content.append(image_content(img, self.model_name))
         for img in page_images:
-            user_content.append(image_content(img))
+            user_content.append(image_content(img, self.model_name))
         return user_content
     
     def _modify_rubric(self, text: str, problem_name: str) -> str:
+        from pdf2image import convert_from_path
         problem = PROBLEMS[problem_name]
         model_name = "qwen2.5vl"
         index_root = "./index"
@@ -295,7 +310,8 @@ Problem: {problem["problem"]}"""}]
                             "content": user_content
                         }]
                         print(messages)
-                        response = self.llm.invoke(messages).rubric
+                        with call_site("rubric", problem=problem_name):
+                            response = self.caller.invoke(self.llm, messages).rubric
                         modified_text += f"{i+1}. {response}\n"
 
         print(modified_text)
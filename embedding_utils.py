@@ -0,0 +1,334 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_PATH = "./cache/embeddings.sqlite"
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embedding cache keyed by (model name, text) in front of an Embeddings instance.
+    It has an in-memory LRU tier and an on-disk SQLite tier that survives restarts.
+    Both tiers evict the least recently used entries when they exceed their size.
+    """
+    def __init__(self,
+                 embeddings: Embeddings,
+                 model_name: str,
+                 cache_path: Optional[str] = EMBEDDING_CACHE_PATH,
+                 memory_size: int = 20000,
+                 max_disk_bytes: int = 512 * 2**20):
+        """
+        Args:
+            embeddings: Embeddings instance to cache
+            model_name: Name of the embedding model, part of the cache key
+            cache_path: Path to the SQLite file, or None to keep only the memory tier
+            memory_size: Maximum number of embeddings kept in memory
+            max_disk_bytes: Maximum total size of the embeddings stored on disk
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.memory_size = memory_size
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+        }
+        self._conn = None
+        if cache_path is not None:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(cache_path, timeout=30, check_same_thread=False)
+            # WAL lets several processes (e.g., Streamlit sessions and grade_all) share the file
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, "
+                "size INTEGER NOT NULL, last_access REAL NOT NULL, PRIMARY KEY (model, text))")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+            # Total size of the entries, kept by triggers in the transaction of each write, so that
+            # writes do not sum the whole table. Seeded after the triggers exist, from the current rows
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings_size (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)")
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS embeddings_size_insert AFTER INSERT ON embeddings "
+                "BEGIN UPDATE embeddings_size SET size = size + NEW.size; END")
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS embeddings_size_update AFTER UPDATE OF size ON embeddings "
+                "BEGIN UPDATE embeddings_size SET size = size + NEW.size - OLD.size; END")
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS embeddings_size_delete AFTER DELETE ON embeddings "
+                "BEGIN UPDATE embeddings_size SET size = size - OLD.size; END")
+            self._conn.execute(
+                "INSERT OR IGNORE INTO embeddings_size (id, size) SELECT 0, COALESCE(SUM(size), 0) FROM embeddings")
+            self._conn.commit()
+
+    def _remember(self, text: str, vector: np.ndarray):
+        self._memory[text] = vector
+        self._memory.move_to_end(text)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self._counters['memory_evictions'] += 1
+
+    def _disk_lookup(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        if self._conn is None or not texts:
+            return found
+        # Stay below SQLite's limit on the number of query parameters
+        for start in range(0, len(texts), 500):
+            chunk = texts[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT text, vector FROM embeddings WHERE model = ? AND text IN ({','.join('?' * len(chunk))})",
+                [self.model_name, *chunk]).fetchall()
+            for text, blob in rows:
+                found[text] = np.frombuffer(blob, dtype=np.float32)
+        if found:
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE model = ? AND text = ?",
+                [(now, self.model_name, text) for text in found])
+            self._conn.commit()
+        return found
+
+    def _disk_store(self, vectors: Dict[str, np.ndarray]):
+        if self._conn is None or not vectors:
+            return
+        now = time.time()
+        # An upsert rather than INSERT OR REPLACE, whose implicit delete does not fire the size trigger
+        self._conn.executemany(
+            "INSERT INTO embeddings (model, text, vector, size, last_access) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (model, text) DO UPDATE SET vector = excluded.vector, size = excluded.size, "
+            "last_access = excluded.last_access",
+            [(self.model_name, text, vector.tobytes(), vector.nbytes + len(text.encode("utf-8")), now)
+             for text, vector in vectors.items()])
+        total = self._conn.execute("SELECT size FROM embeddings_size").fetchone()[0]
+        if total > self.max_disk_bytes:
+            # Evict the least recently used entries down to 90% of the budget
+            excess = total - int(self.max_disk_bytes * 0.9)
+            victims = []
+            for rowid, size in self._conn.execute("SELECT rowid, size FROM embeddings ORDER BY last_access"):
+                if excess <= 0:
+                    break
+                victims.append((rowid,))
+                excess -= size
+            self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", victims)
+            self._counters['disk_evictions'] += len(victims)
+        self._conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds texts, computing only the ones found in neither tier in a single batch.
+        """
+        with self._lock:
+            vectors: Dict[str, np.ndarray] = {}
+            for text in texts:
+                if text in self._memory:
+                    self._memory.move_to_end(text)
+                    vectors[text] = self._memory[text]
+            self._counters['memory_hits'] += sum(1 for text in texts if text in vectors)
+
+            missing = list(dict.fromkeys(text for text in texts if text not in vectors))
+            found = self._disk_lookup(missing)
+            self._counters['disk_hits'] += sum(1 for text in texts if text in found)
+            for text, vector in found.items():
+                self._remember(text, vector)
+            vectors.update(found)
+
+            missing = [text for text in missing if text not in found]
+            self._counters['misses'] += sum(1 for text in texts if text not in vectors)
+        if missing:
+            computed = np.asarray(self.embeddings.embed_documents(missing), dtype=np.float32)
+            with self._lock:
+                new_vectors = dict(zip(missing, computed))
+                for text, vector in new_vectors.items():
+                    self._remember(text, vector)
+                self._disk_store(new_vectors)
+                vectors.update(new_vectors)
+        return [vectors[text].tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def _tokenizer(self) -> Tuple[Any, int]:
+        """
+        Returns the tokenizer of the model and its maximum number of tokens per text.
+        """
+        if isinstance(self.embeddings, OnnxEmbeddings):
+            return self.embeddings.tokenizer, self.embeddings.max_length
+        # sentence_transformers.SentenceTransformer of HuggingFaceEmbeddings
+        client = self.embeddings._client
+        return client.tokenizer, client.max_seq_length
+
+    @property
+    def max_text_tokens(self) -> int:
+        """Maximum number of tokens of a text without the special tokens; the model truncates longer texts"""
+        tokenizer, max_length = self._tokenizer()
+        return max_length - tokenizer.num_special_tokens_to_add()
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        Returns the number of model tokens of each text, without the special tokens.
+        """
+        tokenizer, _ = self._tokenizer()
+        return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the hit, miss and eviction counters of this process
+        and the current size of each tier.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_entries'] = len(self._memory)
+            if self._conn is not None:
+                entries, size = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+                stats['disk_entries'] = entries
+                stats['disk_bytes'] = size
+        return stats
+
+def mean_pooling(hidden_states: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """
+    Mean of the token embeddings over the attention mask, L2-normalized,
+    as in the sentence-transformers pipeline of all-mpnet-base-v2.
+    """
+    mask = attention_mask[..., None].astype(np.float32)
+    pooled = (hidden_states * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+def export_quantized_onnx(model_name: str, model_dir: str = "./models") -> str:
+    """
+    Exports a Hugging Face encoder to ONNX and quantizes its weights to int8
+    (dynamic quantization). The export is done once and reused afterwards.
+    Args:
+        model_name: Name of the Hugging Face model
+        model_dir: Directory to store the exported models in
+    Returns:
+        Path to the quantized ONNX model
+    """
+    output_dir = os.path.join(model_dir, model_name.replace("/", "--"))
+    quantized_path = os.path.join(output_dir, "model_int8.onnx")
+    if os.path.exists(quantized_path):
+        return quantized_path
+
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(output_dir, exist_ok=True)
+    onnx_path = os.path.join(output_dir, "model.onnx")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    inputs = tokenizer(["An example sentence."], return_tensors="pt")
+    with torch.inference_mode():
+        torch.onnx.export(
+            model,
+            (inputs["input_ids"], inputs["attention_mask"]),
+            onnx_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=17,
+        )
+    quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(output_dir)
+    return quantized_path
+
+class OnnxEmbeddings(Embeddings):
+    """
+    CPU-only embeddings from an int8-quantized ONNX export of a sentence-transformers
+    model, run with onnxruntime instead of PyTorch.
+    """
+    def __init__(self,
+                 model_name: str,
+                 model_dir: str = "./models",
+                 intra_op_threads: Optional[int] = None,
+                 batch_size: int = 32,
+                 max_length: int = 384):
+        """
+        Args:
+            model_name: Name of the Hugging Face model, exported on first use
+            model_dir: Directory to store the exported models in
+            intra_op_threads: Threads used inside each operator, None to let onnxruntime decide
+            batch_size: Number of texts per forward pass
+            max_length: Maximum number of tokens per text (384 for all-mpnet-base-v2)
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = export_quantized_onnx(model_name, model_dir)
+        options = ort.SessionOptions()
+        if intra_op_threads is not None:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(os.path.dirname(model_path))
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            inputs = self.tokenizer(texts[start:start + self.batch_size], padding=True, truncation=True,
+                                    max_length=self.max_length, return_tensors="np")
+            hidden_states = self.session.run(None, {name: inputs[name].astype(np.int64) for name in self.input_names})[0]
+            embeddings.append(mean_pooling(hidden_states, inputs["attention_mask"]))
+        if not embeddings:
+            return []
+        return np.vstack(embeddings).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+def get_embeddings(model_name: str,
+                   backend: str = "torch",
+                   device: str = "cpu",
+                   batch_size: int = 64,
+                   intra_op_threads: Optional[int] = None,
+                   cache_path: Optional[str] = EMBEDDING_CACHE_PATH) -> CachedEmbeddings:
+    """
+    Returns the cached embeddings of a sentence-transformers model.
+    Args:
+        model_name: Name of the Hugging Face model
+        backend: "torch" to run the model with PyTorch, or "onnx" to run its
+            int8-quantized ONNX export with onnxruntime on CPU
+        device: Device of the torch backend
+        batch_size: Number of texts per forward pass
+        intra_op_threads: Threads used inside each operator by the onnx backend
+        cache_path: Path to the on-disk embedding cache, or None to keep only the memory tier
+    Returns:
+        CachedEmbeddings keyed by the model name and backend
+    """
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        embeddings = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={'device': device},
+            encode_kwargs={'batch_size': batch_size}
+        )
+        # Keep the historical cache key of the torch backend
+        cache_name = model_name
+    elif backend == "onnx":
+        embeddings = OnnxEmbeddings(model_name, intra_op_threads=intra_op_threads, batch_size=batch_size)
+        cache_name = f"{model_name}:onnx-int8"
+    else:
+        raise NotImplementedError(f"Embedding backend {backend} is not supported.")
+    return CachedEmbeddings(embeddings, model_name=cache_name, cache_path=cache_path)
+
+if __name__ == "__main__":
+    with sqlite3.connect(EMBEDDING_CACHE_PATH) as conn:
+        for model, entries, size in conn.execute(
+                "SELECT model, COUNT(*), SUM(size) FROM embeddings GROUP BY model"):
+            print(f"{model}: {entries} embeddings, {size / 2**20:.1f} MiB")
@@ -35,14 +35,19 @@ def main():
     for rubric_path in rubrics:
         path = os.path.join("../samples/results/", os.path.basename(rubric_path).split('.')[0] + ".xlsx")
         if not os.path.exists(path):
+            # Grade every assignment with one batch per method
+            results_by_method = []
+            for method in methods:
+                grading_system = get_grading_system(method)
+                rubric_items = grading_system.rubric_processor.extract_rubric(rubric_path)
+                assignment_texts = [grading_system.doc_processor.process_document(p) for p in assignments]
+                results_by_method.append(grading_system.grade_batch(assignment_texts, rubric_items))
+            
             data = []
-            for final_assignment_path in assignments:
+            for j, final_assignment_path in enumerate(assignments):
                 assignment_data = [os.path.basename(final_assignment_path)]
-                results = []
+                results = [method_results[j] for method_results in results_by_method]
                 columns = [("", "", "Name")]
-                for method in methods:
-                    grading_system = get_grading_system(method)
-                    results.append(grading_system.grade_assignment(final_assignment_path, rubric_path))
                 
                 result = results[0]
                 criteria = []
@@ -1,152 +1,93 @@
-from typing import Dict, Tuple
-from spellchecker import SpellChecker
-from textblob import TextBlob
-import spacy
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 from document_processor import AssignmentProcessor, RubricProcessor
+from GrammarChecker import GrammarChecker
+from ParsedAssignment import ParsedAssignment
+from SpellingSuggester import SpellingSuggester, domain_spell_checker, load_domain_vocabulary
+
+DOMAIN_VOCABULARY_PATH = "./index/spelling/domain_vocabulary.txt"
 
 class GradingSystem:
     """
     A superclass of grading systems that handle rubric-based grading and grammar checking.
     """
+    max_concurrency: int = 1
+    """Maximum number of rubric items scored at the same time by _get_score"""
+    lowercase_features: bool = False
+    """Whether the word features of assignments come from a second parse of the lowercased text"""
+    
     def __init__(self):
         self.doc_processor = AssignmentProcessor()
         self.rubric_processor = RubricProcessor()
-        self.spell = SpellChecker()
-        self.nlp = spacy.load('en_core_web_sm')
+        # spaCy and the spell checker are loaded on first use, so a grading system starts
+        # without them (see benchmarks/bench_startup.py)
+        self._nlp = None
+        self._spell = None
+        self._speller = None
+        self._grammar_checker = None
+        self._lazy_lock = threading.RLock()
+    
+    @property
+    def nlp(self):
+        """spaCy pipeline, loaded on first use"""
+        with self._lazy_lock:
+            if self._nlp is None:
+                import spacy
+                # Named entities are not used by any grader
+                self._nlp = spacy.load('en_core_web_sm', disable=['ner'])
+            return self._nlp
+    
+    @property
+    def spell(self):
+        """Spell checker with the domain vocabulary, loaded on first use"""
+        with self._lazy_lock:
+            if self._spell is None:
+                # The vocabulary is built offline by build_spelling.py, not in a grading request
+                self._spell = domain_spell_checker(load_domain_vocabulary(DOMAIN_VOCABULARY_PATH))
+            return self._spell
+    
+    @property
+    def speller(self) -> SpellingSuggester:
+        """Spelling suggestions of the spell checker"""
+        with self._lazy_lock:
+            if self._speller is None:
+                self._speller = SpellingSuggester(self.spell)
+            return self._speller
+    
+    @property
+    def grammar_checker(self) -> GrammarChecker:
+        """Grammar and spelling checker"""
+        with self._lazy_lock:
+            if self._grammar_checker is None:
+                self._grammar_checker = GrammarChecker(self.spell, self.speller)
+            return self._grammar_checker
+    
+    def parse_assignment(self, text: str) -> ParsedAssignment:
+        """
+        Parses the assignment once so that every scorer can share the result.
+        Args:
+            text: Text of the assignment
+        Returns:
+            ParsedAssignment of the text
+        """
+        features_doc = self.nlp(text.lower()) if self.lowercase_features else None
+        return ParsedAssignment.from_doc(text, self.nlp(text), features_doc)
     
-    def check_grammar(self, text: str) -> Tuple[float, Dict]:
+    def check_grammar(self, assignment: Union[ParsedAssignment, str]) -> Tuple[float, Dict]:
         """
         Checks grammar and spelling in the text.
         Args:
-            text: Text to check
+            assignment: Parsed assignment (or raw text) to check
         Returns:
             Tuple of (score, feedback dictionary)
         """
         try:
-            # Process text with spaCy
-            doc = self.nlp(text)
-            
-            # Count words and sentences
-            words = [token.text.lower() for token in doc if not token.is_punct and not token.is_space]
-            word_count = len(words)
-            sentences = list(doc.sents)
-            sentence_count = len(sentences)
-            
-            if sentence_count == 0 or word_count == 0:
-                return 0, {"errors": [], "feedback": "No valid text found"}
-            
-            # Spell check
-            misspelled = list(self.spell.unknown(words))
-            spelling_errors = len(misspelled)
-            
-            # Grammar and analysis using TextBlob
-            blob = TextBlob(text)
-            
-            error_categories = {
-                'spelling': spelling_errors,
-                'grammar': 0,
-                'punctuation': 0
-            }
-            
-            grammar_issues = []
-            correct_sentences = 0
-            
-            # Analyze each sentence
-            for sent in sentences:
-                sent_text = str(sent).strip()
-                sent_doc = self.nlp(sent_text)
-                
-                sentence_errors = 0
-                
-                # Check basic sentence structure
-                has_subject = False
-                has_verb = False
-                has_proper_case = sent_text[0].isupper() if sent_text else False
-                has_end_punct = sent_text[-1] in '.!?' if sent_text else False
-                
-                for token in sent_doc:
-                    if token.dep_ in ['nsubj', 'nsubjpass']:
-                        has_subject = True
-                    if token.pos_ == 'VERB':
-                        has_verb = True
-                
-                # Grammar checks
-                if not (has_subject and has_verb):
-                    error_categories['grammar'] += 1
-                    sentence_errors += 1
-                    grammar_issues.append({
-                        'error_type': 'Sentence Structure',
-                        'message': f'Missing subject or verb in: "{sent_text}"',
-                        'suggestion': 'Ensure sentence has both subject and verb'
-                    })
-                
-                if not has_proper_case:
-                    error_categories['grammar'] += 1
-                    sentence_errors += 1
-                    grammar_issues.append({
-                        'error_type': 'Capitalization',
-                        'message': f'Sentence should start with capital letter: "{sent_text}"',
-                        'suggestion': f'Change to: "{sent_text[0].upper() + sent_text[1:]}"'
-                    })
-                
-                if not has_end_punct:
-                    error_categories['punctuation'] += 1
-                    sentence_errors += 1
-                    grammar_issues.append({
-                        'error_type': 'Missing Punctuation',
-                        'message': f'Sentence missing end punctuation: "{sent_text}"',
-                        'suggestion': 'Add appropriate end punctuation (. ! ?)'
-                    })
-                
-                if sentence_errors == 0:
-                    correct_sentences += 1
-            
-            # Add spelling suggestions
-            for word in misspelled:
-                grammar_issues.append({
-                    'error_type': 'Spelling',
-                    'message': f'Misspelled word: "{word}"',
-                    'suggestion': f'Suggestions: {", ".join(self.spell.candidates(word))}'
-                })
-            
-            # Calculate scores
-            if word_count <= 20:  # Short text adjustments
-                base_spelling_score = max(0.4, 1 - (spelling_errors / word_count * 2))
-                base_grammar_score = max(0.4, correct_sentences / sentence_count)
-                base_punct_score = max(0.4, 1 - (error_categories['punctuation'] / sentence_count))
-            else:  # Normal scoring for longer texts
-                base_spelling_score = max(0, 1 - (spelling_errors / word_count * 2))
-                base_grammar_score = max(0, 1 - (error_categories['grammar'] / sentence_count))
-                base_punct_score = max(0, 1 - (error_categories['punctuation'] / sentence_count))
-            
-            # Calculate final score
-            final_score = (
-                base_spelling_score * 0.3 +
-                base_grammar_score * 0.5 +
-                base_punct_score * 0.2
-            )
-            
-            if correct_sentences > 0:
-                final_score = max(0.4, final_score)
-            
-            feedback = {
-                'errors': grammar_issues,
-                'statistics': {
-                    'word_count': word_count,
-                    'sentence_count': sentence_count,
-                    'correct_sentences': correct_sentences,
-                    'words_per_sentence': round(word_count/sentence_count if sentence_count else 0, 1),
-                    'total_errors': len(grammar_issues),
-                    'error_categories': error_categories
-                },
-                'component_scores': {
-                    'spelling': round(base_spelling_score, 2),
-                    'grammar': round(base_grammar_score, 2),
-                    'punctuation': round(base_punct_score, 2)
-                }
-            }
-            
-            return round(final_score, 2), feedback
+            if isinstance(assignment, str):
+                assignment = self.parse_assignment(assignment)
+            # Every check reads from the single parse of the assignment
+            return self.grammar_checker.check(assignment.doc)
             
         except Exception as e:
             raise Exception(f"Error in grammar checking: {str(e)}")
@@ -167,12 +108,20 @@ class GradingSystem:
         
         return results
     
-    def _get_score(self, item: Dict, assignment_text: str) -> Dict:
+    def prepare_rubric(self, rubric_items: List[Dict], problem_name: str = None):
+        """
+        Hook for subclasses to precompute rubric-side work once per rubric.
+        Args:
+            rubric_items: Rubric items extracted by the rubric processor
+            problem_name: Name of the problem the rubric is tailored to, if any
+        """
+    
+    def _get_score(self, item: Dict, assignment: ParsedAssignment) -> Dict:
         """
         To be impremented by subclasses to calculate score based on item criteria.
         Args:
             item: Rubric item containing criteria and description
-            assignment_text: Text of the assignment to grade
+            assignment: Parsed assignment to grade
         Returns:
             Dictionary containing five fields:
             - description: Description of the rubric item
@@ -183,6 +132,150 @@ class GradingSystem:
         """
         raise NotImplementedError("This method should be implemented by subclasses")
     
+    def _iter_scores(self, assignment: ParsedAssignment, items: List[Dict]) -> Iterator[Tuple[int, Dict]]:
+        """
+        Scores rubric items with _get_score, up to max_concurrency at a time.
+        Args:
+            assignment: Parsed assignment to grade
+            items: Rubric items and sub-items to score
+        Returns:
+            Iterator of (index of the item, result of _get_score) in order of completion
+        """
+        if self.max_concurrency <= 1 or len(items) <= 1:
+            for i, item in enumerate(items):
+                yield i, self._get_score(item, assignment)
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(items))) as executor:
+            # Each item runs in a copy of the caller's context, so context variables reach the threads
+            futures = {executor.submit(copy_context().run, self._get_score, item, assignment): i
+                       for i, item in enumerate(items)}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+    
+    def _score_items(self, assignment: ParsedAssignment, items: List[Dict]) -> List[Dict]:
+        """
+        Scores rubric items with _get_score, up to max_concurrency at a time.
+        Args:
+            assignment: Parsed assignment to grade
+            items: Rubric items and sub-items to score
+        Returns:
+            Results of _get_score for each item, in order
+        """
+        scores = [None] * len(items)
+        for i, score in self._iter_scores(assignment, items):
+            scores[i] = score
+        return scores
+    
+    def parse_assignments(self, texts: List[str]) -> List[ParsedAssignment]:
+        """
+        Parses several assignments in one spaCy batch.
+        Args:
+            texts: Texts of the assignments
+        Returns:
+            ParsedAssignment of each text, in order
+        """
+        docs = list(self.nlp.pipe(texts))
+        if not self.lowercase_features:
+            return [ParsedAssignment.from_doc(text, doc) for text, doc in zip(texts, docs)]
+        features_docs = self.nlp.pipe(text.lower() for text in texts)
+        return [ParsedAssignment.from_doc(text, doc, features_doc)
+                for text, doc, features_doc in zip(texts, docs, features_docs)]
+    
+    @staticmethod
+    def _is_grammar_item(item: Dict) -> bool:
+        # Grammar-related criteria are scored by the grammar checker
+        return 'grammar' in item['criteria'].lower() or 'spelling' in item['criteria'].lower()
+    
+    def _total_points(self, rubric_items: List[Dict]) -> float:
+        """
+        Validates the rubric and returns its total points.
+        """
+        if not rubric_items:
+            raise ValueError("No criteria extracted from rubric")
+        
+        total_points_possible = sum(item['points'] for item in rubric_items)
+        if total_points_possible <= 0:
+            raise ValueError("Total points must be greater than 0")
+        return total_points_possible
+    
+    def rubric_jobs(self, rubric_items: List[Dict]) -> List[Dict]:
+        """
+        Returns the criteria and sub-criteria scored by _get_score, in grading order.
+        """
+        jobs = []
+        for item in rubric_items:
+            if not self._is_grammar_item(item):
+                jobs.extend(item['sub_criteria'] if len(item['sub_criteria']) > 0 else [item])
+        return jobs
+    
+    def _grade_rubric(self, assignment: ParsedAssignment, rubric_items: List[Dict],
+                      job_scores: Optional[List[Dict]] = None) -> Dict:
+        """
+        Grades a parsed assignment on every rubric item.
+        Args:
+            assignment: Parsed assignment to grade
+            rubric_items: Rubric items extracted by the rubric processor
+            job_scores: Results of _get_score for each item of rubric_jobs, if already
+                computed (e.g., by a batch job); scored here otherwise
+        Returns:
+            Dictionary containing grading results
+        """
+        total_points_possible = self._total_points(rubric_items)
+        
+        # Score every criterion and sub-criterion first, so that they can run concurrently
+        if job_scores is None:
+            job_scores = self._score_items(assignment, self.rubric_jobs(rubric_items))
+        job_scores = iter(job_scores)
+        
+        # Calculate scores for each criterion
+        scores = {}
+        earned_points = 0
+        
+        for item in rubric_items:
+            if self._is_grammar_item(item):
+                # Use grammar checker for grammar-related criteria
+                similarity, feedback = self.check_grammar(assignment)
+                score = similarity * item['points']
+                scores[item['criteria']] = {
+                    'description': item['description'],
+                    'max_points': item['points'],
+                    'similarity': similarity,
+                    'score': score,
+                    'feedback': feedback
+                }
+            else:
+                # Enhanced content scoring
+                if len(item['sub_criteria']) > 0:
+                    sub_scores = {}
+                    for sub_item in item['sub_criteria']:
+                        sub_scores[sub_item['criteria']] = next(job_scores)
+                    score = {
+                        'description': item['description'],
+                        'max_points': item['points'],
+                        'score': sum(sub_score['score'] for sub_score in sub_scores.values()),
+                        'word_count': assignment.word_count,
+                        'sub_scores': sub_scores
+                    }
+                    if 'similarity' in sub_scores[item['sub_criteria'][0]['criteria']]:
+                        score['similarity'] = sum(sub_score['similarity'] for sub_score in sub_scores.values()) / len(sub_scores)
+                else:
+                    score = next(job_scores)
+                    score['sub_scores'] = []
+                
+                scores[item['criteria']] = score
+            
+            earned_points += scores[item['criteria']]['score']
+        
+        final_grade = earned_points / total_points_possible
+        
+        return {
+            'criteria_scores': scores,
+            'final_grade': final_grade,
+            'total_points_possible': total_points_possible,
+            'total_points_earned': earned_points,
+            'assignment_text': assignment.text,
+        }
+    
     def grade_assignment(self, assignment_path: str, rubric_path: str, problem_name: str = None) -> Dict:
         """
         Grades an assignment based on the provided rubric.
@@ -197,6 +290,7 @@ class GradingSystem:
             assignment_text = self.doc_processor.process_document(assignment_path)
             if not assignment_text.strip():
                 raise ValueError("No text extracted from assignment")
+            assignment = self.parse_assignment(assignment_text)
             
             # Process rubric
             if problem_name:
@@ -204,61 +298,88 @@ class GradingSystem:
             else:
                 modify_rubric = False
             rubric_items = self.rubric_processor.extract_rubric(rubric_path, problem_name, modify_rubric)
-            if not rubric_items:
-                raise ValueError("No criteria extracted from rubric")
-            
-            total_points_possible = sum(item['points'] for item in rubric_items)
-            if total_points_possible <= 0:
-                raise ValueError("Total points must be greater than 0")
-            
-            # Calculate scores for each criterion
-            scores = {}
-            earned_points = 0
-            
-            for item in rubric_items:
-                if 'grammar' in item['criteria'].lower() or 'spelling' in item['criteria'].lower():
-                    # Use grammar checker for grammar-related criteria
-                    similarity, feedback = self.check_grammar(assignment_text)
-                    score = similarity * item['points']
-                    scores[item['criteria']] = {
-                        'description': item['description'],
-                        'max_points': item['points'],
-                        'similarity': similarity,
-                        'score': score,
-                        'feedback': feedback
-                    }
-                else:
-                    # Enhanced content scoring
-                    if len(item['sub_criteria']) > 0:
-                        sub_scores = {}
-                        for sub_item in item['sub_criteria']:
-                            sub_scores[sub_item['criteria']] = self._get_score(sub_item, assignment_text)
-                        score = {
-                            'description': item['description'],
-                            'max_points': item['points'],
-                            'score': sum(sub_score['score'] for sub_score in sub_scores.values()),
-                            'word_count': len(assignment_text.split()),
-                            'sub_scores': sub_scores
-                        }
-                        if 'similarity' in sub_scores[item['sub_criteria'][0]['criteria']]:
-                            score['similarity'] = sum(sub_score['similarity'] for sub_score in sub_scores.values()) / len(sub_scores)
-                    else:
-                        score = self._get_score(item, assignment_text)
-                        score['sub_scores'] = []
-                    
-                    scores[item['criteria']] = score
-                
-                earned_points += scores[item['criteria']]['score']
+            self._total_points(rubric_items)
+            self.prepare_rubric(rubric_items, problem_name)
             
-            final_grade = earned_points / total_points_possible
+            return self._grade_rubric(assignment, rubric_items)
             
-            return {
-                'criteria_scores': scores,
-                'final_grade': final_grade,
-                'total_points_possible': total_points_possible,
-                'total_points_earned': earned_points,
-                'assignment_text': assignment_text,
-            }
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"Error grading assignment: {str(e)}")
+    
+    def grade_assignment_stream(self, assignment_path: str, rubric_path: str, problem_name: str = None) -> Iterator[Dict]:
+        """
+        Grades an assignment like grade_assignment, yielding the result of each criterion
+        and sub-criterion as soon as it is scored.
+        Args:
+            assignment_path: Path to the assignment file
+            rubric_path: Path to the rubric file
+            problem_name: Name of the problem the rubric is tailored to, if any
+        Returns:
+            Iterator of events:
+            - {'type': 'criterion', 'criterion': ..., 'sub_criterion': ... or None, 'result': ...}
+              for each item scored by _get_score, in order of completion
+            - {'type': 'final', 'results': ...} with the results of grade_assignment, last
+        """
+        try:
+            assignment_text = self.doc_processor.process_document(assignment_path)
+            if not assignment_text.strip():
+                raise ValueError("No text extracted from assignment")
+            assignment = self.parse_assignment(assignment_text)
             
+            rubric_items = self.rubric_processor.extract_rubric(rubric_path, problem_name, bool(problem_name))
+            self._total_points(rubric_items)
+            self.prepare_rubric(rubric_items, problem_name)
         except FileNotFoundError as e:
-            raise FileNotFoundError(f"Error grading assignment: {str(e)}")
\ No newline at end of file
+            raise FileNotFoundError(f"Error grading assignment: {str(e)}")
+        
+        jobs = self.rubric_jobs(rubric_items)
+        # Criterion of each sub-criterion, to label the events
+        parents = {id(sub_item): item['criteria'] for item in rubric_items for sub_item in item['sub_criteria']}
+        owners = [(parents[id(job)], job['criteria']) if id(job) in parents else (job['criteria'], None)
+                  for job in jobs]
+        
+        job_scores = [None] * len(jobs)
+        for i, score in self._iter_scores(assignment, jobs):
+            job_scores[i] = score
+            yield {'type': 'criterion', 'criterion': owners[i][0], 'sub_criterion': owners[i][1], 'result': score}
+        # Grammar criteria are scored locally when the results are assembled
+        yield {'type': 'final', 'results': self._grade_rubric(assignment, rubric_items, job_scores)}
+    
+    def grade_batch(self, assignment_texts: List[str], rubric_items: List[Dict], problem_name: str = None) -> List[Dict]:
+        """
+        Grades many assignments against one rubric.
+        Args:
+            assignment_texts: Texts of the assignments
+            rubric_items: Rubric items extracted by the rubric processor
+            problem_name: Name of the problem the rubric is tailored to, if any
+        Returns:
+            List of grading results with the same structure as grade_assignment, in order.
+            Assignments with no text score 0 on every criterion and have an 'error'
+        """
+        self._total_points(rubric_items)
+        self.prepare_rubric(rubric_items, problem_name)
+        # One empty submission must not stop the grading of the others
+        texts = [text for text in assignment_texts if text.strip()]
+        graded = iter([self._grade_rubric(assignment, rubric_items) for assignment in self.parse_assignments(texts)])
+        return [next(graded) if text.strip() else self._empty_result(text, rubric_items, "No text extracted from assignment")
+                for text in assignment_texts]
+    
+    def _empty_result(self, text: str, rubric_items: List[Dict], error: str) -> Dict:
+        """
+        Returns the result of an assignment that could not be graded: 0 on every criterion.
+        """
+        def zero(item: Dict) -> Dict:
+            return {'description': item['description'], 'max_points': item['points'], 'score': 0.0,
+                    'justification': error, 'word_count': 0}
+        scores = {}
+        for item in rubric_items:
+            scores[item['criteria']] = zero(item)
+            scores[item['criteria']]['sub_scores'] = {sub_item['criteria']: zero(sub_item) for sub_item in item['sub_criteria']}
+        return {
+            'criteria_scores': scores,
+            'final_grade': 0.0,
+            'total_points_possible': self._total_points(rubric_items),
+            'total_points_earned': 0.0,
+            'assignment_text': text,
+            'error': error,
+        }
\ No newline at end of file
@@ -1,5 +1,6 @@
 from typing import Dict
 from GradingSystem import GradingSystem
+from ParsedAssignment import ParsedAssignment
 
 class GradingSystemDummy(GradingSystem):
     """
@@ -10,13 +11,13 @@ class GradingSystemDummy(GradingSystem):
         super().__init__()
         self.coefficient = coefficient
     
-    def _get_score(self, item: Dict, assignment_text: str):
+    def _get_score(self, item: Dict, assignment: ParsedAssignment):
         results = {
             'description': item['description'],
             'max_points': item['points'],
             'justification': "Test justification",
             'score': item['points'] * self.coefficient,
-            'word_count': len(assignment_text.split())
+            'word_count': assignment.word_count
         }
 
         return self._add_labels(item['points'] * self.coefficient, item, results)
\ No newline at end of file
@@ -1,9 +1,25 @@
-from typing import Dict
-from pydantic import BaseModel, Field
-from langchain_openai.chat_models.base import OpenAIRefusalError
-from openai import LengthFinishReasonError
+import sys
+import time
+from contextvars import ContextVar, copy_context
+from typing import Dict, Iterator, List, Optional, Tuple, Type
+from pydantic import BaseModel, Field, ValidationError, create_model
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import JsonOutputParser
 from GradingSystem import GradingSystem
+from ParsedAssignment import ParsedAssignment
 from llm_utils import get_model
+from llm_calls import get_caller
+from llm_telemetry import call_site
+
+# LLM calls made while grading the current assignment, shared with the scoring threads
+_CALLS: ContextVar[Optional[List[Dict]]] = ContextVar("llm_calls", default=None)
+
+PROMPT_LAYOUTS = ('criterion', 'prefix')
+INSTRUCTIONS = (
+    "You are a grading assistant. Your task is to evaluate the student's assignment "
+    "against the rubric below. Score each criterion you are asked about on its own scale "
+    "and justify the score."
+)
 
 class Grade(BaseModel):
     """
@@ -12,37 +28,270 @@ class Grade(BaseModel):
     justification: str = Field(..., description="Justification for the score")
     score: float = Field(..., description="Score awarded for the assignment")
 
+def _raw_payload(raw: AIMessage) -> Dict:
+    """
+    Returns the arguments of a structured output from the raw model message,
+    whether the model answered with a tool call or with JSON content.
+    """
+    if getattr(raw, 'tool_calls', None):
+        return raw.tool_calls[0]['args']
+    try:
+        payload = JsonOutputParser().parse(raw.content)
+    except Exception:
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+def _refusal_errors() -> Tuple[Type[BaseException], ...]:
+    """
+    Returns the errors of the OpenAI SDK for refused or truncated structured outputs.
+    Only the models of the SDK raise them, so it is not imported for the other models.
+    """
+    if 'langchain_openai' not in sys.modules:
+        return ()
+    from langchain_openai.chat_models.base import OpenAIRefusalError
+    from openai import LengthFinishReasonError
+    return (OpenAIRefusalError, LengthFinishReasonError)
+
+def _cached_tokens(raw: AIMessage) -> int:
+    """
+    Returns the number of input tokens the provider read from its prompt cache.
+    """
+    usage = getattr(raw, 'usage_metadata', None) or {}
+    cached = (usage.get('input_token_details') or {}).get('cache_read')
+    if cached is None:
+        # DeepSeek reports its context cache hits in the raw token usage
+        token_usage = (getattr(raw, 'response_metadata', None) or {}).get('token_usage') or {}
+        cached = token_usage.get('prompt_cache_hit_tokens') or 0
+    return cached
+
 class GradingSystemLLM(GradingSystem):
     """
     Main grading system that handles the grading process using semantic similarity
     and grammar checking.
     """
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: str, max_concurrency: int = 8, single_call: bool = False,
+                 prompt_layout: str = 'criterion'):
+        """
+        Args:
+            model_name: Name of the model passed to get_model
+            max_concurrency: Maximum number of criteria graded by concurrent LLM calls
+            single_call: Whether to grade all criteria of an assignment in one call,
+                falling back to one call per criterion for the grades that are missing or invalid
+            prompt_layout: "criterion" puts the criterion in the system message before the assignment.
+                "prefix" sends fixed instructions and the whole rubric first, then the assignment,
+                then the criterion, so that prompt caches are shared across criteria and students
+        """
+        if prompt_layout not in PROMPT_LAYOUTS:
+            raise ValueError(f"Unknown prompt layout: {prompt_layout}")
         super().__init__()
-        llm = get_model(model_name)
-        self.llm = llm.with_structured_output(Grade)
+        self.prompt_layout = prompt_layout
+        self.rubric_text = None
+        # Each criterion is a blocking round trip, so criteria are graded in parallel threads
+        self.max_concurrency = max_concurrency
+        self.single_call = single_call
+        # Shared with the other users of the model; connects while the rubric is prepared
+        self.model = get_model(model_name, warm_up=True)
+        # Deadlines, hedged requests and adaptive concurrency shared by every user of the model
+        self.caller = get_caller(model_name)
+        self.llm = self.model.with_structured_output(Grade, include_raw=True)
+    
+    def _invoke(self, llm, messages) -> Tuple[Dict, Dict]:
+        """
+        Invokes a structured-output model created with include_raw=True
+        and records the tokens and latency of the call.
+        Returns:
+            Tuple of (output of the model, usage of the call)
+        """
+        start = time.perf_counter()
+        output = self.caller.invoke(llm, messages)
+        # Responses served from the local response cache cost no tokens
+        cache_hit = bool((getattr(output['raw'], 'response_metadata', None) or {}).get('llm_cache_hit'))
+        usage = {} if cache_hit else getattr(output['raw'], 'usage_metadata', None) or {}
+        call = {
+            'input_tokens': usage.get('input_tokens', 0),
+            'cached_tokens': _cached_tokens(output['raw']) if usage else 0,
+            'output_tokens': usage.get('output_tokens', 0),
+            'latency': time.perf_counter() - start,
+            'llm_cache_hit': cache_hit,
+        }
+        calls = _CALLS.get()
+        if calls is not None:
+            calls.append(call)
+        return output, call
+    
+    def prepare_rubric(self, rubric_items: List[Dict], problem_name: str = None):
+        """
+        Renders the whole rubric once for the "prefix" prompt layout.
+        """
+        lines = []
+        for item in rubric_items:
+            lines.append(f"- ({item['points']} points) " + self._criteria_text(item).replace("\n", "\n  "))
+            for sub_item in item.get('sub_criteria', []):
+                lines.append(f"  - ({sub_item['points']} points) " + self._criteria_text(sub_item).replace("\n", "\n    "))
+        self.rubric_text = "\n".join(lines)
     
-    def _get_score(self, item: Dict, assignment_text: str):
+    def _messages(self, assignment: ParsedAssignment, request: str) -> List[Tuple[str, str]]:
+        """
+        Messages of the "prefix" layout, from the most to the least shared content:
+        instructions and rubric, then the assignment, then the request for this call.
+        """
+        return [
+            ("system", f"{INSTRUCTIONS}\n\nRubric:\n{self.rubric_text or ''}"),
+            ("human", f"Assignment:\n{assignment.text}\n\n{request}")
+        ]
+    
+    @staticmethod
+    def _criteria_text(item: Dict) -> str:
         critetia_text = item['criteria']
         if item['description'] and item['criteria'] != item['description']:
             critetia_text += f"\n{item['description']}"
         for label in item['labels']:
             critetia_text += f"\n - {label['label']}: {label['description']}"
-        messages = [
-            ("system", f"You are a grading assistant. Your task is to evaluate the student's assignment based on the following criteria on a scale of 0-{item['points']}:\n{critetia_text}"),
-            ("human", assignment_text)
-        ]
-        try:
-            output = self.llm.invoke(messages)
-        except (OpenAIRefusalError, LengthFinishReasonError) as e:
-            output = Grade(justification=str(e), score=0.0)
-
+        return critetia_text
+    
+    def results_from_grade(self, item: Dict, assignment: ParsedAssignment, output: Grade) -> Dict:
         results = {
             'description': item['description'],
             'max_points': item['points'],
             'justification': output.justification,
             'score': output.score,
-            'word_count': len(assignment_text.split())
+            'word_count': assignment.word_count
         }
 
-        return self._add_labels(output.score, item, results)
\ No newline at end of file
+        return self._add_labels(output.score, item, results)
+    
+    def score_messages(self, item: Dict, assignment: ParsedAssignment) -> List[Tuple[str, str]]:
+        """
+        Returns the messages sent to grade the assignment on a single rubric item.
+        """
+        if self.prompt_layout == 'prefix':
+            return self._messages(assignment, f"Grade the assignment on the following criteria on a scale of 0-{item['points']}:\n{self._criteria_text(item)}")
+        return [
+            ("system", f"You are a grading assistant. Your task is to evaluate the student's assignment based on the following criteria on a scale of 0-{item['points']}:\n{self._criteria_text(item)}"),
+            ("human", assignment.text)
+        ]
+    
+    def _get_score(self, item: Dict, assignment: ParsedAssignment):
+        messages = self.score_messages(item, assignment)
+        call = None
+        try:
+            with call_site("grading", criterion=item['criteria']):
+                output, call = self._invoke(self.llm, messages)
+            if output['parsed'] is None:
+                raise output['parsing_error'] or ValueError("No grade in the model output")
+            output = output['parsed']
+        except _refusal_errors() as e:
+            output = Grade(justification=str(e), score=0.0)
+
+        results = self.results_from_grade(item, assignment, output)
+        if call is not None:
+            results['usage'] = call
+        return results
+    
+    @staticmethod
+    def _rubric_schema(items: List[Dict]) -> Tuple[Type[BaseModel], List[str]]:
+        """
+        Builds a structured-output schema with one Grade per rubric item, keyed by criterion name.
+        Args:
+            items: Rubric items and sub-items to grade
+        Returns:
+            Tuple of (schema, key of each item in the schema)
+        """
+        keys, fields = [], {}
+        for i, item in enumerate(items):
+            # Criterion names must be unique keys of the schema
+            key, n = item['criteria'], 1
+            while key in keys:
+                n += 1
+                key = f"{item['criteria']} ({n})"
+            keys.append(key)
+            fields[f"criterion_{i}"] = (Grade, Field(..., alias=key, description=f"Grade on a scale of 0-{item['points']}"))
+        return create_model("RubricGrades", __doc__="Grades of the assignment on every criterion.", **fields), keys
+    
+    def _iter_scores(self, assignment: ParsedAssignment, items: List[Dict]) -> Iterator[Tuple[int, Dict]]:
+        """
+        Grades every item in a single call in single-call mode. Items whose grade is missing
+        or invalid are graded again with one call per item.
+        """
+        if not self.single_call or len(items) <= 1:
+            yield from super()._iter_scores(assignment, items)
+            return
+        
+        schema, keys = self._rubric_schema(items)
+        if self.prompt_layout == 'prefix':
+            criteria_list = "\n".join(f"- {key} (scale of 0-{item['points']})" for key, item in zip(keys, items))
+            messages = self._messages(assignment, f"Grade the assignment on each of the following criteria of the rubric:\n{criteria_list}")
+        else:
+            criteria_text = "\n\n".join(f"{key} (scale of 0-{item['points']}):\n{self._criteria_text(item)}"
+                                        for key, item in zip(keys, items))
+            messages = [
+                ("system", f"You are a grading assistant. Your task is to evaluate the student's assignment on each of the following criteria, each on its own scale:\n\n{criteria_text}"),
+                ("human", assignment.text)
+            ]
+        grades: List[Optional[Grade]] = [None] * len(items)
+        try:
+            with call_site("grading", criterion="*"):
+                output, _ = self._invoke(self.model.with_structured_output(schema, include_raw=True), messages)
+            payload = _raw_payload(output['raw'])
+            for i, key in enumerate(keys):
+                try:
+                    grades[i] = Grade.model_validate(payload[key])
+                except (KeyError, TypeError, ValidationError):
+                    pass
+        except (*_refusal_errors(), TimeoutError):
+            pass
+        
+        for i, (item, grade) in enumerate(zip(items, grades)):
+            if grade is not None:
+                yield i, self.results_from_grade(item, assignment, grade)
+        
+        # Fall back to one call per criterion for the missing grades
+        missing = [i for i, grade in enumerate(grades) if grade is None]
+        for j, score in super()._iter_scores(assignment, [items[i] for i in missing]):
+            yield missing[j], score
+    
+    def _grade_rubric(self, assignment: ParsedAssignment, rubric_items: List[Dict],
+                      job_scores: Optional[List[Dict]] = None) -> Dict:
+        """
+        Grades a parsed assignment and reports the LLM calls it took.
+        """
+        calls = []
+        token = _CALLS.set(calls)
+        start = time.perf_counter()
+        try:
+            results = super()._grade_rubric(assignment, rubric_items, job_scores)
+        finally:
+            _CALLS.reset(token)
+        results['usage'] = self._usage(calls, start)
+        return results
+    
+    def _usage(self, calls: List[Dict], start: float) -> Dict:
+        return {
+            'mode': 'single-call' if self.single_call else 'per-criterion',
+            'calls': len(calls),
+            'input_tokens': sum(call['input_tokens'] for call in calls),
+            'cached_tokens': sum(call['cached_tokens'] for call in calls),
+            'output_tokens': sum(call['output_tokens'] for call in calls),
+            'llm_cache_hits': sum(call['llm_cache_hit'] for call in calls),
+            'latency': time.perf_counter() - start,
+        }
+    
+    def grade_assignment_stream(self, assignment_path: str, rubric_path: str, problem_name: str = None) -> Iterator[Dict]:
+        """
+        Streams the grading events of GradingSystem.grade_assignment_stream and reports
+        the LLM calls of the whole stream in the final results.
+        """
+        calls = []
+        start = time.perf_counter()
+        # Every step of the stream runs in one context that records the calls
+        context = copy_context()
+        context.run(_CALLS.set, calls)
+        events = super().grade_assignment_stream(assignment_path, rubric_path, problem_name)
+        while True:
+            try:
+                event = context.run(next, events)
+            except StopIteration:
+                return
+            if event['type'] == 'final':
+                event['results']['usage'] = self._usage(calls, start)
+            yield event
\ No newline at end of file
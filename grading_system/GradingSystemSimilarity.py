@@ -1,104 +1,258 @@
-from typing import Dict
-from functools import lru_cache
-from langchain_huggingface import HuggingFaceEmbeddings
+from typing import Dict, FrozenSet, List
+from dataclasses import replace
 import numpy as np
+from embedding_utils import get_embeddings
 from GradingSystem import GradingSystem
+from ParsedAssignment import ParsedAssignment
+from RubricArtifact import RubricArtifact, RubricPhrase, rubric_artifact_path
+from VocabularyTable import VocabularyTable, vocabulary_path
+from WordMatrix import WordMatrix, similarity_matrix
+
+EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+
+def _cosine_matrix(vectors1: np.ndarray, vectors2: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity of every row of vectors1 with every row of vectors2.
+    """
+    vectors1 = vectors1 / np.linalg.norm(vectors1, axis=1, keepdims=True)
+    vectors2 = vectors2 / np.linalg.norm(vectors2, axis=1, keepdims=True)
+    return vectors1 @ vectors2.T
 
 class GradingSystemSimilarity(GradingSystem):
     """
     Main grading system that handles the grading process using semantic similarity
     and grammar checking.
     """
-    def __init__(self, device ='cpu'):
+    # Word features come from the lowercased text, as in the rubric phrases: the case changes
+    # the POS tags (e.g., a capitalized "Truss" is a PROPN) and so the key terms
+    lowercase_features = True
+    
+    def __init__(self, device ='cpu', batch_size: int = 64, backend: str = 'torch', intra_op_threads: int = None,
+                 chunked: bool = False, max_chunk_tokens: int = 256,
+                 pooling: str = 'max', top_k: int = 3):
+        """
+        Args:
+            device: Device of the torch embedding backend
+            batch_size: Number of texts per forward pass
+            backend: Embedding backend, "torch" or "onnx"
+            intra_op_threads: Threads used inside each operator by the onnx backend
+            chunked: Whether to embed assignments as windows of sentences instead of as a whole,
+                so that text past the model's token window is still scored
+            max_chunk_tokens: Maximum number of model tokens per window in chunked mode,
+                capped at the number of tokens the embedding model reads
+            pooling: How the similarities of the windows to a rubric text are combined,
+                "max" or "top-k" (mean of the top_k best windows)
+            top_k: Number of windows averaged by "top-k" pooling
+        """
+        if pooling not in ('max', 'top-k'):
+            raise ValueError(f"Unknown pooling: {pooling}")
         super().__init__()
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-mpnet-base-v2",
-            model_kwargs={'device': device}
+        self.chunked = chunked
+        self.max_chunk_tokens = max_chunk_tokens
+        self.pooling = pooling
+        self.top_k = top_k
+        # Embeddings are cached in memory and on disk, shared across gradings and restarts
+        self.embeddings = get_embeddings(
+            EMBEDDING_MODEL,
+            backend=backend,
+            device=device,
+            batch_size=batch_size,
+            intra_op_threads=intra_op_threads
         )
+        # Single words are looked up in the precomputed vocabulary table, read-only (see build_vocabulary.py)
+        self.vocabulary = VocabularyTable(vocabulary_path(self.embeddings.model_name), self.embeddings)
+        self.rubric_artifact = None
+        self._phrases: Dict[str, RubricPhrase] = {}
     
-    def _calculate_similarity(self, text1: str, text2: str) -> float:
+    def parse_assignment(self, text: str) -> ParsedAssignment:
         """
-        Calculates semantic similarity between two texts.
+        Parses the assignment once and embeds its lemmatized content and content words.
         Args:
-            text1: First text to compare
-            text2: Second text to compare
+            text: Text of the assignment
+        Returns:
+            ParsedAssignment of the text with its embedding
+        """
+        assignment = super().parse_assignment(text)
+        return replace(
+            self._with_embeddings(assignment, self._document_embeddings([assignment])[0]),
+            word_matrix=WordMatrix.from_words(assignment.content_words, self.vocabulary.lookup)
+        )
+    
+    def _document_embeddings(self, assignments: List[ParsedAssignment]) -> List[np.ndarray]:
+        """
+        Embeds the processed text of every assignment in one batch, as a whole
+        or, in chunked mode, as windows of sentences.
+        Args:
+            assignments: Parsed assignments
+        Returns:
+            For each assignment, an array with one embedding per window
+        """
+        if self.chunked:
+            # Windows are measured with the tokenizer of the model so that none is truncated
+            max_tokens = min(self.max_chunk_tokens, self.embeddings.max_text_tokens)
+            texts = [assignment.chunks(max_tokens, self.embeddings.count_tokens) or [assignment.processed_text]
+                     for assignment in assignments]
+        else:
+            texts = [[assignment.processed_text] for assignment in assignments]
+        vectors = np.asarray(self.embeddings.embed_documents([text for chunks in texts for text in chunks]))
+        offsets = np.cumsum([0] + [len(chunks) for chunks in texts])
+        return [vectors[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    
+    @staticmethod
+    def _with_embeddings(assignment: ParsedAssignment, chunk_embeddings: np.ndarray) -> ParsedAssignment:
+        # The embedding of a chunked assignment is the mean of its windows
+        embedding = chunk_embeddings[0] if len(chunk_embeddings) == 1 else chunk_embeddings.mean(axis=0)
+        return replace(assignment, embedding=embedding, chunk_embeddings=chunk_embeddings)
+    
+    def _pool(self, similarities: np.ndarray) -> np.ndarray:
+        """
+        Combines the similarities of the windows of an assignment (rows) to each rubric text (columns).
+        """
+        if self.pooling == 'max' or len(similarities) <= 1:
+            return similarities.max(axis=0)
+        k = min(self.top_k, len(similarities))
+        return np.sort(similarities, axis=0)[-k:].mean(axis=0)
+    
+    def parse_assignments(self, texts: List[str]) -> List[ParsedAssignment]:
+        """
+        Parses and embeds several assignments in large batches. If a rubric is prepared,
+        the similarities of every assignment to every rubric text are also computed
+        as (assignments x rubric texts) matrix operations.
+        Args:
+            texts: Texts of the assignments
+        Returns:
+            ParsedAssignment of each text with its embeddings, in order
+        """
+        assignments = super().parse_assignments(texts)
+        chunk_embeddings = self._document_embeddings(assignments)
+        words = list(dict.fromkeys(text for assignment in assignments for text, _ in assignment.content_words))
+        word_vectors = self.vocabulary.lookup(words)
+        word_rows = {text: i for i, text in enumerate(words)}
+        lookup = lambda batch: word_vectors[[word_rows[text] for text in batch]]
+        assignments = [
+            replace(
+                self._with_embeddings(assignment, embeddings),
+                word_matrix=WordMatrix.from_words(assignment.content_words, lookup)
+            )
+            for assignment, embeddings in zip(assignments, chunk_embeddings)
+        ]
+        if self.rubric_artifact is None or not assignments:
+            return assignments
+        
+        phrases = list(self.rubric_artifact.phrases.values())
+        word_level_sims = similarity_matrix([assignment.word_matrix for assignment in assignments],
+                                            [phrase.word_matrix for phrase in phrases])
+        chunk_sims = _cosine_matrix(np.vstack([assignment.chunk_embeddings for assignment in assignments]),
+                                    np.vstack([phrase.embedding for phrase in phrases]))
+        offsets = np.cumsum([0] + [len(assignment.chunk_embeddings) for assignment in assignments])
+        full_text_sims = np.vstack([self._pool(chunk_sims[start:end])
+                                    for start, end in zip(offsets[:-1], offsets[1:])])
+        return [
+            replace(assignment, similarities={
+                phrase.text: self._combine_similarities(
+                    word_level_sims[i, j],
+                    full_text_sims[i, j],
+                    self._term_similarity(assignment.key_terms, phrase.key_terms))
+                for j, phrase in enumerate(phrases)
+            })
+            for i, assignment in enumerate(assignments)
+        ]
+    
+    def prepare_rubric(self, rubric_items: List[Dict], problem_name: str = None):
+        """
+        Loads the compiled rubric, compiling it on first use.
+        Rubrics of problems are stored next to problems/<name>/rubrics.jsonl.
+        """
+        signature = RubricArtifact.get_signature(rubric_items, self.embeddings.model_name)
+        if self.rubric_artifact is not None and self.rubric_artifact.signature == signature:
+            return
+        path = rubric_artifact_path(problem_name) if problem_name else None
+        artifact = RubricArtifact.load(path, signature) if path else None
+        if artifact is None:
+            artifact = RubricArtifact.compile(rubric_items, self.nlp, self.embeddings, self.embeddings.model_name,
+                                              embed_words=self.vocabulary.lookup)
+            if path:
+                artifact.save(path)
+        self.rubric_artifact = artifact
+    
+    def _phrase(self, text: str) -> RubricPhrase:
+        """
+        Returns the compiled features of a rubric text, compiling texts missing
+        from the rubric artifact on the fly.
+        """
+        if self.rubric_artifact is not None and text in self.rubric_artifact.phrases:
+            return self.rubric_artifact.phrases[text]
+        if text not in self._phrases:
+            self._phrases.update(RubricArtifact.compile_phrases([text], self.nlp, self.embeddings,
+                                                                embed_words=self.vocabulary.lookup))
+        return self._phrases[text]
+    
+    def _noun_chunks(self, text: str) -> List[str]:
+        if self.rubric_artifact is not None and text in self.rubric_artifact.noun_chunks:
+            return list(self.rubric_artifact.noun_chunks[text])
+        return [chunk.text for chunk in self.nlp(text.lower()).noun_chunks]
+    
+    def _calculate_similarity(self, assignment: ParsedAssignment, text: str) -> float:
+        """
+        Calculates semantic similarity between the assignment and a rubric text.
+        Args:
+            assignment: Parsed assignment to compare
+            text: Rubric text to compare
         Returns:
             Similarity score between 0 and 1
         """
         try:
-            if not text1.strip() or not text2.strip():
+            if not assignment.text.strip() or not text.strip():
                 raise ValueError("Empty text provided for similarity calculation")
             
-            # Preprocess texts
-            doc1 = self.nlp(text1.lower())
-            doc2 = self.nlp(text2.lower())
-            
-            # Word-by-word analysis
-            words1 = [token for token in doc1 if not token.is_stop and not token.is_punct]
-            words2 = [token for token in doc2 if not token.is_stop and not token.is_punct]
-            
-            # Calculate word-level similarities
-            word_similarities = []
-            for word1 in words1:
-                word_scores = []
-                for word2 in words2:
-                    if word1.text == word2.text or word1.lemma_ == word2.lemma_:
-                        word_scores.append(1.0)
-                    else:
-                        emb1 = self.embeddings.embed_query(word1.text)
-                        emb2 = self.embeddings.embed_query(word2.text)
-                        sim = np.dot(emb1, emb2) / (np.linalg.norm(emb1) * np.linalg.norm(emb2))
-                        word_scores.append(float(sim))
-                
-                if word_scores:
-                    word_similarities.append(max(word_scores))
+            # Use the similarity computed for the whole batch if there is one
+            if assignment.similarities is not None and text in assignment.similarities:
+                return assignment.similarities[text]
             
-            # Calculate overall similarities
-            word_level_sim = sum(word_similarities) / len(words1) if words1 else 0
+            # The assignment is already parsed and the rubric text precompiled
+            phrase = self._phrase(text)
             
-            text1_processed = ' '.join([token.lemma_ for token in doc1 
-                                      if not token.is_stop and not token.is_punct])
-            text2_processed = ' '.join([token.lemma_ for token in doc2 
-                                      if not token.is_stop and not token.is_punct])
+            # Calculate word-level similarities from one similarity matrix
+            word_level_sim = assignment.word_matrix.similarity(phrase.word_matrix)
             
-            emb1 = self.embeddings.embed_query(text1_processed)
-            emb2 = self.embeddings.embed_query(text2_processed)
-            
-            full_text_sim = float(np.dot(emb1, emb2) / (np.linalg.norm(emb1) * np.linalg.norm(emb2)))
+            # Pool the similarities of the windows of the assignment (a single one unless chunked)
+            full_text_sim = float(self._pool(_cosine_matrix(assignment.chunk_embeddings, phrase.embedding[None, :]))[0])
             
             # Calculate key term overlap
-            key_terms1 = set(token.lemma_ for token in doc1 
-                           if token.pos_ in ['NOUN', 'VERB', 'ADJ'] and not token.is_stop)
-            key_terms2 = set(token.lemma_ for token in doc2 
-                           if token.pos_ in ['NOUN', 'VERB', 'ADJ'] and not token.is_stop)
-            
-            common_terms = key_terms1.intersection(key_terms2)
-            term_similarity = len(common_terms) / max(len(key_terms1), len(key_terms2)) if key_terms1 else 0
-            
-            # Combine similarity measures
-            final_similarity = (
-                word_level_sim * 0.4 +
-                full_text_sim * 0.4 +
-                term_similarity * 0.2
-            )
+            term_similarity = self._term_similarity(assignment.key_terms, phrase.key_terms)
             
-            return max(0, min(1, round(final_similarity * 10) / 10))
+            return self._combine_similarities(word_level_sim, full_text_sim, term_similarity)
             
         except Exception as e:
             raise Exception(f"Error calculating similarity: {str(e)}")
     
-    def _get_score(self, item: Dict, assignment_text: str):
-        criteria_sim = self._calculate_similarity(assignment_text, item['criteria'])
-        desc_sim = self._calculate_similarity(assignment_text, item['description'])
+    @staticmethod
+    def _term_similarity(key_terms1: FrozenSet[str], key_terms2: FrozenSet[str]) -> float:
+        common_terms = key_terms1.intersection(key_terms2)
+        return len(common_terms) / max(len(key_terms1), len(key_terms2)) if key_terms1 else 0
+    
+    @staticmethod
+    def _combine_similarities(word_level_sim: float, full_text_sim: float, term_similarity: float) -> float:
+        # Combine similarity measures
+        final_similarity = (
+            word_level_sim * 0.4 +
+            full_text_sim * 0.4 +
+            term_similarity * 0.2
+        )
+        
+        return max(0, min(1, round(float(final_similarity) * 10) / 10))
+    
+    def _get_score(self, item: Dict, assignment: ParsedAssignment):
+        criteria_sim = self._calculate_similarity(assignment, item['criteria'])
+        desc_sim = self._calculate_similarity(assignment, item['description'])
         
         # Check for key phrases in description
-        desc_doc = self.nlp(item['description'].lower())
-        key_phrases = [chunk.text for chunk in desc_doc.noun_chunks]
+        key_phrases = self._noun_chunks(item['description'])
         
         # Calculate phrase matches
         phrase_scores = []
         for phrase in key_phrases:
-            phrase_sim = self._calculate_similarity(assignment_text, phrase)
+            phrase_sim = self._calculate_similarity(assignment, phrase)
             phrase_scores.append(phrase_sim)
         
         # Calculate final similarity score
@@ -112,7 +266,7 @@ class GradingSystemSimilarity(GradingSystem):
         
         # Adjust score based on content length
         min_words = 50  # Minimum words expected for full credit
-        word_count = len(assignment_text.split())
+        word_count = assignment.word_count
         length_factor = min(1.0, word_count / min_words)
         
         # Calculate final score
@@ -128,7 +282,3 @@ class GradingSystemSimilarity(GradingSystem):
         }
 
         return self._add_labels(score, item, results)
-
-@lru_cache(maxsize=1000)
-def get_word_embedding(self, word: str):
-    return self.embeddings.embed_query(word) 
\ No newline at end of file
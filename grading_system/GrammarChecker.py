@@ -0,0 +1,148 @@
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from spacy.tokens import Doc, Span
+
+SUBJECT_DEPS = ('nsubj', 'nsubjpass')
+END_PUNCTUATION = '.!?'
+
+class GrammarChecker:
+    """
+    Rule-based grammar and spelling checker.
+    Every check reads from the spans of a single spaCy parse of the text,
+    so sentences are never re-parsed on their own.
+    """
+    def __init__(self, spell, speller):
+        self.spell = spell
+        self.speller = speller
+
+    def _check_sentence(self, sent: "Span") -> List[Dict]:
+        """
+        Checks the structure, capitalization and end punctuation of a sentence.
+        Args:
+            sent: Sentence span of the parsed document
+        Returns:
+            List of issues found in the sentence
+        """
+        sent_text = sent.text.strip()
+        has_subject = False
+        has_verb = False
+        for token in sent:
+            if token.dep_ in SUBJECT_DEPS:
+                has_subject = True
+            if token.pos_ == 'VERB':
+                has_verb = True
+            if has_subject and has_verb:
+                break
+
+        issues = []
+        if not (has_subject and has_verb):
+            issues.append({
+                'category': 'grammar',
+                'error_type': 'Sentence Structure',
+                'message': f'Missing subject or verb in: "{sent_text}"',
+                'suggestion': 'Ensure sentence has both subject and verb'
+            })
+
+        if not (sent_text and sent_text[0].isupper()):
+            issues.append({
+                'category': 'grammar',
+                'error_type': 'Capitalization',
+                'message': f'Sentence should start with capital letter: "{sent_text}"',
+                'suggestion': f'Change to: "{sent_text[:1].upper() + sent_text[1:]}"'
+            })
+
+        if not (sent_text and sent_text[-1] in END_PUNCTUATION):
+            issues.append({
+                'category': 'punctuation',
+                'error_type': 'Missing Punctuation',
+                'message': f'Sentence missing end punctuation: "{sent_text}"',
+                'suggestion': 'Add appropriate end punctuation (. ! ?)'
+            })
+        return issues
+
+    def check(self, doc: "Doc") -> Tuple[float, Dict]:
+        """
+        Checks grammar and spelling in a parsed document.
+        Args:
+            doc: spaCy Doc of the text to check
+        Returns:
+            Tuple of (score, feedback dictionary)
+        """
+        # Count words and sentences
+        words = [token.lower_ for token in doc if not token.is_punct and not token.is_space]
+        word_count = len(words)
+        sentences = list(doc.sents)
+        sentence_count = len(sentences)
+
+        if sentence_count == 0 or word_count == 0:
+            return 0, {"errors": [], "feedback": "No valid text found"}
+
+        # Spell check
+        misspelled = list(self.spell.unknown(words))
+        spelling_errors = len(misspelled)
+
+        error_categories = {
+            'spelling': spelling_errors,
+            'grammar': 0,
+            'punctuation': 0
+        }
+
+        grammar_issues = []
+        correct_sentences = 0
+
+        # Analyze each sentence on the spans of the document parse
+        for sent in sentences:
+            issues = self._check_sentence(sent)
+            for issue in issues:
+                error_categories[issue.pop('category')] += 1
+            grammar_issues.extend(issues)
+            if not issues:
+                correct_sentences += 1
+
+        # Add spelling suggestions
+        for word in misspelled:
+            grammar_issues.append({
+                'error_type': 'Spelling',
+                'message': f'Misspelled word: "{word}"',
+                'suggestion': f'Suggestions: {", ".join(self.speller.suggest(word))}'
+            })
+
+        # Calculate scores
+        if word_count <= 20:  # Short text adjustments
+            base_spelling_score = max(0.4, 1 - (spelling_errors / word_count * 2))
+            base_grammar_score = max(0.4, correct_sentences / sentence_count)
+            base_punct_score = max(0.4, 1 - (error_categories['punctuation'] / sentence_count))
+        else:  # Normal scoring for longer texts
+            base_spelling_score = max(0, 1 - (spelling_errors / word_count * 2))
+            base_grammar_score = max(0, 1 - (error_categories['grammar'] / sentence_count))
+            base_punct_score = max(0, 1 - (error_categories['punctuation'] / sentence_count))
+
+        # Calculate final score
+        final_score = (
+            base_spelling_score * 0.3 +
+            base_grammar_score * 0.5 +
+            base_punct_score * 0.2
+        )
+
+        if correct_sentences > 0:
+            final_score = max(0.4, final_score)
+
+        feedback = {
+            'errors': grammar_issues,
+            'statistics': {
+                'word_count': word_count,
+                'sentence_count': sentence_count,
+                'correct_sentences': correct_sentences,
+                'words_per_sentence': round(word_count/sentence_count if sentence_count else 0, 1),
+                'total_errors': len(grammar_issues),
+                'error_categories': error_categories
+            },
+            'component_scores': {
+                'spelling': round(base_spelling_score, 2),
+                'grammar': round(base_grammar_score, 2),
+                'punctuation': round(base_punct_score, 2)
+            }
+        }
+
+        return round(final_score, 2), feedback
@@ -0,0 +1,105 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, FrozenSet, List, Optional, Tuple
+import numpy as np
+from WordMatrix import WordMatrix
+
+if TYPE_CHECKING:
+    # spaCy is loaded by the grading systems on first use
+    from spacy.tokens import Doc, Span, Token
+
+KEY_TERM_POS = ('NOUN', 'VERB', 'ADJ')
+
+@dataclass(frozen=True)
+class ParsedAssignment:
+    """
+    An assignment parsed once per grading run.
+    Every scorer and the grammar checker read from this object instead of
+    re-tokenizing the raw assignment text.
+    """
+    text: str
+    """The raw assignment text"""
+    doc: "Doc"
+    """spaCy parse of the raw text"""
+    sentences: Tuple["Span", ...]
+    """Sentences of the doc the word features are taken from"""
+    lemmas: Tuple[str, ...]
+    """Lowercase lemmas of every token"""
+    content_tokens: Tuple["Token", ...]
+    """Tokens that are neither stop words, punctuation nor whitespace"""
+    content_words: Tuple[Tuple[str, str], ...]
+    """Lowercase (text, lemma) of every content token"""
+    key_terms: FrozenSet[str]
+    """Lowercase lemmas of content nouns, verbs and adjectives"""
+    processed_text: str
+    """Lemmatized content tokens joined by spaces"""
+    word_count: int
+    embedding: Optional[np.ndarray] = None
+    """Embedding of processed_text, set by graders that use embeddings"""
+    chunk_embeddings: Optional[np.ndarray] = None
+    """Embeddings of the windows of processed_text compared to rubric texts, one per row"""
+    word_matrix: Optional[WordMatrix] = None
+    """Embeddings of content_words, set by graders that use embeddings"""
+    similarities: Optional[Dict[str, float]] = None
+    """Precomputed similarity to each rubric text, set when grading in batches"""
+
+    @classmethod
+    def from_doc(cls, text: str, doc: "Doc", features_doc: Optional["Doc"] = None) -> "ParsedAssignment":
+        """
+        Builds a parsed assignment from the spaCy parse of its text.
+        Args:
+            text: Raw assignment text
+            doc: spaCy Doc of text
+            features_doc: spaCy Doc the sentences and word features are taken from, doc if None
+                (e.g., the parse of the lowercased text)
+        Returns:
+            ParsedAssignment holding every view of the text used by the scorers
+        """
+        features_doc = doc if features_doc is None else features_doc
+        content_tokens = tuple(token for token in features_doc
+                               if not token.is_stop and not token.is_punct and not token.is_space)
+        content_words = tuple((token.lower_, token.lemma_.lower()) for token in content_tokens)
+        return cls(
+            text=text,
+            doc=doc,
+            sentences=tuple(features_doc.sents),
+            lemmas=tuple(token.lemma_.lower() for token in features_doc),
+            content_tokens=content_tokens,
+            content_words=content_words,
+            key_terms=frozenset(lemma for token, (_, lemma) in zip(content_tokens, content_words)
+                                if token.pos_ in KEY_TERM_POS),
+            processed_text=' '.join(lemma for _, lemma in content_words),
+            word_count=len(text.split()),
+        )
+
+    def chunks(self, max_tokens: int, count_tokens: Optional[Callable[[List[str]], List[int]]] = None) -> List[str]:
+        """
+        Splits processed_text into windows of consecutive sentences.
+        Args:
+            max_tokens: Maximum number of tokens per window; longer sentences
+                are split into several windows
+            count_tokens: Number of model tokens of each word (e.g., CachedEmbeddings.count_tokens),
+                one token per word if None
+        Returns:
+            Windows of lemmatized content tokens joined by spaces, covering the whole text
+        """
+        sentences = [[token.lemma_.lower() for token in sent
+                      if not token.is_stop and not token.is_punct and not token.is_space]
+                     for sent in self.sentences]
+        words = list(dict.fromkeys(lemma for lemmas in sentences for lemma in lemmas))
+        # Words are tokenized on their own, so the tokens of a window are the sum of its words'
+        sizes = dict(zip(words, count_tokens(words) if count_tokens is not None and words else [1] * len(words)))
+        windows, window, size = [], [], 0
+        for lemmas in sentences:
+            sentence_size = sum(sizes[lemma] for lemma in lemmas)
+            if window and size + sentence_size > max_tokens:
+                windows.append(window)
+                window, size = [], 0
+            for lemma in lemmas:
+                if window and size + sizes[lemma] > max_tokens:
+                    windows.append(window)
+                    window, size = [], 0
+                window.append(lemma)
+                size += sizes[lemma]
+        if window:
+            windows.append(window)
+        return [' '.join(window) for window in windows]
@@ -0,0 +1,159 @@
+import os
+import json
+import pickle
+import hashlib
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from ParsedAssignment import KEY_TERM_POS
+from WordMatrix import WordMatrix
+
+if TYPE_CHECKING:
+    from spacy.tokens import Doc
+
+RUBRIC_ARTIFACT_NAME = "rubrics_compiled.pkl"
+
+def rubric_artifact_path(problem_name: str) -> str:
+    """
+    Returns the path of the compiled rubric of a problem, next to its rubrics.jsonl.
+    """
+    return os.path.join("./problems", problem_name, RUBRIC_ARTIFACT_NAME)
+
+@dataclass(frozen=True)
+class RubricPhrase:
+    """
+    Rubric-side features of a text compared against assignments
+    (a criterion, a description or a noun chunk of a description).
+    """
+    text: str
+    processed_text: str
+    """Lemmatized content tokens of the lowercase text joined by spaces"""
+    key_terms: FrozenSet[str]
+    word_matrix: WordMatrix
+    embedding: np.ndarray
+    """Embedding of processed_text"""
+
+class RubricArtifact:
+    """
+    A rubric compiled for similarity grading.
+    It holds the features and embeddings of every rubric text, so only
+    assignment-side work is left for each submission.
+    """
+    def __init__(self,
+                 signature: str,
+                 phrases: Dict[str, RubricPhrase],
+                 noun_chunks: Dict[str, Tuple[str, ...]]):
+        self.signature = signature
+        self.phrases = phrases
+        self.noun_chunks = noun_chunks
+
+    @staticmethod
+    def get_signature(rubric_items: List[Dict], model_name: str) -> str:
+        """
+        Hash of the rubric and the embedding model, used to detect stale artifacts.
+        """
+        content = json.dumps({"model": model_name, "rubric": rubric_items}, sort_keys=True)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _texts(rubric_items: List[Dict]) -> Iterable[str]:
+        for item in rubric_items:
+            yield item['criteria']
+            yield item['description']
+            yield from RubricArtifact._texts(item.get('sub_criteria', []))
+
+    @staticmethod
+    def compile_phrases(texts: Iterable[str],
+                        nlp,
+                        embeddings: Embeddings,
+                        embed_words: Optional[Callable[[List[str]], np.ndarray]] = None) -> Dict[str, RubricPhrase]:
+        """
+        Parses and embeds rubric texts with one batched call for the processed texts
+        and one for their words.
+        Args:
+            texts: Rubric texts to compile
+            nlp: spaCy pipeline
+            embeddings: Embeddings used by the grader
+            embed_words: Batched embedding function for single words
+                (e.g., VocabularyTable.lookup), embeddings.embed_documents by default
+        Returns:
+            Dictionary mapping each text to its RubricPhrase
+        """
+        texts = list(dict.fromkeys(text for text in texts if text.strip()))
+        docs: List[Doc] = list(nlp.pipe(text.lower() for text in texts))
+        words = [[(token.lower_, token.lemma_.lower()) for token in doc
+                  if not token.is_stop and not token.is_punct and not token.is_space]
+                 for doc in docs]
+        processed_texts = [' '.join(lemma for _, lemma in doc_words) for doc_words in words]
+
+        embedded = np.asarray(embeddings.embed_documents(processed_texts)) if texts else []
+        distinct_words = list(dict.fromkeys(text for doc_words in words for text, _ in doc_words))
+        embed_words = embed_words or embeddings.embed_documents
+        word_vectors = np.asarray(embed_words(distinct_words)) if distinct_words else None
+        word_rows = {text: i for i, text in enumerate(distinct_words)}
+        lookup = lambda batch: word_vectors[[word_rows[text] for text in batch]]
+
+        phrases = {}
+        for text, doc, doc_words, processed_text, embedding in zip(texts, docs, words, processed_texts, embedded):
+            phrases[text] = RubricPhrase(
+                text=text,
+                processed_text=processed_text,
+                key_terms=frozenset(token.lemma_ for token in doc
+                                    if token.pos_ in KEY_TERM_POS and not token.is_stop),
+                word_matrix=WordMatrix.from_words(doc_words, lookup),
+                embedding=embedding,
+            )
+        return phrases
+
+    @classmethod
+    def compile(cls,
+                rubric_items: List[Dict],
+                nlp,
+                embeddings: Embeddings,
+                model_name: str,
+                embed_words: Optional[Callable[[List[str]], np.ndarray]] = None) -> "RubricArtifact":
+        """
+        Compiles the output of RubricProcessor.extract_rubric.
+        Args:
+            rubric_items: Rubric items with criteria, descriptions and sub-criteria
+            nlp: spaCy pipeline
+            embeddings: Embeddings used by the grader
+            model_name: Name of the embedding model
+            embed_words: Batched embedding function for single words, see compile_phrases
+        Returns:
+            RubricArtifact of the rubric
+        """
+        texts = list(cls._texts(rubric_items))
+        noun_chunks = {}
+        for text, doc in zip(texts, nlp.pipe(text.lower() for text in texts)):
+            noun_chunks[text] = tuple(chunk.text for chunk in doc.noun_chunks)
+        phrase_texts = texts + [chunk for chunks in noun_chunks.values() for chunk in chunks]
+        return cls(
+            signature=cls.get_signature(rubric_items, model_name),
+            phrases=cls.compile_phrases(phrase_texts, nlp, embeddings, embed_words),
+            noun_chunks=noun_chunks,
+        )
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path: str, signature: Optional[str] = None) -> Optional["RubricArtifact"]:
+        """
+        Loads a compiled rubric.
+        Args:
+            path: Path to the artifact
+            signature: Expected signature; a stale artifact is ignored
+        Returns:
+            RubricArtifact, or None if it does not exist or is stale
+        """
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            artifact = pickle.load(f)
+        if signature is not None and artifact.signature != signature:
+            return None
+        return artifact
@@ -0,0 +1,201 @@
+import os
+import re
+import pickle
+from collections import Counter
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Set
+
+if TYPE_CHECKING:
+    from spellchecker import SpellChecker
+
+WORD_PATTERN = re.compile(r"[a-z]+(?:'[a-z]+)?")
+SPELLING_INDEX_PATH = "./index/spelling/symspell.pkl"
+
+def _deletes(word: str, max_edit_distance: int) -> Set[str]:
+    """
+    Returns every string obtained by deleting up to max_edit_distance characters from word.
+    """
+    results = {word}
+    frontier = {word}
+    for _ in range(max_edit_distance):
+        frontier = {w[:i] + w[i+1:] for w in frontier for i in range(len(w))}
+        results |= frontier
+    return results
+
+def _edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Damerau-Levenshtein distance between a and b: the fewest insertions, deletions,
+    substitutions and adjacent transpositions, applied one after the other like
+    pyspellchecker's edits (e.g., "shwao" is 2 edits from "show", a deletion then a
+    transposition, which the optimal string alignment distance counts as 3).
+    Returns max_distance + 1 if the lengths alone put the distance above max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    infinity = len(a) + len(b)
+    # d[i + 1][j + 1] is the distance between a[:i] and b[:j]
+    d = [[infinity] * (len(b) + 2)] + [[infinity] + [0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a) + 1):
+        d[i + 1][1] = i
+    for j in range(len(b) + 1):
+        d[1][j + 1] = j
+    last_row: Dict[str, int] = {}
+    for i in range(1, len(a) + 1):
+        last_column = 0
+        for j in range(1, len(b) + 1):
+            k, l = last_row.get(b[j-1], 0), last_column
+            if a[i-1] == b[j-1]:
+                cost, last_column = 0, j
+            else:
+                cost = 1
+            d[i + 1][j + 1] = min(d[i][j] + cost, d[i + 1][j] + 1, d[i][j + 1] + 1,
+                                  # Transposition of a[k-1] and a[i-1], with the characters between deleted or inserted
+                                  d[k][l] + (i - k - 1) + 1 + (j - l - 1))
+        last_row[a[i-1]] = i
+    return d[len(a) + 1][len(b) + 1]
+
+def build_domain_vocabulary(text: str, min_count: int = 2) -> List[str]:
+    """
+    Extracts the vocabulary of a domain text (e.g., the textbook).
+    Args:
+        text: Text of the domain document
+        min_count: Minimum number of occurrences for a word to be kept
+    Returns:
+        Sorted list of lowercase words
+    """
+    counts = Counter(WORD_PATTERN.findall(text.lower()))
+    return sorted(word for word, count in counts.items() if count >= min_count and len(word) > 1)
+
+def save_domain_vocabulary(vocabulary_path: str, words: List[str]):
+    """
+    Writes the domain vocabulary, one word per line (see build_spelling.py).
+    """
+    os.makedirs(os.path.dirname(vocabulary_path) or ".", exist_ok=True)
+    with open(vocabulary_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(words))
+
+def load_domain_vocabulary(vocabulary_path: str) -> List[str]:
+    """
+    Loads the domain vocabulary built by build_spelling.py.
+    Args:
+        vocabulary_path: Path to the vocabulary, one word per line
+    Returns:
+        List of lowercase words
+    Raises:
+        FileNotFoundError: If the vocabulary was not built
+    """
+    if not os.path.exists(vocabulary_path):
+        raise FileNotFoundError(f"Domain vocabulary {vocabulary_path} not found, build it with python build_spelling.py")
+    with open(vocabulary_path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def domain_spell_checker(words: List[str]) -> "SpellChecker":
+    """
+    Returns the English spell checker with the domain vocabulary added, so course
+    terms from the textbook are never flagged as misspellings.
+    """
+    from spellchecker import SpellChecker
+    spell = SpellChecker()
+    spell.word_frequency.load_words(words)
+    return spell
+
+class SpellingSuggester:
+    """
+    Symmetric-delete (SymSpell-style) spelling suggestion index over the dictionary
+    of a SpellChecker.
+    Every dictionary word is indexed by the deletes of its prefix once, offline by
+    build_spelling.py, so a suggestion is a handful of dictionary lookups instead of
+    pyspellchecker's edit-distance-2 search. Suggestions are memoized across calls.
+    """
+    def __init__(self,
+                 spell: "SpellChecker",
+                 index_path: str = SPELLING_INDEX_PATH,
+                 max_edit_distance: int = 2,
+                 prefix_length: int = 7,
+                 cache_size: int = 10000,
+                 build: bool = False):
+        """
+        Args:
+            spell: Spell checker whose dictionary is indexed
+            index_path: Path to the stored index
+            max_edit_distance: Largest edit distance of a suggestion
+            prefix_length: Number of leading characters of the words that are indexed
+            cache_size: Number of memoized suggestions
+            build: Whether to build and store the index; it is only loaded otherwise
+        Raises:
+            FileNotFoundError: If the index was not built
+            ValueError: If the index was built for another dictionary
+        """
+        self.spell = spell
+        self.index_path = index_path
+        self.max_edit_distance = max_edit_distance
+        self.prefix_length = prefix_length
+        self.frequencies: Dict[str, int] = self.spell.word_frequency.dictionary
+        self.words: List[str] = []
+        self.deletes: Dict[str, List[int]] = {}
+        if build:
+            self._build()
+        else:
+            self._load()
+        self.suggest = lru_cache(maxsize=cache_size)(self._suggest)
+
+    def _signature(self) -> tuple:
+        return (len(self.frequencies), self.spell.word_frequency.total_words, self.max_edit_distance, self.prefix_length)
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            raise FileNotFoundError(f"Spelling index {self.index_path} not found, build it with python build_spelling.py")
+        with open(self.index_path, "rb") as f:
+            index = pickle.load(f)
+        # The index is stale if the dictionary (e.g., the domain vocabulary) changed
+        if index["signature"] != self._signature():
+            raise ValueError(f"Spelling index {self.index_path} does not match the dictionary, "
+                             "rebuild it with python build_spelling.py")
+        self.words = index["words"]
+        self.deletes = index["deletes"]
+
+    def _build(self):
+        self.words = list(self.frequencies)
+        deletes: Dict[str, List[int]] = {}
+        for i, word in enumerate(self.words):
+            for delete in _deletes(word[:self.prefix_length], self.max_edit_distance):
+                deletes.setdefault(delete, []).append(i)
+        self.deletes = deletes
+
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        with open(self.index_path, "wb") as f:
+            pickle.dump({"signature": self._signature(), "words": self.words, "deletes": self.deletes}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _suggest(self, word: str) -> tuple:
+        """
+        Finds the dictionary words closest to word, like SpellChecker.candidates.
+        Args:
+            word: Lowercase word to correct
+        Returns:
+            Tuple of the known words at the smallest edit distance, most frequent first,
+            or (word,) if no word is within max_edit_distance
+        """
+        if word in self.frequencies:
+            return (word,)
+
+        best_distance = self.max_edit_distance + 1
+        best: Set[str] = set()
+        seen: Set[int] = set()
+        for delete in _deletes(word[:self.prefix_length], self.max_edit_distance):
+            for i in self.deletes.get(delete, ()):
+                if i in seen:
+                    continue
+                seen.add(i)
+                candidate = self.words[i]
+                distance = _edit_distance(word, candidate, min(best_distance, self.max_edit_distance))
+                if distance > self.max_edit_distance:
+                    continue
+                if distance < best_distance:
+                    best_distance = distance
+                    best = {candidate}
+                elif distance == best_distance:
+                    best.add(candidate)
+
+        if not best:
+            return (word,)
+        return tuple(sorted(best, key=lambda w: (-self.frequencies[w], w)))
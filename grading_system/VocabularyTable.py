@@ -0,0 +1,136 @@
+import os
+import json
+import threading
+from typing import Dict, Iterable, List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+VOCABULARY_DIR = "./index/vocabulary"
+
+def vocabulary_path(model_name: str) -> str:
+    """
+    Returns the directory of the vocabulary table of an embedding model.
+    """
+    return os.path.join(VOCABULARY_DIR, model_name.replace("/", "--").replace(":", "-"))
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+class VocabularyTable:
+    """
+    Precomputed word embeddings, stored as a memory-mapped float32 matrix
+    (vectors.f32) with a word-to-row index (words.json).
+    Embedding a known word is a row lookup; only out-of-vocabulary words are run
+    through the model. Words are only appended to the table by add(), which
+    build_vocabulary.py calls on a table opened with write_back.
+    Only pages of the rows that are read are loaded in memory.
+    """
+    def __init__(self, path: str, embeddings: Embeddings, write_back: bool = False):
+        """
+        Args:
+            path: Directory of the table, see vocabulary_path
+            embeddings: Model used for out-of-vocabulary words
+            write_back: Whether add() may append words to the table. The files are not locked,
+                so only build_vocabulary.py opens the table for writing, in a single process
+        """
+        self.path = path
+        self.embeddings = embeddings
+        self.write_back = write_back
+        self.index: Dict[str, int] = {}
+        self.dim = 0
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.path, "vectors.f32")
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.path, "words.json")
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.index
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.index = {word: row for row, word in enumerate(meta["words"])}
+        self.dim = meta["dim"]
+        # Rows past the index (e.g., from an interrupted append) are ignored
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.index), self.dim)) \
+            if self.index else np.zeros((0, self.dim), dtype=np.float32)
+
+    def _append(self, words: List[str], vectors: np.ndarray):
+        """
+        Appends rows to the matrix first and then replaces the index, so the index
+        never points past the end of the matrix.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        rows = len(self.index)
+        self.dim = vectors.shape[1]
+        # Release the mapping before growing the file
+        self.vectors = None
+        with open(self.vectors_path, "r+b" if os.path.exists(self.vectors_path) else "wb") as f:
+            f.seek(rows * self.dim * 4)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        for word in words:
+            self.index[word] = len(self.index)
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "words": list(self.index)}, f)
+        os.replace(temp_path, self.index_path)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.index), self.dim))
+
+    def add(self, words: Iterable[str], batch_size: int = 1024):
+        """
+        Embeds the words missing from the table and appends them, batch by batch.
+        Args:
+            words: Words to add
+            batch_size: Number of words embedded and written at a time
+        """
+        if not self.write_back:
+            raise ValueError(f"The vocabulary table {self.path} is read-only, build it with build_vocabulary.py")
+        missing = [word for word in dict.fromkeys(words) if word and word not in self.index]
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            vectors = _normalize(np.asarray(self.embeddings.embed_documents(batch), dtype=np.float32))
+            with self._lock:
+                new = [(word, vector) for word, vector in zip(batch, vectors) if word not in self.index]
+                if new:
+                    self._append([word for word, _ in new], np.vstack([vector for _, vector in new]))
+
+    def lookup(self, words: List[str]) -> np.ndarray:
+        """
+        Returns the L2-normalized embeddings of words.
+        Args:
+            words: Words to embed, lowercase as in ParsedAssignment.content_words
+        Returns:
+            Array of shape (len(words), dim)
+        """
+        # The index and the mapping are replaced together by add()
+        with self._lock:
+            missing = [word for word in dict.fromkeys(words) if word not in self.index]
+            if not missing:
+                return np.asarray(self.vectors[[self.index[word] for word in words]])
+        # Out-of-vocabulary words are embedded without being stored
+        computed = dict(zip(missing, _normalize(
+            np.asarray(self.embeddings.embed_documents(missing), dtype=np.float32))))
+
+        dim = next(iter(computed.values())).shape[0]
+        result = np.empty((len(words), dim), dtype=np.float32)
+        with self._lock:
+            known = [i for i, word in enumerate(words) if word not in computed]
+            if known:
+                result[known] = self.vectors[[self.index[words[i]] for i in known]]
+        for i, word in enumerate(words):
+            if word in computed:
+                result[i] = computed[word]
+        return result
@@ -0,0 +1,108 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+import numpy as np
+
+@dataclass(frozen=True)
+class WordMatrix:
+    """
+    The content words of a text with their normalized embeddings.
+    Each distinct (text, lemma) pair is kept once with its number of occurrences,
+    and each distinct text is embedded once.
+    """
+    texts: np.ndarray
+    """Text of each distinct (text, lemma) pair"""
+    lemmas: np.ndarray
+    """Lemma of each distinct (text, lemma) pair"""
+    counts: np.ndarray
+    """Number of occurrences of each distinct (text, lemma) pair"""
+    rows: np.ndarray
+    """Row of vectors holding the embedding of each pair's text"""
+    vectors: np.ndarray
+    """L2-normalized embeddings of the distinct texts"""
+
+    @classmethod
+    def from_words(cls,
+                   words: Sequence[Tuple[str, str]],
+                   embed_documents: Callable[[List[str]], Union[List[List[float]], np.ndarray]]) -> "WordMatrix":
+        """
+        Embeds the distinct words of a text with a single batched call.
+        Args:
+            words: (text, lemma) of every content word, duplicates included
+            embed_documents: Batched embedding function, e.g. Embeddings.embed_documents
+                or VocabularyTable.lookup
+        Returns:
+            WordMatrix of the words
+        """
+        pairs = {}
+        for word in words:
+            pairs[word] = pairs.get(word, 0) + 1
+        distinct_texts = list(dict.fromkeys(text for text, _ in pairs))
+        text_rows = {text: i for i, text in enumerate(distinct_texts)}
+
+        if distinct_texts:
+            vectors = np.asarray(embed_documents(distinct_texts), dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+        else:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+
+        return cls(
+            texts=np.array([text for text, _ in pairs], dtype=object),
+            lemmas=np.array([lemma for _, lemma in pairs], dtype=object),
+            counts=np.array(list(pairs.values()), dtype=np.float32),
+            rows=np.array([text_rows[text] for text, _ in pairs], dtype=np.intp),
+            vectors=vectors,
+        )
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def similarity(self, other: "WordMatrix") -> float:
+        """
+        Word-level similarity: the best match in other for every word of this text,
+        averaged over all occurrences. Words with the same text or lemma match exactly.
+        Args:
+            other: WordMatrix of the text to compare against
+        Returns:
+            Average of the per-word maximum cosine similarities
+        """
+        return float(similarity_matrix([self], [other])[0, 0])
+
+def similarity_matrix(matrices1: Sequence[WordMatrix], matrices2: Sequence[WordMatrix]) -> np.ndarray:
+    """
+    Word-level similarity (see WordMatrix.similarity) of every pair of texts.
+    For each text of matrices1, the similarities to the words of all texts of matrices2
+    are one (words x all words of matrices2) matrix, reduced to the best match in each text.
+    Args:
+        matrices1: WordMatrix of each text compared (e.g., assignments)
+        matrices2: WordMatrix of each text compared against (e.g., rubric phrases)
+    Returns:
+        Array of shape (len(matrices1), len(matrices2))
+    """
+    result = np.zeros((len(matrices1), len(matrices2)), dtype=np.float32)
+    columns = [(j, m) for j, m in enumerate(matrices2) if len(m) > 0]
+    if not columns:
+        return result
+    vectors2 = np.vstack([m.vectors for _, m in columns])
+    offsets = np.cumsum([0] + [m.vectors.shape[0] for _, m in columns])
+    # Every word of every text of matrices2, as a row of vectors2; starts[k] is the first word of the k-th text
+    rows2 = np.concatenate([offset + m.rows for (_, m), offset in zip(columns, offsets)])
+    starts = np.cumsum([0] + [len(m) for _, m in columns])[:-1]
+    targets = np.array([j for j, _ in columns], dtype=np.intp)
+
+    # Compare strings as integer ids
+    ids: Dict[str, int] = {}
+    encode = lambda strings: np.array([ids.setdefault(s, len(ids)) for s in strings], dtype=np.intp)
+    texts2 = np.concatenate([encode(m.texts) for _, m in columns])
+    lemmas2 = np.concatenate([encode(m.lemmas) for _, m in columns])
+
+    for i, m1 in enumerate(matrices1):
+        if len(m1) == 0:
+            continue
+        texts1, lemmas1 = encode(m1.texts), encode(m1.lemmas)
+        sims = (m1.vectors @ vectors2.T)[np.ix_(m1.rows, rows2)]
+        exact = (texts1[:, None] == texts2[None, :]) | (lemmas1[:, None] == lemmas2[None, :])
+        # Best match of each word in each text of matrices2: (words x texts)
+        best = np.maximum.reduceat(np.where(exact, 1.0, sims), starts, axis=1)
+        result[i, targets] = m1.counts @ best / m1.counts.sum()
+    return result
@@ -1,13 +1,11 @@
-from GradingSystemSimilarity import GradingSystemSimilarity
-from GradingSystemLLM import GradingSystemLLM
-from GradingSystemDummy import GradingSystemDummy
-from utils import get_device
-
-def get_grading_system(method: str):
+def get_grading_system(method: str, **kwargs):
     """
     Initialize grading system and grade assignment
+    Keyword arguments are passed to GradingSystemLLM (e.g., single_call=True)
+    Only the grading system of the method is imported, so e.g. the LLM methods never import torch
     """
     if "test-chat" in method:
+        from GradingSystemDummy import GradingSystemDummy
         coefficient = 0.7
         if "low" in method:
             coefficient = 0.4
@@ -15,9 +13,21 @@ def get_grading_system(method: str):
             coefficient = 0.95
         grading_system = GradingSystemDummy(coefficient=coefficient)
     elif method == "similarity":
+        from GradingSystemSimilarity import GradingSystemSimilarity
+        from utils import get_device
         device = get_device()
         grading_system = GradingSystemSimilarity(device=device)
+    elif method == "similarity-chunked":
+        from GradingSystemSimilarity import GradingSystemSimilarity
+        from utils import get_device
+        # Long submissions are embedded as windows of sentences
+        grading_system = GradingSystemSimilarity(device=get_device(), chunked=True)
+    elif method == "similarity-onnx":
+        from GradingSystemSimilarity import GradingSystemSimilarity
+        # int8-quantized ONNX export of the same model, for CPU-only machines
+        grading_system = GradingSystemSimilarity(backend='onnx')
 
     else:
-        grading_system = GradingSystemLLM(model_name=method)
+        from GradingSystemLLM import GradingSystemLLM
+        grading_system = GradingSystemLLM(model_name=method, **kwargs)
     return grading_system
@@ -0,0 +1,147 @@
+import io
+import os
+import math
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+@dataclass(frozen=True)
+class ImagePreset:
+    """
+    How images are encoded before they are sent to a vision model.
+    """
+    max_pixels: Optional[int] = None
+    """Images larger than this are downscaled, keeping their aspect ratio; None keeps the size"""
+    format: Optional[str] = None
+    """"PNG", "JPEG" or "WEBP"; None sends the file as is"""
+    quality: int = 85
+    """Quality of the lossy formats, from 1 to 100"""
+
+IMAGE_PRESETS: Dict[str, ImagePreset] = {
+    "original": ImagePreset(),
+    "png-1mp": ImagePreset(max_pixels=1024 * 1024, format="PNG"),
+    "jpeg-1mp": ImagePreset(max_pixels=1024 * 1024, format="JPEG", quality=85),
+    "webp-1mp": ImagePreset(max_pixels=1024 * 1024, format="WEBP", quality=80),
+    "jpeg-0.5mp": ImagePreset(max_pixels=512 * 1024, format="JPEG", quality=85),
+}
+
+# Preset of each model, "original" for the models missing here
+# (benchmarks/bench_images.py measures the tokens, latency and accuracy of each preset)
+MODEL_IMAGE_PRESETS: Dict[str, str] = {}
+
+MIME_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp"}
+
+def image_preset(model_name: Optional[str] = None) -> str:
+    """
+    Returns the name of the image preset of a model.
+    """
+    return MODEL_IMAGE_PRESETS.get(model_name, "original")
+
+class _PayloadCache:
+    """
+    Least recently used encoded images, keyed by the hash of the file content and the preset,
+    up to max_bytes of base64 text.
+    """
+    def __init__(self, max_bytes: int = 256 * 2**20):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        # Content hash of each file by (path, modification time, size), so unchanged files are not read again
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+        self._lock = threading.Lock()
+
+    def digest(self, image_path: str) -> Tuple[str, Optional[bytes]]:
+        """
+        Returns the content hash of a file, with its content if it had to be read.
+        """
+        stat = os.stat(image_path)
+        key = (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest is not None:
+            return digest, None
+        with open(image_path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._digests[key] = digest
+        return digest, data
+
+    def get(self, key: Tuple[str, str]) -> Optional[str]:
+        with self._lock:
+            url = self._entries.get(key)
+            if url is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return url
+
+    def put(self, key: Tuple[str, str], url: str):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = url
+            self.size += len(url)
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+_cache = _PayloadCache()
+
+def _encode(data: bytes, image_path: str, preset: ImagePreset) -> str:
+    if preset.format is None and preset.max_pixels is None:
+        mime = MIME_TYPES.get(os.path.splitext(image_path)[1].lower(), "image/png")
+        return f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"
+    # Pillow is only needed by the presets that re-encode images
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        if preset.max_pixels is not None and image.width * image.height > preset.max_pixels:
+            scale = math.sqrt(preset.max_pixels / (image.width * image.height))
+            image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))),
+                                 Image.Resampling.LANCZOS)
+        image_format = preset.format or image.format or "PNG"
+        if image_format == "JPEG" and image.mode != "RGB":
+            # JPEG has no transparency: flatten onto white like a page
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image.convert("RGBA"), mask=image.convert("RGBA").getchannel("A"))
+            image = background
+        buffer = io.BytesIO()
+        options = {"optimize": True} if image_format == "PNG" else {"quality": preset.quality}
+        image.save(buffer, format=image_format, **options)
+    return f"data:image/{image_format.lower()};base64,{base64.b64encode(buffer.getvalue()).decode('utf-8')}"
+
+def encode_image(image_path: str, preset: str = "original") -> str:
+    """
+    Encodes an image file as a data URL. Encoded images are cached in memory
+    by content, so an image sent with many prompts is read and encoded once.
+    Args:
+        image_path: Path to the image file
+        preset: Name of the preset in IMAGE_PRESETS
+    Returns:
+        Data URL of the encoded image
+    """
+    digest, data = _cache.digest(image_path)
+    key = (digest, preset)
+    url = _cache.get(key)
+    if url is None:
+        if data is None:
+            with open(image_path, "rb") as f:
+                data = f.read()
+        url = _encode(data, image_path, IMAGE_PRESETS[preset])
+        _cache.put(key, url)
+    return url
+
+def image_cache_stats() -> Dict[str, float]:
+    """
+    Returns the hits, misses and size of the cache of encoded images.
+    """
+    with _cache._lock:
+        return {"hits": _cache.hits, "misses": _cache.misses, "entries": len(_cache._entries),
+                "size_mib": _cache.size / 2**20}
@@ -0,0 +1,201 @@
+import os
+import re
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+
+LLM_CACHE_PATH = "./cache/llm_responses.sqlite"
+
+DATA_URL_PATTERN = re.compile(r"data:[^;,]*;base64,[A-Za-z0-9+/=]+")
+
+_BYPASS: ContextVar[bool] = ContextVar("bypass_llm_cache", default=False)
+
+@contextmanager
+def bypass_llm_cache():
+    """
+    Skips the response cache for the LLM calls made inside the block,
+    e.g., to draw new samples at a temperature above 0.
+    """
+    token = _BYPASS.set(True)
+    try:
+        yield
+    finally:
+        _BYPASS.reset(token)
+
+def _canonical(value: Any) -> Any:
+    """
+    Canonical form of serialized messages: message ids are dropped and
+    base64 image payloads are replaced by their hash.
+    """
+    if isinstance(value, dict):
+        return {key: _canonical(item) for key, item in value.items() if key != "id" or not isinstance(item, str)}
+    if isinstance(value, list):
+        return [_canonical(item) for item in value]
+    if isinstance(value, str) and ";base64," in value:
+        return DATA_URL_PATTERN.sub(lambda m: "sha256:" + hashlib.sha256(m.group(0).encode("utf-8")).hexdigest(), value)
+    return value
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """
+    Content address of a model call.
+    Args:
+        prompt: Serialized messages, as passed by LangChain to the cache
+        llm_string: Model name, parameters (e.g., temperature) and call options
+            (e.g., the output schema), as passed by LangChain to the cache
+    Returns:
+        SHA-256 of the call
+    """
+    try:
+        prompt = json.dumps(_canonical(json.loads(prompt)), sort_keys=True)
+    except ValueError:
+        prompt = _canonical(prompt)
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+class SQLiteLLMCache(BaseCache):
+    """
+    Content-addressed cache of chat model responses in a SQLite file.
+    Entries expire after ttl seconds, and the least recently used entries
+    are evicted when the file exceeds max_bytes. The file can be shared by
+    several processes (e.g., Streamlit sessions and grade_all).
+    """
+    def __init__(self,
+                 model_name: str,
+                 cache_path: str = LLM_CACHE_PATH,
+                 ttl: Optional[float] = 30 * 24 * 3600,
+                 max_bytes: int = 256 * 2**20):
+        """
+        Args:
+            model_name: Name of the model, used to report statistics per model
+            cache_path: Path to the SQLite file
+            ttl: Lifetime of an entry in seconds, None to keep entries until evicted
+            max_bytes: Maximum total size of the stored responses
+        """
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'bypassed': 0, 'expired': 0, 'evictions': 0}
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        # Total size of the responses, kept by triggers in the transaction of each write (including
+        # expirations and clear), so that update does not sum the whole table. Seeded after the triggers exist
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses_size (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)")
+        self._conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS responses_size_insert AFTER INSERT ON responses "
+            "BEGIN UPDATE responses_size SET size = size + NEW.size; END")
+        self._conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS responses_size_update AFTER UPDATE OF size ON responses "
+            "BEGIN UPDATE responses_size SET size = size + NEW.size - OLD.size; END")
+        self._conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS responses_size_delete AFTER DELETE ON responses "
+            "BEGIN UPDATE responses_size SET size = size - OLD.size; END")
+        self._conn.execute(
+            "INSERT OR IGNORE INTO responses_size (id, size) SELECT 0, COALESCE(SUM(size), 0) FROM responses")
+        self._conn.commit()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if _BYPASS.get():
+            with self._lock:
+                self._counters['bypassed'] += 1
+            return None
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._counters['expired'] += 1
+                row = None
+            if row is None:
+                self._counters['misses'] += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._counters['hits'] += 1
+        generations = pickle.loads(row[0])
+        for generation in generations:
+            # Lets callers tell responses served from the cache from paid calls
+            message = getattr(generation, 'message', None)
+            if message is not None:
+                message.response_metadata['llm_cache_hit'] = True
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if _BYPASS.get():
+            return
+        key = cache_key(prompt, llm_string)
+        value = pickle.dumps(return_val, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._lock:
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete does not fire the size trigger
+            self._conn.execute(
+                "INSERT INTO responses (key, model, value, size, created, last_access) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET model = excluded.model, value = excluded.value, size = excluded.size, "
+                "created = excluded.created, last_access = excluded.last_access, hits = 0",
+                (key, self.model_name, value, len(value), now, now))
+            total = self._conn.execute("SELECT size FROM responses_size").fetchone()[0]
+            if total > self.max_bytes:
+                # Evict the least recently used entries down to 90% of the budget
+                excess = total - int(self.max_bytes * 0.9)
+                victims = []
+                for rowid, size in self._conn.execute("SELECT rowid, size FROM responses ORDER BY last_access"):
+                    if excess <= 0:
+                        break
+                    victims.append((rowid,))
+                    excess -= size
+                self._conn.executemany("DELETE FROM responses WHERE rowid = ?", victims)
+                self._counters['evictions'] += len(victims)
+            self._conn.commit()
+
+    def clear(self, **kwargs: Any) -> None:
+        """
+        Removes the responses of this model.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE model = ?", (self.model_name,))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the hit, miss and eviction counters of this process with its hit rate.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+_caches: Dict[str, SQLiteLLMCache] = {}
+_caches_lock = threading.Lock()
+
+def get_llm_cache(model_name: str, cache_path: str = LLM_CACHE_PATH) -> SQLiteLLMCache:
+    """
+    Returns the response cache of a model, shared by every instance of the model in this process.
+    """
+    with _caches_lock:
+        if model_name not in _caches:
+            _caches[model_name] = SQLiteLLMCache(model_name, cache_path)
+        return _caches[model_name]
+
+if __name__ == "__main__":
+    with sqlite3.connect(LLM_CACHE_PATH) as conn:
+        for model, entries, size, hits in conn.execute(
+                "SELECT model, COUNT(*), SUM(size), SUM(hits) FROM responses GROUP BY model"):
+            print(f"{model}: {entries} responses, {size / 2**20:.1f} MiB, {hits} hits "
+                  f"({hits / (hits + entries):.0%} of calls served from the cache)")
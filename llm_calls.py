@@ -0,0 +1,275 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from contextvars import copy_context
+from typing import Any, Dict, Optional
+import numpy as np
+from langchain_core.runnables import Runnable
+from llm_telemetry import call_site, current_call_site
+from llm_utils import is_local_model
+
+DEFAULT_DEADLINE = 120.0
+# Deadlines of the stages (see llm_telemetry.call_site) that differ from the default, None to wait
+# indefinitely: a rubric is generated once, with several images and up to max_tokens of output
+STAGE_DEADLINES: Dict[str, Optional[float]] = {"rubric": None}
+
+# Threads that run the calls, so a caller can stop waiting at its deadline
+_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="llm-call")
+
+def is_overload(error: BaseException) -> bool:
+    """
+    Whether an error means the provider is overloaded: HTTP 429 or 503, or a rate limit error.
+    """
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status in (429, 503) or "RateLimit" in type(error).__name__
+
+def _cache_hit(output: Any) -> bool:
+    """
+    Whether an output was served from the local response cache (see llm_cache).
+    """
+    raw = output.get("raw") if isinstance(output, dict) else output
+    return bool((getattr(raw, "response_metadata", None) or {}).get("llm_cache_hit"))
+
+class AdaptiveLimiter:
+    """
+    Limits the number of calls in flight with additive increase and multiplicative decrease (AIMD):
+    the limit grows by about one per limit healthy calls and is cut on overload, at most once
+    for the calls that were in flight when it was last cut.
+    """
+    def __init__(self, initial: int = 8, minimum: int = 1, maximum: int = 32, decrease: float = 0.5):
+        """
+        Args:
+            initial: Initial number of calls in flight
+            minimum: Lowest limit
+            maximum: Highest limit
+            decrease: Factor applied to the limit on overload
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout: Optional[float] = None, blocking: bool = True) -> bool:
+        """
+        Takes a call slot.
+        Args:
+            timeout: Maximum time to wait for a slot in seconds, None to wait indefinitely
+            blocking: Whether to wait for a slot if none is free
+        Returns:
+            Whether a slot was taken
+        """
+        with self._condition:
+            if not blocking:
+                free = self.in_flight < int(self.limit)
+            else:
+                free = self._condition.wait_for(lambda: self.in_flight < int(self.limit), timeout)
+            if free:
+                self.in_flight += 1
+            return free
+
+    def release(self, started: float, healthy: Optional[bool]):
+        """
+        Frees a call slot and adapts the limit.
+        Args:
+            started: time.monotonic() when the call started
+            healthy: True to increase the limit, False to decrease it, None to keep it
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if healthy:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            elif healthy is False and started >= self._last_decrease:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self._last_decrease = time.monotonic()
+            self._condition.notify_all()
+
+class LLMCaller:
+    """
+    Invokes the LLMs of one model with a deadline per call, which depends on the stage
+    of the call (see STAGE_DEADLINES). When a call takes longer
+    than the recent p95 latency of the calls from the same stage (see llm_telemetry.call_site),
+    a duplicate (hedged) request is sent and the first successful answer is kept. The calls in flight are limited by an AdaptiveLimiter
+    that backs off on rate limits and deadline misses.
+    """
+    def __init__(self,
+                 model_name: str,
+                 deadline: Optional[float] = DEFAULT_DEADLINE,
+                 stage_deadlines: Optional[Dict[str, Optional[float]]] = None,
+                 hedge: bool = True,
+                 hedge_quantile: float = 95,
+                 min_samples: int = 20,
+                 max_hedge_rate: float = 0.1,
+                 limiter: Optional[AdaptiveLimiter] = None):
+        """
+        Args:
+            model_name: Name of the model, used in error messages
+            deadline: Default time limit of a call in seconds, including the wait for a slot,
+                None to wait indefinitely
+            stage_deadlines: Time limits of the stages that differ from deadline, STAGE_DEADLINES if None
+            hedge: Whether slow calls are hedged; False for local servers, where a duplicate
+                request waits behind the original
+            hedge_quantile: Percentile of the recent latencies after which a call is hedged
+            min_samples: Number of latencies observed in a stage before its calls are hedged
+            max_hedge_rate: Maximum ratio of hedged requests to calls
+            limiter: Limiter of the calls in flight
+        """
+        self.model_name = model_name
+        self.deadline = deadline
+        self.stage_deadlines = STAGE_DEADLINES if stage_deadlines is None else stage_deadlines
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.min_samples = min_samples
+        self.max_hedge_rate = max_hedge_rate
+        self.limiter = limiter or AdaptiveLimiter()
+        # Recent latencies per stage: e.g., one-token retrievals and long rubric generations
+        # of the same model have nothing in common
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._counters = {'calls': 0, 'hedges': 0, 'hedge_wins': 0, 'timeouts': 0, 'overloads': 0, 'errors': 0}
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counters[name] += n
+
+    def hedge_delay(self, stage: str = "other") -> Optional[float]:
+        """
+        Returns the latency after which a call of a stage is hedged, None until enough calls are observed.
+        """
+        with self._lock:
+            latencies = self._latencies.get(stage, ())
+            if len(latencies) < self.min_samples:
+                return None
+            return float(np.percentile(latencies, self.hedge_quantile))
+
+    def _hedge_allowed(self) -> bool:
+        with self._lock:
+            return self._counters['hedges'] < self.max_hedge_rate * self._counters['calls'] + 1
+
+    def _run(self, runnable: Runnable, input: Any, kwargs: Dict, deadline: Optional[float], stage: str,
+             hedge: bool) -> Any:
+        """
+        Runs one request in a worker thread, holding its slot until the provider answers.
+        """
+        started = time.monotonic()
+        healthy = None
+        try:
+            if hedge:
+                with call_site(hedge=True):
+                    output = runnable.invoke(input, **kwargs)
+            else:
+                output = runnable.invoke(input, **kwargs)
+        except Exception as e:
+            if is_overload(e):
+                self._count('overloads')
+                healthy = False
+            raise
+        else:
+            latency = time.monotonic() - started
+            if not _cache_hit(output):
+                with self._lock:
+                    latencies = self._latencies.setdefault(stage, deque(maxlen=200))
+                    median = float(np.median(latencies)) if latencies else latency
+                    latencies.append(latency)
+                # Calls past the deadline are congestion, calls much slower than usual do not grow the limit
+                healthy = False if deadline is not None and latency > deadline else \
+                    (True if latency <= 2 * median else None)
+            return output
+        finally:
+            self.limiter.release(started, healthy)
+
+    def _submit(self, runnable: Runnable, input: Any, kwargs: Dict, deadline: Optional[float], stage: str,
+                hedge: bool = False) -> Future:
+        # Each request runs in a copy of the caller's context (e.g., bypass_llm_cache, call_site)
+        return _executor.submit(copy_context().run, self._run, runnable, input, kwargs, deadline, stage, hedge)
+
+    def invoke(self, runnable: Runnable, input: Any, deadline: Optional[float] = None, hedge: bool = True,
+               **kwargs) -> Any:
+        """
+        Invokes a runnable (e.g., a chat model or its structured output) like runnable.invoke.
+        Args:
+            runnable: Runnable to invoke
+            input: Input of the runnable, e.g., the messages
+            deadline: Time limit of the call in seconds, the deadline of its stage if None
+            hedge: Whether a slow call may be hedged; False when a duplicate would wait in the same
+                queue, e.g., for requests pinned to a llama-server slot. Never for callers created
+                with hedge=False
+            kwargs: Keyword arguments of runnable.invoke
+        Returns:
+            The output of the first request that succeeds
+        Raises:
+            TimeoutError: If no request succeeds before the deadline
+            Exception: The error of the call if every request fails
+        """
+        stage = current_call_site().get("stage", "other")
+        if deadline is None:
+            deadline = self.stage_deadlines.get(stage, self.deadline)
+        start = time.monotonic()
+        self._count('calls')
+        if not self.limiter.acquire(timeout=deadline):
+            self._count('timeouts')
+            raise TimeoutError(f"No call slot free for {self.model_name} within {deadline:g}s")
+        primary = self._submit(runnable, input, kwargs, deadline, stage)
+        pending = {primary}
+        delay = self.hedge_delay(stage) if hedge and self.hedge else None
+        error = None
+        while pending:
+            now = time.monotonic()
+            timeout = None if deadline is None else start + deadline - now
+            if timeout is not None and timeout <= 0:
+                break
+            if delay is not None:
+                hedge_timeout = max(0.0, start + delay - now)
+                timeout = hedge_timeout if timeout is None else min(timeout, hedge_timeout)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count('hedge_wins')
+                    return future.result()
+                error = error or future.exception()
+            if delay is not None and not done and time.monotonic() - start >= delay:
+                # Hedge once, and only with a free slot so hedges never add load past the limit
+                delay = None
+                if self._hedge_allowed() and self.limiter.acquire(blocking=False):
+                    self._count('hedges')
+                    pending.add(self._submit(runnable, input, kwargs, deadline, stage, hedge=True))
+        if error is not None and not pending:
+            self._count('errors')
+            raise error
+        self._count('timeouts')
+        raise TimeoutError(f"{self.model_name} did not answer within {deadline:g}s")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the counters of this process with the current limit and the hedge delay of each stage.
+        """
+        with self._lock:
+            stages = list(self._latencies)
+        delay = {stage: self.hedge_delay(stage) for stage in stages}
+        with self._lock:
+            stats = dict(self._counters)
+        stats['limit'] = self.limiter.limit
+        stats['in_flight'] = self.limiter.in_flight
+        stats['hedge_delay'] = delay
+        return stats
+
+_callers: Dict[str, LLMCaller] = {}
+_callers_lock = threading.Lock()
+
+def get_caller(model_name: str) -> LLMCaller:
+    """
+    Returns the caller of a model, shared by every instance of the model in this process
+    so that its concurrency limit follows the rate limits of the provider.
+    Calls to local servers have no deadline and are not hedged: the server runs the
+    requests in turn, so slow calls are expected and a duplicate would queue behind them.
+    """
+    with _callers_lock:
+        if model_name not in _callers:
+            local = is_local_model(model_name)
+            _callers[model_name] = LLMCaller(model_name, deadline=None if local else DEFAULT_DEADLINE,
+                                             hedge=not local)
+        return _callers[model_name]
@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+TELEMETRY_PATH = "./logs/llm_calls.jsonl"
+
+# USD per million (input, cached input, output) tokens; models missing here run locally for free
+PRICES = {
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "o4-mini": (1.10, 0.275, 4.40),
+    "deepseek-chat": (0.28, 0.028, 0.42),
+}
+
+_CALL_SITE: ContextVar[Dict[str, Any]] = ContextVar("llm_call_site", default={})
+# HTTP attempts of the model call running in this context, set by TelemetryHandler
+_ATTEMPTS: ContextVar[Optional[List[int]]] = ContextVar("llm_attempts", default=None)
+
+@contextmanager
+def call_site(stage: Optional[str] = None, **fields):
+    """
+    Labels the LLM calls made inside the block in the telemetry records.
+    Nested blocks add their fields to the enclosing ones.
+    Args:
+        stage: Stage of the pipeline, e.g., "grading", "rubric", "retrieval" or "chat"
+        fields: Details of the call site, e.g., the criterion being graded
+    """
+    site = dict(_CALL_SITE.get())
+    if stage is not None:
+        site["stage"] = stage
+    site.update(fields)
+    token = _CALL_SITE.set(site)
+    try:
+        yield
+    finally:
+        _CALL_SITE.reset(token)
+
+def current_call_site() -> Dict[str, Any]:
+    """
+    Returns the labels of the enclosing call_site blocks.
+    """
+    return dict(_CALL_SITE.get())
+
+def count_attempts(request: Any) -> None:
+    """
+    Request event hook of the httpx clients of the models (e.g., llm_utils._http_client):
+    counts every request sent for the model call running in this context, so the retries
+    of the provider SDKs, and the connection retries of the transport.
+    """
+    attempts = _ATTEMPTS.get()
+    if attempts is None:
+        return
+    attempts[0] += 1
+    def trace(event: str, info: Dict) -> None:
+        if event == "connection.retry.started":
+            attempts[0] += 1
+    request.extensions["trace"] = trace
+
+async def acount_attempts(request: Any) -> None:
+    """
+    count_attempts for async httpx clients.
+    """
+    attempts = _ATTEMPTS.get()
+    if attempts is None:
+        return
+    attempts[0] += 1
+    async def trace(event: str, info: Dict) -> None:
+        if event == "connection.retry.started":
+            attempts[0] += 1
+    request.extensions["trace"] = trace
+
+def cost(record: Dict) -> float:
+    """
+    Returns the cost of a recorded call in USD.
+    """
+    input_price, cached_price, output_price = PRICES.get(record["model"], (0.0, 0.0, 0.0))
+    cached = record.get("cached_tokens", 0)
+    return ((record.get("input_tokens", 0) - cached) * input_price + cached * cached_price +
+            record.get("output_tokens", 0) * output_price) / 1e6
+
+class JSONLSink:
+    """
+    Append-only JSONL file of telemetry records, one line per call.
+    """
+    def __init__(self, path: str = TELEMETRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def write(self, record: Dict):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+class TelemetryHandler(BaseCallbackHandler):
+    """
+    Records the model, call site, tokens, time to first token, latency and retries
+    of every chat model call to a sink. Retries are counted by the request hooks of
+    the HTTP clients (see count_attempts).
+    """
+    run_inline = True
+
+    def __init__(self, model_name: str, sink: JSONLSink):
+        self.model_name = model_name
+        self.sink = sink
+        self._runs: Dict[UUID, Dict] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID,
+                            **kwargs: Any) -> None:
+        # The call site is read here, in the thread and context of the caller, which
+        # also sends the requests of the call
+        attempts = [0]
+        _ATTEMPTS.set(attempts)
+        with self._lock:
+            self._runs[run_id] = {"start": time.time(), "first_token": None, "attempts": attempts,
+                                  "site": _CALL_SITE.get()}
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is not None and run["first_token"] is None:
+                run["first_token"] = time.time()
+
+    def _record(self, run_id: UUID, **fields) -> None:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        end = time.time()
+        record = {
+            "time": run["start"],
+            "model": self.model_name,
+            **run["site"],
+            "latency": end - run["start"],
+            "ttft": run["first_token"] - run["start"] if run["first_token"] is not None else None,
+            # No attempt for responses from the cache or clients without the hook
+            "retries": max(run["attempts"][0] - 1, 0),
+            **fields,
+        }
+        record.setdefault("stage", "other")
+        self.sink.write(record)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        message = getattr(response.generations[0][0], "message", None) if response.generations and response.generations[0] else None
+        usage = getattr(message, "usage_metadata", None) or {}
+        metadata = getattr(message, "response_metadata", None) or {}
+        cache_hit = bool(metadata.get("llm_cache_hit"))
+        cached = (usage.get("input_token_details") or {}).get("cache_read")
+        if cached is None:
+            # DeepSeek reports its context cache hits in the raw token usage
+            cached = ((response.llm_output or {}).get("token_usage") or {}).get("prompt_cache_hit_tokens") or 0
+        self._record(
+            run_id,
+            # Responses served from the local response cache cost no tokens
+            input_tokens=0 if cache_hit else usage.get("input_tokens", 0),
+            cached_tokens=0 if cache_hit else cached,
+            output_tokens=0 if cache_hit else usage.get("output_tokens", 0),
+            llm_cache_hit=cache_hit,
+            error=None,
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._record(run_id, input_tokens=0, cached_tokens=0, output_tokens=0, llm_cache_hit=False,
+                     error=type(error).__name__)
+
+_sinks: Dict[str, JSONLSink] = {}
+_handlers: Dict[str, TelemetryHandler] = {}
+_handlers_lock = threading.Lock()
+
+def get_telemetry_handler(model_name: str, path: str = TELEMETRY_PATH) -> TelemetryHandler:
+    """
+    Returns the telemetry handler of a model, shared by every instance of the model in this process.
+    """
+    with _handlers_lock:
+        if model_name not in _handlers:
+            if path not in _sinks:
+                _sinks[path] = JSONLSink(path)
+            _handlers[model_name] = TelemetryHandler(model_name, _sinks[path])
+        return _handlers[model_name]
+
+def load_records(path: str = TELEMETRY_PATH, since: Optional[float] = None) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Line cut by an interrupted write
+                continue
+            if since is None or record["time"] >= since:
+                yield record
+
+def report(records: List[Dict], key: str) -> List[List[str]]:
+    """
+    Aggregates the calls by model or by stage.
+    Args:
+        records: Telemetry records
+        key: "model" or "stage"
+    Returns:
+        Rows of the report table
+    """
+    groups: Dict[str, List[Dict]] = {}
+    for record in records:
+        groups.setdefault(record.get(key, "other"), []).append(record)
+    rows = []
+    for name, group in sorted(groups.items()):
+        # Latencies of the calls that reached the model
+        latencies = [r["latency"] for r in group if not r["llm_cache_hit"] and r["error"] is None]
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+        ttfts = [r["ttft"] for r in group if r.get("ttft") is not None]
+        rows.append([
+            name,
+            str(len(group)),
+            f"{p50:.2f}", f"{p95:.2f}", f"{p99:.2f}",
+            f"{np.median(ttfts):.2f}" if ttfts else "-",
+            str(sum(r["input_tokens"] for r in group)),
+            str(sum(r["cached_tokens"] for r in group)),
+            str(sum(r["output_tokens"] for r in group)),
+            str(sum(r["llm_cache_hit"] for r in group)),
+            str(sum(r["error"] is not None for r in group)),
+            str(sum(r["retries"] for r in group)),
+            # Duplicates sent by llm_calls
+            str(sum(bool(r.get("hedge")) for r in group)),
+            f"{sum(cost(r) for r in group):.4f}",
+        ])
+    return rows
+
+def print_table(header: List[str], rows: List[List[str]]):
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(cell.rjust(width) if i else cell.ljust(width) for i, (cell, width) in enumerate(zip(row, widths))))
+
+if __name__ == "__main__":
+    # Latency, tokens and cost of the recorded LLM calls per model and per stage
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default=TELEMETRY_PATH)
+    parser.add_argument("--days", type=float, default=None, help="only report the calls of the last days")
+    args = parser.parse_args()
+
+    since = time.time() - args.days * 86400 if args.days is not None else None
+    records = list(load_records(args.path, since))
+    for key in ("model", "stage"):
+        print_table([key, "calls", "p50 (s)", "p95 (s)", "p99 (s)", "ttft (s)", "input", "cached", "output",
+                     "cache hits", "errors", "retries", "hedges", "cost ($)"], report(records, key))
+        print()
@@ -1,58 +1,179 @@
 import re
-import base64
-from typing import Optional, List
+import threading
+from typing import Any, Dict, Optional, Tuple
+import httpx
 from dotenv import load_dotenv
-from langchain_deepseek import ChatDeepSeek
-from langchain_openai import ChatOpenAI
-from langchain_ollama import ChatOllama
 from langchain_core.language_models.chat_models import BaseChatModel
 from ChatLlamaCppServer import ChatLlamaCppServer
+from llm_cache import get_llm_cache
+from llm_telemetry import count_attempts, get_telemetry_handler
+from image_encoding import encode_image, image_preset
 
 load_dotenv()
 
+_models: Dict[Tuple, BaseChatModel] = {}
+_warmed_up = set()
+# Models served on this machine by Ollama; the other "vl" models by llama-server
+OLLAMA_MODELS = ("deepseek-r1", "qwen2.5vl")
+
+_http_clients: Dict[str, httpx.Client] = {}
+_models_lock = threading.Lock()
+
+def _http_client(provider: str) -> httpx.Client:
+    """
+    Returns the keep-alive connection pool of an API provider, shared by all of its models.
+    Must be called with _models_lock held.
+    """
+    if provider not in _http_clients:
+        from openai import DefaultHttpxClient
+        _http_clients[provider] = DefaultHttpxClient(
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            # Counts the SDK's retries in the telemetry records
+            event_hooks={"request": [count_attempts]})
+    return _http_clients[provider]
+
+def is_local_model(model_name: str) -> bool:
+    """
+    Whether a model runs on a local server (Ollama or llama-server) rather than behind a provider API.
+    """
+    if model_name in OLLAMA_MODELS:
+        return True
+    return model_name != "deepseek-chat" and "gpt" not in model_name and not re.search(r"o\d", model_name) \
+        and "vl" in model_name
+
 def get_model(
         model_name: str,
         temperature: Optional[float] = 0.0,
         max_tokens: Optional[int] = 2048,
         max_retries: Optional[int] = 3,
-        server_url: Optional[str] = "http://127.0.0.1:8080/v1/chat/completions"
+        server_url: Optional[str] = "http://127.0.0.1:8080/v1/chat/completions",
+        cache: Optional[bool] = None,
+        warm_up: bool = False,
+        **kwargs: Any
+        ) -> BaseChatModel:
+    """
+    Returns the chat model of model_name. Models are shared by every caller in the process
+    that asks for the same arguments, so they must not be modified: derive variants
+    with bind or with_structured_output instead.
+    Args:
+        model_name: Name of the model
+        temperature: Sampling temperature
+        max_tokens: Maximum number of output tokens
+        max_retries: Maximum number of retries of a failed request
+        server_url: URL of the llama.cpp server for the models it serves
+        cache: Whether to cache responses on disk, by default when temperature is 0
+        warm_up: Whether to open a connection to the provider in the background,
+            so the first request does not pay for the TCP and TLS handshakes
+        kwargs: Other parameters of the model class, e.g., timeout
+    Returns:
+        The chat model
+    """
+    key = (model_name, temperature, max_tokens, max_retries, server_url, cache, repr(sorted(kwargs.items())))
+    with _models_lock:
+        if key not in _models:
+            _models[key] = _create_model(model_name, temperature, max_tokens, max_retries, server_url, cache, **kwargs)
+        llm = _models[key]
+        warm_up = warm_up and key not in _warmed_up
+        if warm_up:
+            _warmed_up.add(key)
+    if warm_up:
+        threading.Thread(target=warm_up_model, args=(llm,), daemon=True).start()
+    return llm
+
+def warm_up_model(llm: BaseChatModel):
+    """
+    Opens a keep-alive connection to the provider of a model with a request that generates no tokens.
+    Failures are ignored; the first real request reports them.
+    """
+    try:
+        if isinstance(llm, ChatLlamaCppServer):
+            llm.client.get(llm.server_url.split("/v1/")[0] + "/health")
+        # Checked by attribute so the other provider SDKs are not imported
+        elif hasattr(llm, "root_client"):  # ChatOpenAI and ChatDeepSeek
+            llm.root_client.models.list()
+        elif hasattr(llm, "_client") and hasattr(llm._client, "ps"):  # ChatOllama
+            llm._client.ps()
+    except Exception:
+        pass
+
+def _create_model(
+        model_name: str,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        max_retries: Optional[int],
+        server_url: Optional[str],
+        cache: Optional[bool],
+        **kwargs: Any
         ) -> BaseChatModel:
+    # o-series models only sample at temperature 1
+    if model_name not in ("deepseek-chat", "deepseek-r1", "qwen2.5vl") and re.search(r"o\d", model_name):
+        temperature = 1
+    # Responses are cached on disk unless the model samples at a temperature above 0
+    # (use llm_cache.bypass_llm_cache to skip the cache for a single call)
+    if cache is None:
+        cache = not temperature
+    llm_cache = get_llm_cache(model_name) if cache else None
+    # Every call is recorded to the telemetry log (see llm_telemetry.py)
+    callbacks = [get_telemetry_handler(model_name)]
+    # Provider SDKs take seconds to import, so only the one of the model is imported
     if model_name == "deepseek-chat":
+        from langchain_deepseek import ChatDeepSeek
         llm = ChatDeepSeek(
             model=model_name,
             temperature=temperature,
             max_tokens=max_tokens,
             max_retries=max_retries,
+            cache=llm_cache,
+            callbacks=callbacks,
+            http_client=_http_client("deepseek"),
+            **kwargs,
         )
-    elif model_name == "deepseek-r1" or model_name == "qwen2.5vl":
+    elif model_name in OLLAMA_MODELS:
+        from langchain_ollama import ChatOllama
         llm = ChatOllama(
             model=model_name,
             temperature=temperature,
             max_tokens=max_tokens,
             max_retries=max_retries,
+            cache=llm_cache,
+            callbacks=callbacks,
+            **kwargs,
         )
     elif "gpt" in model_name or re.search(r"o\d", model_name):
-        if re.search(r"o\d", model_name):
-            temperature = 1
+        from langchain_openai import ChatOpenAI
         llm = ChatOpenAI(
             model=model_name,
             temperature=temperature,
             max_tokens=max_tokens,
             max_retries=max_retries,
+            cache=llm_cache,
+            callbacks=callbacks,
+            http_client=_http_client("openai"),
+            **kwargs,
         )
     elif "vl" in model_name:
         llm = ChatLlamaCppServer(
             model=model_name,
-            server_url=server_url
+            temperature=temperature,
+            max_tokens=max_tokens,
+            max_retries=max_retries,
+            server_url=server_url,
+            cache_prompt=True,
+            cache=llm_cache,
+            callbacks=callbacks,
+            **kwargs,
         )
     else:
         raise NotImplementedError(f"Model {model_name} is not supported.")
     return llm
 
-def image_content(image_path: str) -> List[dict]:
-    with open(image_path, "rb") as f:
-        img_b64 = base64.b64encode(f.read()).decode("utf-8")
-    return {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_b64}"}}
+def image_content(image_path: str, model_name: Optional[str] = None, preset: Optional[str] = None) -> dict:
+    """
+    Returns the message content of an image, encoded with the image preset of the model
+    (see image_encoding.py) unless a preset is given.
+    """
+    url = encode_image(image_path, preset or image_preset(model_name))
+    return {"type": "image_url", "image_url": {"url": url}}
 
 if __name__ == "__main__":
     llm = get_model("qwen2.5-vl").bind(logprobs=True, top_logprobs=15)
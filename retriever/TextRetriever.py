@@ -1,9 +1,14 @@
-from typing import List, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Iterable, Optional
 from numpy import argsort
 from scipy.special import softmax
 from llm_utils import get_model, image_content
+from llm_calls import get_caller
+from llm_telemetry import call_site
 
 SERVER_URL  = "http://127.0.0.1:8080/v1/chat/completions"
+# Parallel slots of the llama-server (-np) the retrievers pin their candidates to, None to let the server choose
+SERVER_SLOTS = None
 
 class TextRetriever:
     def __init__(self,
@@ -11,6 +16,8 @@ class TextRetriever:
                  text_path: str,
                  base_messages: List[dict] = None,
                  top_logprobs: int = 15,
+                 max_concurrency: int = 8,
+                 n_slots: Optional[int] = SERVER_SLOTS,
                  **kwargs):
         self.model = get_model(
             model_name,
@@ -18,19 +25,25 @@ class TextRetriever:
             temperature=0,
             server_url=SERVER_URL
             ).bind(logprobs=True, top_logprobs=top_logprobs)
+        self.caller = get_caller(model_name)
+        self.model_name = model_name
         self.text_path = text_path
+        # One-token requests in flight at once, on the pooled connections of the model
+        self.max_concurrency = max_concurrency
+        # Parallel slots of the llama-server (-np) to pin the candidates to, None to let the server choose
+        self.n_slots = n_slots
         if base_messages is None:
             self.base_messages = []
         else:
             self.base_messages = base_messages
 
     def image_content(self, image_path: str) -> List[dict]:
-        return image_content(image_path)
+        return image_content(image_path, self.model_name)
 
     def get_user_content(self, problem: dict, document) -> List[dict]:
         raise NotImplementedError("This method should be implemented in subclasses.")
     
-    def get_choice_logprob(self, problem: dict, document) -> List[dict]:
+    def get_choice_logprob(self, problem: dict, document, slot: Optional[int] = None) -> List[dict]:
         # clone the base messages and append the forced‐completion prompt
         user_content = self.get_user_content(problem, document)
         msgs = self.base_messages + [{
@@ -38,7 +51,10 @@ class TextRetriever:
             "content": user_content
         }]
 
-        response = self.model.invoke(msgs)
+        model = self.model if slot is None else self.model.bind(id_slot=slot)
+        with call_site("retrieval", slot=slot):
+            # A hedged duplicate of a pinned request would only wait in the same slot
+            response = self.caller.invoke(model, msgs, hedge=slot is None)
         return response.response_metadata["logprobs"]["content"][0]["top_logprobs"]
 
     def get_prob(self, result: List[dict],
@@ -57,8 +73,21 @@ class TextRetriever:
     def retrieve_loop(self, problem: dict, documents: Iterable):
         scores = []
         correct_idx = problem["choices"].index(problem["answer"])
-        for doc in documents:
-            res = self.get_choice_logprob(problem, doc)
+        if self.n_slots:
+            # Each slot grades its share of the candidates in turn, so the prompt prefix shared
+            # by the candidates (instructions and problem) stays in the slot's KV cache and each
+            # extra candidate only costs its own tokens
+            documents = list(documents)
+            results = [None] * len(documents)
+            def run_slot(slot: int):
+                for i in range(slot, len(documents), self.n_slots):
+                    results[i] = self.get_choice_logprob(problem, documents[i], slot)
+            with ThreadPoolExecutor(max_workers=self.n_slots) as executor:
+                list(executor.map(run_slot, range(self.n_slots)))
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                results = list(executor.map(lambda doc: self.get_choice_logprob(problem, doc), documents))
+        for res in results:
             prob = self.get_prob(res, problem["choices"])
             scores.append(prob[correct_idx])
             print("Correct Probability:", prob[correct_idx])
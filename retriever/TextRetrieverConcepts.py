@@ -9,6 +9,7 @@ import torch
 from utils import get_device
 from domain_information import PROBLEMS, TEXT_PATH, DOMAIN, INDEX_NAME
 from TextRetriever import TextRetriever
+from llm_telemetry import call_site
 
 class Concepts(BaseModel):
     concepts: List[str] = Field(description="List of concepts required to solve the problem.")
@@ -59,7 +60,8 @@ class TextRetrieverConcepts(TextRetriever):
             "content": user_content
         }]
 
-        concepts = self.model.invoke(msgs).concepts
+        with call_site("retrieval"):
+            concepts = self.caller.invoke(self.model, msgs).concepts
         pages = set()
         for concept in concepts:
             if self.p.singular_noun(concept):
@@ -16,8 +16,14 @@ class TextRetrieverMultimodal(TextRetriever):
         user_content = []
         for img_path in problem["images"]:
             user_content.append(self.image_content(img_path))
-        user_content.append(self.image_content(document))
-        user_content.append({"type": "text", "text": problem["problem"]})
+        if self.n_slots:
+            # Pinned to slots, the page comes last so that every page shares the prompt prefix
+            # of the problem (see benchmarks/bench_slots.py for the effect on the ranking)
+            user_content.append({"type": "text", "text": problem["problem"]})
+            user_content.append(self.image_content(document))
+        else:
+            user_content.append(self.image_content(document))
+            user_content.append({"type": "text", "text": problem["problem"]})
         return user_content
     
     def retrieve(self, problem: dict, k=5) -> List[int]:
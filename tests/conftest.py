@@ -0,0 +1,26 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The grading systems and retrievers import each other by module name
+for path in (ROOT, os.path.join(ROOT, "grading_system"), os.path.join(ROOT, "retriever")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import pytest
+
+# Misspellings in the test texts, every other word of the texts is in the dictionary of the spell fixture
+MISSPELLINGS = {"carrys", "suports", "suport"}
+DICTIONARY = (
+    "a truss is structure made of members the carry axial forces beam load it bends under moment "
+    "loads joints are pinned does deflect we computes compute reactions at supports support short frame "
+    "resists lateral and columns gravity diagrams shows show bending shear force changes sign carries "
+    "carry carry carry supports supports diagram"
+).split()
+
+@pytest.fixture
+def spell():
+    from spellchecker import SpellChecker
+    spell = SpellChecker(language=None)
+    spell.word_frequency.load_words(DICTIONARY)
+    return spell
@@ -0,0 +1,76 @@
+import sqlite3
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from embedding_utils import CachedEmbeddings
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self, dim: int = 16):
+        self.dim = dim
+        self.embedded: List[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [[float(len(text) + i) for i in range(self.dim)] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+def disk_sizes(cache: CachedEmbeddings):
+    counter = cache._conn.execute("SELECT size FROM embeddings_size").fetchone()[0]
+    total = cache._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+    return counter, total
+
+def test_texts_are_embedded_once_across_tiers(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    model = CountingEmbeddings()
+    cache = CachedEmbeddings(model, "model", cache_path=path, memory_size=2)
+    first = cache.embed_documents(["truss", "beam", "truss"])
+    assert model.embedded == ["truss", "beam"]
+    assert cache.embed_documents(["beam"]) == [first[1]]
+    assert cache.stats()['memory_hits'] == 1
+
+    # The memory tier keeps the 2 most recent texts, the others are read from disk
+    cache.embed_documents(["load", "joint"])
+    assert cache.stats()['memory_evictions'] == 2
+    restarted = CachedEmbeddings(model, "model", cache_path=path)
+    assert restarted.embed_documents(["truss", "beam"]) == first[:2]
+    assert model.embedded == ["truss", "beam", "load", "joint"]
+    assert restarted.stats()['disk_hits'] == 2
+    # Models do not share embeddings
+    CachedEmbeddings(model, "other-model", cache_path=path).embed_documents(["truss"])
+    assert model.embedded[-1] == "truss"
+
+def test_size_counter_follows_evictions_and_reopening(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    model = CountingEmbeddings(dim=16)
+    cache = CachedEmbeddings(model, "model", cache_path=path, memory_size=1, max_disk_bytes=1000)
+    for i in range(40):
+        cache.embed_documents([f"word{i}"])
+        counter, total = disk_sizes(cache)
+        assert counter == total <= 1000
+    assert cache.stats()['disk_evictions'] > 0
+    assert cache.stats()['disk_bytes'] == disk_sizes(cache)[0]
+
+    # A text stored again with another size, e.g., by another process
+    text = cache._conn.execute("SELECT text FROM embeddings LIMIT 1").fetchone()[0]
+    cache._disk_store({text: np.zeros(4, dtype=np.float32)})
+    counter, total = disk_sizes(cache)
+    assert counter == total
+
+    cache._conn.close()
+    reopened = CachedEmbeddings(model, "model", cache_path=path, max_disk_bytes=1000)
+    assert disk_sizes(reopened) == (counter, total)
+
+def test_size_counter_is_seeded_from_an_existing_file(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    # A file written before the counter existed
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE embeddings (model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, "
+                     "size INTEGER NOT NULL, last_access REAL NOT NULL, PRIMARY KEY (model, text))")
+        conn.execute("INSERT INTO embeddings VALUES ('model', 'truss', ?, 69, 0)", (np.ones(16, np.float32).tobytes(),))
+    cache = CachedEmbeddings(CountingEmbeddings(), "model", cache_path=path)
+    assert disk_sizes(cache) == (69, 69)
+    cache.embed_documents(["beam"])
+    counter, total = disk_sizes(cache)
+    assert counter == total == 69 + 64 + len("beam")
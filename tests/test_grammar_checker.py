@@ -0,0 +1,147 @@
+import pytest
+import spacy
+from spacy.language import Language
+from GrammarChecker import GrammarChecker
+from SpellingSuggester import SpellingSuggester
+
+TEXTS = [
+    "A truss is a structure made of members. The members carry axial forces.",
+    "the beam carrys a load\nIt bends under the moment",
+    "Loads. The joints are pinned! Does the truss deflect? we computes the reactions at the suports",
+    "Short",
+    " ".join(["The frame resists lateral loads and the columns carry the gravity loads."] * 3) +
+    " moment diagrams shows the bending. The shear force changes sign at the suport",
+]
+VERBS = {"carry", "carrys", "bends", "deflect", "computes", "resists", "shows", "changes", "made", "pinned"}
+SUBJECTS = {"truss", "members", "beam", "it", "joints", "we", "frame", "columns", "diagrams", "force"}
+
+@Language.component("stub_tagger")
+def stub_tagger(doc):
+    # Deterministic tags in place of a trained model
+    for token in doc:
+        if token.lower_ in VERBS:
+            token.pos_ = "VERB"
+        if token.lower_ in SUBJECTS:
+            token.dep_ = "nsubj"
+    return doc
+
+@pytest.fixture(scope="module")
+def nlp():
+    try:
+        return spacy.load("en_core_web_sm", disable=["ner"])
+    except OSError:
+        nlp = spacy.blank("en")
+        nlp.add_pipe("sentencizer")
+        nlp.add_pipe("stub_tagger")
+        return nlp
+
+def baseline_check_grammar(nlp, spell, text: str):
+    """
+    check_grammar before the single-parse GrammarChecker, without the unused TextBlob pass.
+    """
+    doc = nlp(text)
+    words = [token.text.lower() for token in doc if not token.is_punct and not token.is_space]
+    word_count = len(words)
+    sentences = list(doc.sents)
+    sentence_count = len(sentences)
+    if sentence_count == 0 or word_count == 0:
+        return 0, {"errors": [], "feedback": "No valid text found"}
+    misspelled = list(spell.unknown(words))
+    spelling_errors = len(misspelled)
+    error_categories = {'spelling': spelling_errors, 'grammar': 0, 'punctuation': 0}
+    grammar_issues = []
+    correct_sentences = 0
+    for sent in sentences:
+        sent_text = str(sent).strip()
+        sent_doc = nlp(sent_text)
+        sentence_errors = 0
+        has_subject = False
+        has_verb = False
+        has_proper_case = sent_text[0].isupper() if sent_text else False
+        has_end_punct = sent_text[-1] in '.!?' if sent_text else False
+        for token in sent_doc:
+            if token.dep_ in ['nsubj', 'nsubjpass']:
+                has_subject = True
+            if token.pos_ == 'VERB':
+                has_verb = True
+        if not (has_subject and has_verb):
+            error_categories['grammar'] += 1
+            sentence_errors += 1
+            grammar_issues.append({
+                'error_type': 'Sentence Structure',
+                'message': f'Missing subject or verb in: "{sent_text}"',
+                'suggestion': 'Ensure sentence has both subject and verb'
+            })
+        if not has_proper_case:
+            error_categories['grammar'] += 1
+            sentence_errors += 1
+            grammar_issues.append({
+                'error_type': 'Capitalization',
+                'message': f'Sentence should start with capital letter: "{sent_text}"',
+                'suggestion': f'Change to: "{sent_text[0].upper() + sent_text[1:]}"'
+            })
+        if not has_end_punct:
+            error_categories['punctuation'] += 1
+            sentence_errors += 1
+            grammar_issues.append({
+                'error_type': 'Missing Punctuation',
+                'message': f'Sentence missing end punctuation: "{sent_text}"',
+                'suggestion': 'Add appropriate end punctuation (. ! ?)'
+            })
+        if sentence_errors == 0:
+            correct_sentences += 1
+    for word in misspelled:
+        grammar_issues.append({
+            'error_type': 'Spelling',
+            'message': f'Misspelled word: "{word}"',
+            'suggestion': f'Suggestions: {", ".join(spell.candidates(word))}'
+        })
+    if word_count <= 20:
+        base_spelling_score = max(0.4, 1 - (spelling_errors / word_count * 2))
+        base_grammar_score = max(0.4, correct_sentences / sentence_count)
+        base_punct_score = max(0.4, 1 - (error_categories['punctuation'] / sentence_count))
+    else:
+        base_spelling_score = max(0, 1 - (spelling_errors / word_count * 2))
+        base_grammar_score = max(0, 1 - (error_categories['grammar'] / sentence_count))
+        base_punct_score = max(0, 1 - (error_categories['punctuation'] / sentence_count))
+    final_score = base_spelling_score * 0.3 + base_grammar_score * 0.5 + base_punct_score * 0.2
+    if correct_sentences > 0:
+        final_score = max(0.4, final_score)
+    feedback = {
+        'errors': grammar_issues,
+        'statistics': {
+            'word_count': word_count,
+            'sentence_count': sentence_count,
+            'correct_sentences': correct_sentences,
+            'words_per_sentence': round(word_count/sentence_count if sentence_count else 0, 1),
+            'total_errors': len(grammar_issues),
+            'error_categories': error_categories
+        },
+        'component_scores': {
+            'spelling': round(base_spelling_score, 2),
+            'grammar': round(base_grammar_score, 2),
+            'punctuation': round(base_punct_score, 2)
+        }
+    }
+    return round(final_score, 2), feedback
+
+def comparable(errors):
+    # Spelling issues come in set order, with the suggestions in set order in the baseline
+    rows = []
+    for error in errors:
+        suggestion = error['suggestion']
+        if error['error_type'] == 'Spelling':
+            suggestion = sorted(suggestion.removeprefix('Suggestions: ').split(', '))
+        rows.append((error['error_type'], error['message'], suggestion))
+    sentences = [row for row in rows if row[0] != 'Spelling']
+    return sentences, sorted(row for row in rows if row[0] == 'Spelling')
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_scores_and_issues_match_the_baseline(nlp, spell, tmp_path, text):
+    checker = GrammarChecker(spell, SpellingSuggester(spell, index_path=str(tmp_path / "symspell.pkl"), build=True))
+    score, feedback = checker.check(nlp(text))
+    baseline_score, baseline_feedback = baseline_check_grammar(nlp, spell, text)
+    assert score == baseline_score
+    assert feedback['statistics'] == baseline_feedback['statistics']
+    assert feedback['component_scores'] == baseline_feedback['component_scores']
+    assert comparable(feedback['errors']) == comparable(baseline_feedback['errors'])
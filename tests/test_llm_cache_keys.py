@@ -0,0 +1,31 @@
+from ChatLlamaCppServer import ChatLlamaCppServer
+from llm_utils import get_model
+
+def test_llamacpp_configs_have_different_cache_keys():
+    base = ChatLlamaCppServer(model="qwen2.5-vl", max_tokens=7)
+    variants = [
+        ChatLlamaCppServer(model="qwen2.5-vl", max_tokens=500),
+        ChatLlamaCppServer(model="qwen2.5-vl", max_tokens=7, temperature=0.9),
+        ChatLlamaCppServer(model="qwen2.5-vl", max_tokens=7, server_url="http://127.0.0.1:8081/v1/chat/completions"),
+        ChatLlamaCppServer(model="qwen2.5-vl", max_tokens=7, logprobs=True, top_logprobs=15),
+    ]
+    keys = {base._get_llm_string()} | {variant._get_llm_string() for variant in variants}
+    assert len(keys) == len(variants) + 1
+    assert ChatLlamaCppServer(model="qwen2.5-vl", max_tokens=7)._get_llm_string() == base._get_llm_string()
+
+def test_sampled_o_series_models_are_not_cached(monkeypatch, tmp_path):
+    # The response cache and the telemetry log are created in the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    assert get_model("o4-mini", temperature=0.0).cache is None
+    assert get_model("gpt-4.1-nano", temperature=0.0).cache is not None
+
+def test_llamacpp_models_get_the_generation_parameters(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    llm = get_model("qwen2.5-vl", max_tokens=1, temperature=0, max_retries=1)
+    payload = llm._payload([])
+    assert (payload["max_tokens"], payload["temperature"], llm.max_retries) == (1, 0, 1)
+
+def test_slot_is_not_part_of_the_cache_key():
+    llm = ChatLlamaCppServer(model="qwen2.5-vl", max_tokens=1)
+    assert llm._get_llm_string(id_slot=0) == llm._get_llm_string(id_slot=3) == llm._get_llm_string()
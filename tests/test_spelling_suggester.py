@@ -0,0 +1,36 @@
+import random
+import string
+import pytest
+from SpellingSuggester import SpellingSuggester
+from conftest import DICTIONARY
+
+def typo(word: str, rng: random.Random) -> str:
+    for _ in range(rng.randint(1, 2)):
+        i = rng.randrange(len(word) + 1)
+        edit = rng.choice(["delete", "insert", "replace", "transpose"])
+        if edit == "delete" and len(word) > 1 and i < len(word):
+            word = word[:i] + word[i + 1:]
+        elif edit == "insert":
+            word = word[:i] + rng.choice(string.ascii_lowercase) + word[i:]
+        elif edit == "replace" and i < len(word):
+            word = word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+        elif edit == "transpose" and i < len(word) - 1:
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word
+
+def test_suggestions_match_the_spellchecker_candidates(spell, tmp_path):
+    speller = SpellingSuggester(spell, index_path=str(tmp_path / "symspell.pkl"), build=True)
+    rng = random.Random(0)
+    words = [typo(rng.choice(DICTIONARY), rng) for _ in range(150)] + ["carrys", "suports", "shwao", "xyzzy", "truss"]
+    for word in words:
+        assert set(speller.suggest(word)) == (spell.candidates(word) or {word}), word
+
+def test_the_index_is_built_offline(spell, tmp_path):
+    index_path = str(tmp_path / "symspell.pkl")
+    with pytest.raises(FileNotFoundError, match="build_spelling.py"):
+        SpellingSuggester(spell, index_path=index_path)
+    SpellingSuggester(spell, index_path=index_path, build=True)
+    assert SpellingSuggester(spell, index_path=index_path).suggest("carrys") == ("carry",)
+    spell.word_frequency.load_words(["gusset"])
+    with pytest.raises(ValueError, match="build_spelling.py"):
+        SpellingSuggester(spell, index_path=index_path)
@@ -0,0 +1,30 @@
+import random
+import pytest
+from chatbot import strip_think
+
+ANSWER = "A truss is made of triangles."
+
+def random_chunks(text: str, rng: random.Random):
+    chunks, start = [], 0
+    while start < len(text):
+        end = start + rng.randint(1, 9)
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+@pytest.mark.parametrize("reply, max_hold", [
+    (f"<think>The student asks about trusses.\nLet me check.</think>\n\n{ANSWER}", None),
+    (f"<think>The student asks about trusses.\nLet me check.</think>\n\n{ANSWER}", 5),
+    # The chat template opened the block, so the reply only closes it
+    (f"The student asks about trusses.\nLet me check.</think>\n\n{ANSWER}", None),
+    (f"\n{ANSWER}", None),
+    (f"\n{ANSWER}", 5),
+])
+def test_reasoning_is_removed_in_any_chunking(reply, max_hold):
+    rng = random.Random(0)
+    for _ in range(100):
+        assert "".join(strip_think(random_chunks(reply, rng), max_hold)) == ANSWER
+
+def test_text_without_tags_is_released_after_max_hold():
+    chunks = ["A truss ", "is made ", "of triangles."]
+    assert next(strip_think(iter(chunks), max_hold=10)) == "A truss is made "
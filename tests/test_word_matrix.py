@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from WordMatrix import WordMatrix, similarity_matrix
+
+VOCABULARY = ["truss", "trusses", "member", "members", "load", "loads", "joint", "beam", "moment", "shear"]
+LEMMAS = {"trusses": "truss", "members": "member", "loads": "load"}
+
+def loop_similarity(words1, words2, vectors) -> float:
+    """
+    Word-level similarity one word at a time: the best match in words2 of every word of words1.
+    """
+    if not words1 or not words2:
+        return 0.0
+    best = []
+    for text1, lemma1 in words1:
+        best.append(max(1.0 if text1 == text2 or lemma1 == lemma2 else float(vectors[text1] @ vectors[text2])
+                        for text2, lemma2 in words2))
+    return float(np.mean(best))
+
+def random_words(rng: np.random.Generator, n: int):
+    texts = rng.choice(VOCABULARY, size=n)
+    return [(str(text), LEMMAS.get(str(text), str(text))) for text in texts]
+
+@pytest.mark.parametrize("seed", range(5))
+def test_similarity_matrix_matches_the_loop(seed):
+    rng = np.random.default_rng(seed)
+    vectors = {word: vector / np.linalg.norm(vector) for word, vector in
+               zip(VOCABULARY, rng.normal(size=(len(VOCABULARY), 8)).astype(np.float32))}
+    embed = lambda texts: np.stack([vectors[text] for text in texts])
+    # Empty and single-word texts on both sides
+    sizes1 = [0, 1, 1, 5, 12]
+    sizes2 = [1, 0, 3, 1, 7, 0, 20]
+    words1 = [random_words(rng, n) for n in rng.permutation(sizes1)]
+    words2 = [random_words(rng, n) for n in rng.permutation(sizes2)]
+
+    result = similarity_matrix([WordMatrix.from_words(w, embed) for w in words1],
+                               [WordMatrix.from_words(w, embed) for w in words2])
+    expected = np.array([[loop_similarity(w1, w2, vectors) for w2 in words2] for w1 in words1])
+    assert result.shape == (len(sizes1), len(sizes2))
+    np.testing.assert_allclose(result, expected, atol=1e-6)
+
+def test_similarity_without_words():
+    embed = lambda texts: np.ones((len(texts), 4))
+    empty = WordMatrix.from_words([], embed)
+    single = WordMatrix.from_words([("load", "load")], embed)
+    assert similarity_matrix([], [single]).shape == (0, 1)
+    assert similarity_matrix([single], [empty, empty]).tolist() == [[0.0, 0.0]]
+    assert empty.similarity(single) == 0.0
+    assert single.similarity(single) == 1.0
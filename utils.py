@@ -1,8 +1,8 @@
 from typing import List
 import jsonlines
-import torch
 
 def get_device():
+    import torch
     if torch.cuda.is_available():
         return "cuda"
     if torch.backends.mps.is_available():